@@ -0,0 +1,39 @@
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from backend.setup.Gateway import DEFAULT_BASE_URL, get_gateway
+
+
+## Chroma embedding functions
+# Kept out of KnowledgeBase.py, whose import must not pull in chromadb (over a second):
+# `from backend.Agents.KnowledgeBase import OllamaEmbeddingFunction` still works and loads
+# this module then.
+
+
+class OllamaEmbeddingFunction(EmbeddingFunction):
+    """
+    Embeds with an Ollama model through the LLM gateway.
+
+    Concurrent searches each embed a handful of questions; the gateway sends those
+    arriving together as one batch, so the embedding model runs once for all of them.
+    """
+
+    def __init__(self, model: str = "nomic-embed-text:latest", base_url: str = DEFAULT_BASE_URL):
+        self.model = model
+        self.base_url = base_url
+
+    def __call__(self, input: Documents) -> Embeddings:
+        response = get_gateway(self.base_url).client().embeddings.create(
+            model=self.model, input=list(input), encoding_format="float"
+        )
+        return [item.embedding for item in response.data]
+
+    @staticmethod
+    def name() -> str:
+        return "ollama-gateway"
+
+    def get_config(self) -> dict:
+        return {"model": self.model, "base_url": self.base_url}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "OllamaEmbeddingFunction":
+        return OllamaEmbeddingFunction(**config)
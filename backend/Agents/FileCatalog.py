@@ -0,0 +1,632 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Literal, Optional, Tuple
+
+from atomic_agents.lib.base.base_tool import BaseIOSchema, BaseTool
+from pydantic import Field
+
+from backend.setup.ToolRegistry import ToolSpec, register_tool
+from backend.setup.Tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+## Indexed catalog of a local source tree, so agents can find code without walking the disk
+# Paths, sizes and types, the symbols defined in each file and its text (in an FTS5 trigram
+# index, which answers substring queries) are kept in SQLite. Glob, grep and symbol queries
+# run against the index, and `sync` only re-reads files whose mtime or size changed.
+# A background thread keeps the catalog fresh, on filesystem notifications when `watchdog`
+# is installed and by polling otherwise, so queries never walk the tree themselves.
+
+IGNORED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".mypy_cache",
+    ".pytest_cache", ".next", "dist", "build", ".cache", "chroma_db",
+}
+
+LANGUAGES = {
+    ".py": "python", ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript", ".go": "go", ".rs": "rust", ".java": "java",
+    ".kt": "kotlin", ".c": "c", ".h": "c", ".cpp": "cpp", ".hpp": "cpp", ".cs": "csharp",
+    ".rb": "ruby", ".md": "markdown", ".json": "json", ".yaml": "yaml", ".yml": "yaml",
+    ".toml": "toml", ".sh": "shell", ".sql": "sql", ".html": "html", ".css": "css", ".txt": "text",
+}
+
+# (kind, pattern) per language, matched line by line; the first group is the symbol name
+SYMBOL_PATTERNS: Dict[str, List[Tuple[str, "re.Pattern"]]] = {
+    "python": [
+        ("class", re.compile(r"^\s*class\s+(\w+)")),
+        ("function", re.compile(r"^\s*(?:async\s+)?def\s+(\w+)")),
+        ("variable", re.compile(r"^([A-Za-z_]\w*)\s*(?::[^=]+)?=(?!=)")),
+    ],
+    "javascript": [
+        ("class", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?class\s+(\w+)")),
+        ("function", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(\w+)")),
+        ("variable", re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+(\w+)\s*=")),
+    ],
+    "go": [
+        ("function", re.compile(r"^func\s+(?:\([^)]*\)\s*)?(\w+)")),
+        ("type", re.compile(r"^type\s+(\w+)")),
+    ],
+    "rust": [
+        ("function", re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?fn\s+(\w+)")),
+        ("type", re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|type)\s+(\w+)")),
+    ],
+    "java": [
+        ("class", re.compile(r"^\s*(?:(?:public|private|protected|abstract|final|static)\s+)*(?:class|interface|enum|record)\s+(\w+)")),
+    ],
+    "markdown": [("heading", re.compile(r"^#{1,6}\s+(.+?)\s*#*$"))],
+}
+SYMBOL_PATTERNS["typescript"] = SYMBOL_PATTERNS["javascript"] + [
+    ("type", re.compile(r"^\s*(?:export\s+)?(?:interface|type|enum)\s+(\w+)")),
+]
+SYMBOL_PATTERNS["kotlin"] = SYMBOL_PATTERNS["java"] + [("function", re.compile(r"^\s*(?:\w+\s+)*fun\s+(\w+)"))]
+SYMBOL_PATTERNS["csharp"] = SYMBOL_PATTERNS["java"]
+
+_REGEX_SPECIAL = set(".^$*+?{}[]()|\\")
+
+SYNC_BATCH = 128  # Changed files written per transaction, queries run between them
+
+
+def language(path: str) -> str:
+    return LANGUAGES.get(os.path.splitext(path)[1].lower(), "other")
+
+
+def extract_symbols(text: str, kind: str) -> List[Tuple[str, str, int, str]]:
+    """(name, kind, line, signature) of the definitions found in a file's text."""
+    patterns = SYMBOL_PATTERNS.get(kind)
+    if not patterns:
+        return []
+    symbols = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        for symbol_kind, pattern in patterns:
+            match = pattern.match(line)
+            if match:
+                symbols.append((match.group(1), symbol_kind, number, line.strip()[:200]))
+                break
+    return symbols
+
+
+def glob_regex(pattern: str) -> "re.Pattern":
+    """
+    Compile a glob over relative paths: `*` and `?` stay within a directory, `**` spans any.
+
+    A pattern without `/` matches file names anywhere in the tree, like `*.py`.
+    """
+    if "/" not in pattern:
+        pattern = "**/" + pattern
+    regex, i = "", 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex, i = regex + "(?:.*/)?", i + 3
+            continue
+        if pattern.startswith("**", i):
+            regex, i = regex + ".*", i + 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                body = pattern[i + 1 : end].replace("\\", "\\\\")
+                regex += "[^" + body[1:] + "]" if body.startswith("!") else "[" + body + "]"
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return re.compile(regex + r"\Z")
+
+
+def glob_prefix(pattern: str) -> str:
+    """The directory part of a glob before its first wildcard, to narrow the scanned paths."""
+    if "/" not in pattern:
+        return ""
+    literal = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+    return literal[: literal.rfind("/") + 1]
+
+
+def required_literals(pattern: str, min_length: int = 3) -> List[str]:
+    """
+    Literal substrings every match of a regex must contain, for the trigram prefilter.
+
+    Conservative: patterns with alternation or groups give no literals, so they scan
+    every indexed file.
+    """
+    runs, current, i = [], "", 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if escaped.isalnum():  # \w, \d, \b... are classes or anchors, not literals
+                runs.append(current)
+                current = ""
+            else:
+                current += escaped
+            i += 2
+            continue
+        if char in "(|":
+            return []
+        if char in "*?{":
+            current = current[:-1]  # The quantified character is optional
+            runs.append(current)
+            current = ""
+            if char == "{":
+                i = pattern.find("}", i) if "}" in pattern[i:] else len(pattern)
+        elif char == "[":
+            runs.append(current)
+            current = ""
+            end = pattern.find("]", i + 2)
+            i = end if end != -1 else len(pattern)
+        elif char in _REGEX_SPECIAL:
+            runs.append(current)
+            current = ""
+        else:
+            current += char
+        i += 1
+    runs.append(current)
+    return [run for run in runs if len(run) >= min_length]
+
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+class FileCatalogInputSchema(BaseIOSchema):
+    """Schema for local file catalog queries."""
+
+    query_type: Literal["glob", "grep", "symbol"] = Field(
+        ...,
+        description="glob: find files by path pattern, grep: find lines matching a regular expression, symbol: find where a class, function, type or variable is defined",
+    )
+    pattern: str = Field(
+        ...,
+        description="Path glob ('**/*.py', 'backend/*/Orchestrator.py'), regular expression, or symbol name (wildcards * and ? allowed)",
+    )
+    path_glob: Optional[str] = Field(
+        None, description="Only search files whose path matches this glob (grep and symbol)"
+    )
+    max_results: int = Field(20, description="Maximum number of matches to return")
+
+
+class FileMatch(BaseIOSchema):
+    """A file, line or symbol definition found in the catalog."""
+
+    path: str = Field(..., description="Path relative to the catalog root")
+    line: Optional[int] = Field(None, description="Line number, for grep and symbol matches")
+    kind: str = Field(..., description="Symbol kind for symbol matches, otherwise the file's language")
+    text: str = Field("", description="Matching line or definition")
+    size: Optional[int] = Field(None, description="File size in bytes, for glob matches")
+
+
+class FileCatalogOutputSchema(BaseIOSchema):
+    """Schema for local file catalog query results."""
+
+    root: str = Field(..., description="Directory the paths are relative to")
+    matches: List[FileMatch] = Field(default_factory=list, description="Matches, at most max_results")
+    truncated: bool = Field(False, description="Whether more matches exist than were returned")
+
+
+@dataclass
+class CatalogSyncReport:
+    """Outcome of an incremental catalog sync."""
+
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+
+class FileCatalog(BaseTool):
+    """
+    A tool to find files, text and definitions in a local source tree.
+
+    Example:
+        catalog = FileCatalog(root="./backend")
+        catalog.sync()
+        catalog.run(FileCatalogInputSchema(query_type="symbol", pattern="Orchestrator"))
+    """
+
+    input_schema = FileCatalogInputSchema
+    output_schema = FileCatalogOutputSchema
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        path: str = "./.cache/file_catalog.sqlite3",
+        max_file_bytes: int = 1 << 20,
+        ignored_dirs: Optional[set] = None,
+        refresh_interval: Optional[float] = None,
+        watch_interval: Optional[float] = 60.0,
+    ):
+        """
+        Args:
+            root (Optional[str]): Directory to catalog, MOA_CATALOG_ROOT or the working directory by default
+            path (str): SQLite file holding the catalog
+            max_file_bytes (int): Larger files are cataloged by path only
+            ignored_dirs (Optional[set]): Directory names never entered, IGNORED_DIRS by default
+            refresh_interval (Optional[float]): Seconds after which a query first re-syncs the catalog, None to leave it to the watcher
+            watch_interval (Optional[float]): Seconds between background re-syncs, started by `warmup` or the first query. With `watchdog` installed the catalog re-syncs on changes instead. None to only sync explicitly
+        """
+        self.root = os.path.abspath(root or os.environ.get("MOA_CATALOG_ROOT", "."))
+        self.max_file_bytes = max_file_bytes
+        self.ignored_dirs = IGNORED_DIRS if ignored_dirs is None else ignored_dirs
+        self.refresh_interval = refresh_interval
+        self.watch_interval = watch_interval
+        self._synced_at: Optional[float] = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()  # One sync at a time, queries only wait for its writes
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # One catalog file may hold several roots; file ids are shared by the three tables
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                root TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                kind TEXT NOT NULL,
+                UNIQUE (root, path)
+            );
+            CREATE TABLE IF NOT EXISTS symbols (
+                file_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                signature TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+            CREATE INDEX IF NOT EXISTS symbols_name_nocase ON symbols (name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS contents USING fts5(text, tokenize = 'trigram');
+            CREATE TABLE IF NOT EXISTS generations (root TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """
+        )
+        self._conn.commit()
+
+    def cache_config(self) -> Dict:
+        """Config values that change the results, used in result cache keys."""
+        return {"root": self.root, "generation": self.generation()}
+
+    def generation(self) -> int:
+        """How many times a sync changed the catalog of the root, across processes and restarts."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM generations WHERE root = ?", (self.root,)).fetchone()
+        return row[0] if row else 0
+
+    def warmup(self) -> None:
+        """Catalog the tree before the first query and start keeping it fresh."""
+        self.sync()
+        self.watch()
+
+    def watch(self) -> None:
+        """Start the background thread that re-syncs the catalog, unless `watch_interval` is None."""
+        if self.watch_interval is None or self._watcher is not None:
+            return
+        with self._lock:
+            if self._watcher is None and not self._stop.is_set():
+                self._watcher = threading.Thread(target=self._watch, name="file-catalog-watch", daemon=True)
+                self._watcher.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        with self._lock:
+            self._conn.close()
+
+    def _watch(self) -> None:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            while not self._stop.wait(self.watch_interval):
+                self._background_sync()
+            return
+
+        changed = threading.Event()
+        root, ignored_dirs = self.root, self.ignored_dirs
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type not in ("created", "modified", "deleted", "moved"):
+                    return  # Syncs open and close the files they read
+                # The catalog's own SQLite file usually lives in an ignored directory of the root
+                parts = os.path.relpath(os.fsdecode(event.src_path), root).split(os.sep)
+                if not ignored_dirs.intersection(parts):
+                    changed.set()
+
+        observer = Observer()
+        observer.schedule(_Handler(), self.root, recursive=True)
+        try:
+            observer.start()
+        except OSError as e:  # e.g. out of inotify watches on a large tree
+            logger.warning("Watching %s failed, polling it instead: %s", self.root, e)
+            while not self._stop.wait(self.watch_interval):
+                self._background_sync()
+            return
+        try:
+            self._background_sync()  # Changes made before the observer started
+            while not self._stop.is_set():
+                # Debounce bursts of events, e.g. a git checkout
+                if changed.wait(self.watch_interval) and not self._stop.wait(1.0):
+                    changed.clear()
+                    self._background_sync()
+        finally:
+            observer.stop()
+            observer.join()
+
+    def _background_sync(self) -> None:
+        try:
+            self.sync()
+        except Exception as e:
+            logger.warning("Background sync of the file catalog failed: %s", e)
+
+    def _walk(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """Yield (relative path, stat) of every file under the root, skipping ignored directories."""
+        stack = [self.root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in self.ignored_dirs:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            relative = os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+                            yield relative, entry.stat()
+            except OSError as e:
+                logger.debug("Skipping unreadable directory: %s", e)
+
+    def _read_text(self, relative: str, size: int) -> Optional[str]:
+        """A file's text, or None for binary and oversized files."""
+        if size > self.max_file_bytes:
+            return None
+        with open(os.path.join(self.root, relative), "rb") as f:
+            data = f.read()
+        if b"\0" in data[:8192]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def _parse(self, relative: str, stats: os.stat_result) -> Tuple[str, Optional[str], List[Tuple[str, str, int, str]]]:
+        """Language, text and symbols of one file. Runs without the catalog lock."""
+        kind = language(relative)
+        text = self._read_text(relative, stats.st_size)
+        return kind, text, extract_symbols(text, kind) if text is not None else []
+
+    def _index(
+        self,
+        file_id: Optional[int],
+        relative: str,
+        stats: os.stat_result,
+        kind: str,
+        text: Optional[str],
+        symbols: List[Tuple[str, str, int, str]],
+    ) -> None:
+        """Insert or replace one file's row, symbols and text. Runs inside a sync transaction."""
+        if file_id is None:
+            file_id = self._conn.execute(
+                "INSERT INTO files (root, path, size, mtime, kind) VALUES (?, ?, ?, ?, ?)",
+                (self.root, relative, stats.st_size, stats.st_mtime, kind),
+            ).lastrowid
+        else:
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime = ? WHERE id = ?", (stats.st_size, stats.st_mtime, file_id)
+            )
+            self._delete_content(file_id)
+        if text is not None:
+            self._conn.execute("INSERT INTO contents (rowid, text) VALUES (?, ?)", (file_id, text))
+            self._conn.executemany(
+                "INSERT INTO symbols (file_id, name, kind, line, signature) VALUES (?, ?, ?, ?, ?)",
+                ((file_id, *symbol) for symbol in symbols),
+            )
+
+    def _delete_content(self, file_id: int) -> None:
+        self._conn.execute("DELETE FROM contents WHERE rowid = ?", (file_id,))
+        self._conn.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+
+    def sync(self) -> CatalogSyncReport:
+        """
+        Bring the catalog up to date with the tree.
+
+        Files whose mtime and size are unchanged cost one stat; changed files are
+        re-read and their symbols and text replaced; deleted files are dropped. The
+        tree is walked and changed files are read without the catalog lock, and their
+        rows written in short transactions of `SYNC_BATCH` files, so queries keep
+        running during a large sync.
+
+        Returns:
+            CatalogSyncReport: Counts of added, updated, removed and unchanged files, and errors
+        """
+        report = CatalogSyncReport()
+        started = time.perf_counter()
+        with span("catalog.sync", root=self.root) as sync_span, self._sync_lock:
+            # Only syncs write the files table, and they hold _sync_lock
+            with self._lock:
+                known = {
+                    path: (file_id, size, mtime)
+                    for file_id, path, size, mtime in self._conn.execute(
+                        "SELECT id, path, size, mtime FROM files WHERE root = ?", (self.root,)
+                    )
+                }
+            seen = set()
+            pending = []
+            for relative, stats in self._walk():
+                seen.add(relative)
+                previous = known.get(relative)
+                if previous and previous[1] == stats.st_size and previous[2] == stats.st_mtime:
+                    report.unchanged += 1
+                    continue
+                try:
+                    parsed = self._parse(relative, stats)
+                except OSError as e:
+                    report.errors.append(f"{relative}: {e}")
+                    continue
+                pending.append((previous[0] if previous else None, relative, stats, *parsed))
+                if previous:
+                    report.updated += 1
+                else:
+                    report.added += 1
+                if len(pending) >= SYNC_BATCH:
+                    self._write(pending)
+                    pending = []
+            removed = [known[relative][0] for relative in known.keys() - seen]
+            if pending or removed:
+                self._write(pending, removed)
+            report.removed = len(removed)
+            self._synced_at = time.monotonic()
+            report.seconds = time.perf_counter() - started
+            sync_span.set(added=report.added, updated=report.updated, removed=report.removed)
+        return report
+
+    def _write(self, rows: List[Tuple], removed: Iterable[int] = ()) -> None:
+        """Apply parsed files and removals in one transaction, bumping the generation."""
+        with self._lock, self._conn:
+            for row in rows:
+                self._index(*row)
+            for file_id in removed:
+                self._delete_content(file_id)
+                self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            # Persisted, so result cache keys of a restarted process don't collide with older ones
+            self._conn.execute(
+                "INSERT INTO generations (root, value) VALUES (?, 1) "
+                "ON CONFLICT (root) DO UPDATE SET value = value + 1",
+                (self.root,),
+            )
+
+    def _refresh(self) -> None:
+        if self._synced_at is None:
+            self.sync()
+            self.watch()
+        elif self.refresh_interval is not None and time.monotonic() - self._synced_at > self.refresh_interval:
+            self.sync()
+
+    def glob(self, pattern: str, max_results: int = 20) -> Tuple[List[FileMatch], bool]:
+        """Files whose relative path matches a glob, sorted by path."""
+        regex = glob_regex(pattern)
+        prefix = glob_prefix(pattern)
+        matches = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, kind FROM files WHERE root = ? AND path >= ? AND path < ? ORDER BY path",
+                (self.root, prefix, prefix + "\U0010ffff"),
+            )
+            for path, size, kind in rows:
+                if regex.match(path):
+                    if len(matches) == max_results:
+                        return matches, True
+                    matches.append(FileMatch(path=path, kind=kind, size=size))
+        return matches, False
+
+    def grep(
+        self, pattern: str, path_glob: Optional[str] = None, max_results: int = 20
+    ) -> Tuple[List[FileMatch], bool]:
+        """
+        Lines matching a regular expression, by path.
+
+        Files are narrowed with the trigram index on the literals the expression
+        requires before their lines are matched.
+        """
+        regex = re.compile(pattern)
+        path_regex = glob_regex(path_glob) if path_glob else None
+        literals = required_literals(pattern)
+        query = "SELECT files.path, files.kind, contents.text FROM contents JOIN files ON files.id = contents.rowid WHERE files.root = ?"
+        params: List = [self.root]
+        if literals:
+            # As a subquery, so the index is searched once instead of once per file
+            query += " AND contents.rowid IN (SELECT rowid FROM contents WHERE contents MATCH ?)"
+            params.append(" AND ".join(_fts_phrase(literal) for literal in literals))
+        matches = []
+        with self._lock:
+            for path, kind, text in self._conn.execute(query + " ORDER BY files.path", params):
+                if path_regex is not None and not path_regex.match(path):
+                    continue
+                for number, line in enumerate(text.splitlines(), start=1):
+                    if regex.search(line):
+                        if len(matches) == max_results:
+                            return matches, True
+                        matches.append(FileMatch(path=path, line=number, kind=kind, text=line.strip()[:200]))
+        return matches, False
+
+    def symbols(
+        self, name: str, path_glob: Optional[str] = None, max_results: int = 20
+    ) -> Tuple[List[FileMatch], bool]:
+        """
+        Definitions of a symbol: exact name first, case-insensitively if there are none.
+
+        `*` and `?` in the name match like in a glob.
+        """
+        path_regex = glob_regex(path_glob) if path_glob else None
+        base = (
+            "SELECT files.path, symbols.line, symbols.kind, symbols.signature FROM symbols"
+            " JOIN files ON files.id = symbols.file_id WHERE files.root = ? AND "
+        )
+        if any(char in name for char in "*?["):
+            conditions = [("symbols.name GLOB ?", name)]
+        else:
+            conditions = [("symbols.name = ?", name), ("symbols.name = ? COLLATE NOCASE", name)]
+        matches = []
+        with self._lock:
+            for condition, value in conditions:
+                rows = self._conn.execute(
+                    base + condition + " ORDER BY files.path, symbols.line", (self.root, value)
+                )
+                for path, line, kind, signature in rows:
+                    if path_regex is not None and not path_regex.match(path):
+                        continue
+                    if len(matches) == max_results:
+                        return matches, True
+                    matches.append(FileMatch(path=path, line=line, kind=kind, text=signature))
+                if matches:
+                    break
+        return matches, False
+
+    def run(self, params: FileCatalogInputSchema) -> FileCatalogOutputSchema:
+        """
+        Answer a glob, grep or symbol query from the catalog.
+
+        Args:
+            params (FileCatalogInputSchema): Query type, pattern and limits
+
+        Returns:
+            FileCatalogOutputSchema: Matches relative to the catalog root
+        """
+        self._refresh()
+        with span("catalog.query", query_type=params.query_type) as query_span:
+            if params.query_type == "glob":
+                matches, truncated = self.glob(params.pattern, params.max_results)
+            elif params.query_type == "grep":
+                try:
+                    matches, truncated = self.grep(params.pattern, params.path_glob, params.max_results)
+                except re.error:
+                    # Models often pass plain text with regex metacharacters
+                    matches, truncated = self.grep(re.escape(params.pattern), params.path_glob, params.max_results)
+            else:
+                matches, truncated = self.symbols(params.pattern, params.path_glob, params.max_results)
+            query_span.set(matches=len(matches), truncated=truncated)
+        return FileCatalogOutputSchema(root=self.root, matches=matches, truncated=truncated)
+
+
+register_tool(
+    ToolSpec(
+        name="FileCatalog",
+        factory=FileCatalog,
+        input_schema=FileCatalogInputSchema,
+        output_schema=FileCatalogOutputSchema,
+    )
+)
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+
+## Manifest of the files indexed in the KnowledgeBase
+# Keeps (mtime, size, content hash) per path so folder syncs only re-embed files
+# that actually changed, and can tell which indexed files were deleted. Also keeps a
+# generation counter, bumped whenever documents change, that result caches key on.
+
+ManifestEntry = Tuple[float, int, str]
+
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """Hash a file's content without loading it in memory at once."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """SQLite-backed map of path -> (mtime, size, hash) for indexed files."""
+
+    def __init__(self, path: str = "./chroma_db/manifest.sqlite3"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                hash TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def entries(self, folder: Optional[str] = None) -> Dict[str, ManifestEntry]:
+        """
+        Load the entries of every file below a folder in one query.
+
+        Args:
+            folder (Optional[str]): Absolute folder path, all entries if None
+
+        Returns:
+            Dict[str, ManifestEntry]: path -> (mtime, size, hash)
+        """
+        with self._lock:
+            if folder is None:
+                rows = self._conn.execute("SELECT path, mtime, size, hash FROM files")
+            else:
+                prefix = folder.rstrip(os.sep) + os.sep
+                rows = self._conn.execute(
+                    "SELECT path, mtime, size, hash FROM files WHERE substr(path, 1, ?) = ?",
+                    (len(prefix), prefix),
+                )
+            return {path: (mtime, size, digest) for path, mtime, size, digest in rows}
+
+    def upsert(self, rows: Iterable[Tuple[str, float, int, str]]) -> None:
+        """Record (path, mtime, size, hash) rows in one transaction."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, mtime, size, hash) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete(self, paths: Iterable[str]) -> None:
+        """Forget files, e.g. after they were removed from the index."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM files WHERE path = ?", ((path,) for path in paths)
+            )
+
+    def generation(self) -> int:
+        """How many times the indexed documents changed, across processes and restarts."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM info WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self) -> int:
+        """Record a change of the indexed documents, returning the new generation."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO info (key, value) VALUES ('generation', 1) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+            )
+            return self._conn.execute("SELECT value FROM info WHERE key = 'generation'").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,330 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+## Streaming ingestion pipeline for the KnowledgeBase
+# files -> text extraction + chunking (process pool) -> batched embedding -> bulk upsert
+# Only `max_in_flight` files and one batch of chunks are held in memory at any time.
+
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".rst", ".csv", ".tsv", ".json", ".yaml", ".yml", ".toml", ".ini",
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".c", ".h", ".cpp", ".go", ".rs",
+    ".sh", ".sql", ".tex", ".xml", ".css",
+}
+HTML_EXTENSIONS = {".html", ".htm"}
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document."""
+
+    SKIP_TAGS = {"script", "style", "noscript", "head", "svg"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth and data.strip():
+            self.parts.append(data.strip())
+
+
+def html_to_text(html: str) -> str:
+    """Strip tags, scripts and styles from an HTML document."""
+    parser = _TextExtractor()
+    parser.feed(html)
+    return "\n".join(parser.parts)
+
+
+def extract_text(file_path: str) -> Optional[str]:
+    """
+    Extract the text content of a file.
+
+    Args:
+        file_path (str): Path to the file
+
+    Returns:
+        Optional[str]: The text, or None for binary files that can't be extracted
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            return None
+        return "\n".join(page.extract_text() or "" for page in PdfReader(file_path).pages)
+    if extension == ".docx":
+        try:
+            import docx
+        except ImportError:
+            return None
+        return "\n".join(paragraph.text for paragraph in docx.Document(file_path).paragraphs)
+
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    if extension not in TEXT_EXTENSIONS | HTML_EXTENSIONS and b"\x00" in raw[:4096]:
+        return None  # Binary file
+    text = raw.decode("utf-8", errors="ignore")
+    if extension in HTML_EXTENSIONS:
+        return html_to_text(text)
+    return text
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """
+    Split text into overlapping chunks, preferring to cut on whitespace.
+
+    Args:
+        text (str): Text to split
+        chunk_size (int): Maximum number of characters per chunk
+        overlap (int): Number of characters shared by consecutive chunks
+
+    Returns:
+        List[str]: The chunks, empty if the text is blank
+    """
+    text = text.strip()
+    if not text:
+        return []
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            cut = text.rfind(" ", start + chunk_size // 2, end)
+            if cut != -1:
+                end = cut
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+def parse_file(
+    file_path: str, chunk_size: int = 1000, overlap: int = 200
+) -> Tuple[str, List[str], Dict, Optional[str]]:
+    """
+    Read, extract and chunk one file. Runs in the worker processes.
+
+    Returns:
+        Tuple[str, List[str], Dict, Optional[str]]: Path, chunks, file metadata and error message if any
+    """
+    try:
+        file_stats = os.stat(file_path)
+        metadata = {
+            "source": file_path,
+            "size": file_stats.st_size,
+            "modified": file_stats.st_mtime,
+            "extension": os.path.splitext(file_path)[1].lower(),
+        }
+        text = extract_text(file_path)
+        if text is None:
+            return file_path, [], metadata, None
+        return file_path, chunk_text(text, chunk_size, overlap), metadata, None
+    except Exception as e:
+        return file_path, [], {}, str(e)
+
+
+@dataclass
+class IngestionReport:
+    """Progress and outcome of an ingestion run."""
+
+    files: int = 0
+    chunks: int = 0
+    skipped: int = 0
+    errors: List[str] = field(default_factory=list)
+    failed: Set[str] = field(default_factory=set)
+
+
+class IngestionPipeline:
+    """
+    Ingests files into a Chroma collection in bulk.
+
+    Parsing runs on a process pool, chunks are embedded and written with one
+    `upsert` per batch, and the previous chunks of re-ingested files are deleted
+    first so shrinking files don't leave stale chunks behind.
+    """
+
+    def __init__(
+        self,
+        collection,
+        batch_size: int = 128,
+        chunk_size: int = 1000,
+        overlap: int = 200,
+        workers: Optional[int] = None,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        lexical_index=None,
+    ):
+        """
+        Args:
+            collection: The Chroma collection to write to
+            batch_size (int): Number of chunks embedded and upserted per call
+            chunk_size (int): Maximum number of characters per chunk
+            overlap (int): Number of characters shared by consecutive chunks
+            workers (Optional[int]): Parsing processes, defaults to the CPU count
+            embedding_function (Optional[Callable]): Embeds a batch of texts, defaults to the collection's own
+            lexical_index (Optional[LexicalIndex]): BM25 index kept in sync with the collection
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.workers = workers or os.cpu_count() or 1
+        self.embedding_function = embedding_function
+        self.lexical_index = lexical_index
+
+    def ingest(
+        self,
+        file_paths: Iterable[str],
+        parallel: bool = True,
+        progress: Optional[Callable[[IngestionReport], None]] = None,
+    ) -> IngestionReport:
+        """
+        Ingest files, streaming them through parsing, embedding and upserting.
+
+        Args:
+            file_paths (Iterable[str]): Files to ingest, can be a lazy generator. Sources are stored as absolute paths
+            parallel (bool): Parse on the process pool, disable for a handful of files
+            progress (Optional[Callable]): Called with the running report after each batch
+
+        Returns:
+            IngestionReport: Counts of ingested files, chunks, skipped binaries and errors
+        """
+        report = IngestionReport()
+        batch = _Batch()
+        handle = lambda parsed: self._add(parsed, batch, report, progress)
+        file_paths = (os.path.abspath(file_path) for file_path in file_paths)
+
+        if parallel and self.workers > 1:
+            max_in_flight = self.workers * 4
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                in_flight: Set[Future] = set()
+                for file_path in file_paths:
+                    in_flight.add(
+                        pool.submit(parse_file, file_path, self.chunk_size, self.overlap)
+                    )
+                    if len(in_flight) >= max_in_flight:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            handle(future.result())
+                for future in in_flight:
+                    handle(future.result())
+        else:
+            for file_path in file_paths:
+                handle(parse_file(file_path, self.chunk_size, self.overlap))
+
+        self._flush(batch, report, progress)
+        return report
+
+    def ingest_texts(
+        self,
+        documents: Iterable[Tuple[str, str, Dict]],
+        progress: Optional[Callable[[IngestionReport], None]] = None,
+    ) -> IngestionReport:
+        """
+        Ingest text that was already extracted, e.g. fetched web pages.
+
+        Args:
+            documents (Iterable[Tuple[str, str, Dict]]): (source, text, metadata) of each document, `source` replaces its previous chunks
+            progress (Optional[Callable]): Called with the running report after each batch
+
+        Returns:
+            IngestionReport: Counts of ingested documents, chunks and errors
+        """
+        report = IngestionReport()
+        batch = _Batch()
+        for source, text, metadata in documents:
+            parsed = (source, chunk_text(text, self.chunk_size, self.overlap), {**metadata, "source": source}, None)
+            self._add(parsed, batch, report, progress)
+        self._flush(batch, report, progress)
+        return report
+
+    def _add(self, parsed, batch: "_Batch", report: IngestionReport, progress) -> None:
+        """Queue one parsed document's chunks, flushing full batches."""
+        file_path, chunks, metadata, error = parsed
+        if error:
+            report.errors.append(f"{file_path}: {error}")
+            report.failed.add(file_path)
+            return
+        report.files += 1
+        batch.stale_sources.add(file_path)
+        if not chunks:
+            report.skipped += 1
+        for index, chunk in enumerate(chunks):
+            batch.add(
+                f"{file_path}::{index}",
+                chunk,
+                {**metadata, "chunk": index, "chunks": len(chunks)},
+            )
+        if len(batch) >= self.batch_size:
+            self._flush(batch, report, progress)
+
+    def _flush(self, batch: "_Batch", report: IngestionReport, progress) -> None:
+        """Replace the previous chunks of the batch's files and upsert its chunks."""
+        if batch.stale_sources:
+            try:
+                self.collection.delete(where={"source": {"$in": sorted(batch.stale_sources)}})
+                if self.lexical_index is not None:
+                    self.lexical_index.delete_sources(batch.stale_sources)
+            except Exception as e:
+                report.errors.append(f"delete failed: {e}")
+        for start in range(0, len(batch), self.batch_size):
+            ids = batch.ids[start : start + self.batch_size]
+            documents = batch.documents[start : start + self.batch_size]
+            metadatas = batch.metadatas[start : start + self.batch_size]
+            try:
+                embeddings = (
+                    self.embedding_function(documents) if self.embedding_function else None
+                )
+                self.collection.upsert(
+                    ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings
+                )
+                if self.lexical_index is not None:
+                    self.lexical_index.upsert(ids, documents, metadatas)
+                report.chunks += len(ids)
+            except Exception as e:
+                report.errors.append(f"upsert of {len(ids)} chunks failed: {e}")
+                report.failed.update(metadata["source"] for metadata in metadatas)
+        batch.clear()
+        if progress:
+            progress(report)
+
+
+class _Batch:
+    """Chunks waiting to be embedded, plus the files whose old chunks must go first."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.stale_sources: Set[str] = set()
+
+    def add(self, chunk_id: str, document: str, metadata: Dict):
+        self.ids.append(chunk_id)
+        self.documents.append(document)
+        self.metadatas.append(metadata)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def print_progress(report: IngestionReport) -> None:
+    """Default progress callback for CLI use."""
+    print(
+        f"Ingested {report.files} files ({report.chunks} chunks, "
+        f"{report.skipped} skipped, {len(report.errors)} errors)"
+    )
@@ -1,15 +1,40 @@
-import chromadb
 from atomic_agents.lib.base.base_tool import BaseTool, BaseIOSchema
 from pydantic import Field
-from chromadb.config import DEFAULT_TENANT, DEFAULT_DATABASE, Settings
-from typing import List, Dict, Tuple, Optional
-from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Dict, Tuple, Optional
+from dataclasses import dataclass, field
+from datetime import datetime
+import functools
+import logging
 import os
+import threading
+import time
 from pathlib import Path
+from backend.Agents.Ingestion import IngestionPipeline, IngestionReport
+from backend.Agents.IndexManifest import IndexManifest, file_hash
+from backend.Agents.LexicalIndex import LexicalIndex
+from backend.Agents.ResultSet import ResultSet
+from backend.Agents.VectorStore import VectorStore, chroma_client, open_store
+from backend.Agents.WebIngestion import URLIndex, URLIngestionReport, WebIngestor
+from backend.setup.ToolRegistry import ToolSpec, register_tool
+from backend.setup.Tracing import span
+
+logger = logging.getLogger(__name__)
 
 
 ## This class only supports semantic and keyword search for now
-# TODO: allow the agent to traverse the local fs to inform codegen
+# Source trees are searched by path, text and symbol with FileCatalog instead
+# Chunks live in a Chroma collection by default, or in an MmapVectorStore with
+# store="mmap" (MOA_VECTOR_STORE=mmap), see VectorStore.py
+
+
+def __getattr__(name: str):
+    # OllamaEmbeddingFunction subclasses a chromadb class, it moved to Embeddings.py so this
+    # module can be imported without chromadb
+    if name == "OllamaEmbeddingFunction":
+        from backend.Agents.Embeddings import OllamaEmbeddingFunction
+
+        return OllamaEmbeddingFunction
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class KnowledgeBaseInputSchema(BaseIOSchema):
     """Schema for knowledge base search input parameters."""
@@ -20,6 +45,13 @@ class KnowledgeBaseInputSchema(BaseIOSchema):
     questions: List[str] = Field(
         ..., description="Questions that will be used to perform semantic search"
     )
+    extensions: List[str] = Field(
+        default_factory=list,
+        description="Only search files with these extensions, e.g. ['.py', '.md']; empty to search everything",
+    )
+    modified_after: Optional[str] = Field(
+        None, description="Only search files modified on or after this ISO 8601 date, e.g. '2024-05-01'"
+    )
 
 
 class SearchResult(BaseIOSchema):
@@ -48,6 +80,34 @@ class KnowledgeBaseOutputSchema(BaseIOSchema):
     )
 
 
+@dataclass
+class SyncReport:
+    """Outcome of an incremental folder sync."""
+
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _walk_files(folder_path: str, recursive: bool) -> Iterator[os.DirEntry]:
+    """Yield file entries with their cached stat, cheaper than Path.glob + is_file."""
+    stack = [folder_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                elif entry.is_file():
+                    yield entry
+
+
 class KnowledgeBase(BaseTool):
     """
     A tool for managing and searching a local knowledge base using ChromaDB.
@@ -57,23 +117,113 @@ class KnowledgeBase(BaseTool):
     input_schema = KnowledgeBaseInputSchema
     output_schema = KnowledgeBaseOutputSchema
 
-    def __init__(self):
-        """Initialize the knowledge base with a persistent ChromaDB client."""
-        self.client = chromadb.PersistentClient(
-            path="./chroma_db",
-            settings=Settings(),
-            tenant=DEFAULT_TENANT,
-            database=DEFAULT_DATABASE,
+    def __init__(
+        self,
+        batch_size: int = 128,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        workers: Optional[int] = None,
+        path: str = "./chroma_db",
+        collection_name: str = "local_files",
+        embedding_function=None,
+        store: Optional[str] = None,
+        store_options: Optional[Dict] = None,
+    ):
+        """
+        Initialize the knowledge base with a persistent vector store, ChromaDB by default.
+
+        Args:
+            batch_size (int): Number of chunks embedded and written per Chroma call
+            chunk_size (int): Maximum number of characters per chunk
+            chunk_overlap (int): Number of characters shared by consecutive chunks
+            workers (Optional[int]): Processes used to parse files, defaults to the CPU count
+            path (str): Directory of the Chroma store and its manifest and lexical index
+            collection_name (str): Chroma collection holding the chunks
+            embedding_function: Chroma embedding function, defaults to Chroma's own, OllamaEmbeddingFunction embeds through the LLM gateway
+            store (Optional[str]): "chroma" or "mmap" (see VectorStore.py), defaults to MOA_VECTOR_STORE or "chroma"
+            store_options (Optional[Dict]): MmapVectorStore options, e.g. {"dtype": "int8"}
+        """
+        self.path = path
+        self.store = store or os.environ.get("MOA_VECTOR_STORE", "chroma")
+        self.embedding_function = embedding_function
+        client = None
+        if self.store == "chroma":
+            client = self.client = chroma_client(path)
+        self.collection: VectorStore = open_store(
+            self.store,
+            path=path,
+            collection_name=collection_name,
+            embedding_function=embedding_function,
+            client=client,
+            **(store_options or {}),
         )
-        self.collection = self.client.get_or_create_collection(
-            name="local_files",
-            metadata={
-                "hnsw:space": "cosine"
-            },  # Using cosine similarity for better semantic search
+        self.lexical_index = LexicalIndex(path=os.path.join(path, "lexical.sqlite3"))
+        self.pipeline = IngestionPipeline(
+            self.collection,
+            batch_size=batch_size,
+            chunk_size=chunk_size,
+            overlap=chunk_overlap,
+            workers=workers,
+            lexical_index=self.lexical_index,
         )
+        self.manifest = IndexManifest(path=os.path.join(path, "manifest.sqlite3"))
+        self.web = WebIngestor(self, index=URLIndex(path=os.path.join(path, "urls.sqlite3")))
+        self._listeners: List[Callable[[List[str], bool], None]] = []
+        self._lexical_checked = False
+        self._lexical_lock = threading.Lock()
+
+    @functools.cached_property
+    def client(self):
+        """Chroma client of the knowledge base directory, opened on first use with an mmap store (SemanticCache keeps its questions in Chroma)."""
+        return chroma_client(self.path)
+
+    def add_listener(self, listener: Callable[[List[str], bool], None]) -> None:
+        """
+        Call `listener(sources, added)` whenever documents change.
+
+        `sources` are the file paths whose chunks were replaced or removed. `added`
+        is True when some of them may be new to the index, so results that didn't
+        cite them can change too.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, sources: List[str], added: bool) -> None:
+        if not sources:
+            return
+        self.manifest.bump_generation()  # Results cached under the previous generation are stale
+        for listener in self._listeners:
+            try:
+                listener(sources, added)
+            except Exception:
+                logger.exception("Knowledge base listener failed")
+
+    def warmup(self) -> None:
+        """Load the embedding model and index pages so the first search isn't a cold one."""
+        self._backfill_lexical_index()
+        if self.collection.count():
+            self.collection.query(query_texts=["warmup"], n_results=1)
+
+    def cache_config(self) -> Dict:
+        """
+        Config values that change the results, used in result cache keys. The generation
+        changes with the documents, so results cached before a change are not served after it.
+        """
+        return {"collection": self.collection.name, "generation": self.manifest.generation()}
+
+    def close(self) -> None:
+        """Stop background URL ingestion and close the manifest, URL and lexical index connections."""
+        self.web.close()
+        self.web.index.close()
+        self.manifest.close()
+        self.lexical_index.close()
+        if hasattr(self.collection, "close"):
+            self.collection.close()
 
     def process_folder(
-        self, folder_path: str, recursive: bool = True
+        self,
+        folder_path: str,
+        recursive: bool = True,
+        progress: Optional[Callable[[IngestionReport], None]] = None,
     ) -> Tuple[bool, List[str]]:
         """
         Process all files in a given folder and add them to the knowledge base.
@@ -81,24 +231,171 @@ class KnowledgeBase(BaseTool):
         Args:
             folder_path (str): Path to the folder to process
             recursive (bool): Whether to process subfolders recursively
+            progress (Optional[Callable]): Called with the running IngestionReport after each batch
 
         Returns:
             Tuple[bool, List[str]]: Success status and list of errors if any
         """
-        folder_path = Path(folder_path)
+        folder_path = Path(folder_path).absolute()
         if not folder_path.exists() or not folder_path.is_dir():
             return False, [f"Invalid folder path: {folder_path}"]
 
-        errors = []
         pattern = "**/*" if recursive else "*"
+        files = [
+            str(file_path) for file_path in folder_path.glob(pattern) if file_path.is_file()
+        ]
+        report = self._ingest_files(files, progress=progress)
+        return len(report.errors) == 0, report.errors
+
+    def _ingest_files(
+        self,
+        file_paths: List[str],
+        progress: Optional[Callable[[IngestionReport], None]] = None,
+        parallel: bool = True,
+    ) -> IngestionReport:
+        """
+        Ingest absolute file paths, record the ingested files in the manifest and notify listeners.
+
+        The manifest rows are taken before ingestion, so a file modified meanwhile is
+        re-embedded by the next `sync_folder` instead of being skipped.
+        """
+        rows = {}
+        for path in file_paths:
+            try:
+                stats = os.stat(path)
+                rows[path] = (path, stats.st_mtime, stats.st_size, file_hash(path))
+            except OSError:
+                continue  # The pipeline reports the error
+        report = self.pipeline.ingest(iter(file_paths), parallel=parallel, progress=progress)
+        ingested = [path for path in file_paths if path not in report.failed]
+        self.manifest.upsert(rows[path] for path in ingested if path in rows)
+        self._notify(ingested, added=True)
+        return report
+
+    def sync_folder(
+        self,
+        folder_path: str,
+        recursive: bool = True,
+        progress: Optional[Callable[[IngestionReport], None]] = None,
+    ) -> SyncReport:
+        """
+        Incrementally sync a folder with the knowledge base.
 
-        for file_path in folder_path.glob(pattern):
-            if file_path.is_file():
-                success, error = self.add_file(str(file_path))
-                if not success:
-                    errors.append(f"{file_path}: {error}")
+        Files whose mtime and size match the manifest are skipped without being
+        read, files whose content hash is unchanged only get their manifest entry
+        refreshed, and only new or modified files are re-chunked and re-embedded.
+        Indexed files that no longer exist are removed.
+
+        Args:
+            folder_path (str): Path to the folder to sync
+            recursive (bool): Whether to sync subfolders recursively
+            progress (Optional[Callable]): Called with the running IngestionReport after each batch
+
+        Returns:
+            SyncReport: Counts of added, updated, removed and unchanged files, and errors
+        """
+        folder_path = os.path.abspath(folder_path)
+        report = SyncReport()
+        if not os.path.isdir(folder_path):
+            report.errors.append(f"Invalid folder path: {folder_path}")
+            return report
+
+        known = self.manifest.entries(folder_path)
+        seen = set()
+        to_ingest = {}
+        new = set()
+        touched = []
+        for entry in _walk_files(folder_path, recursive):
+            seen.add(entry.path)
+            stats = entry.stat()
+            previous = known.get(entry.path)
+            if previous and previous[0] == stats.st_mtime and previous[1] == stats.st_size:
+                report.unchanged += 1
+                continue
+            try:
+                digest = file_hash(entry.path)
+            except OSError as e:
+                report.errors.append(f"{entry.path}: {e}")
+                continue
+            row = (entry.path, stats.st_mtime, stats.st_size, digest)
+            if previous and previous[2] == digest:
+                report.unchanged += 1
+                touched.append(row)  # Only the mtime changed
+            else:
+                to_ingest[entry.path] = row
+                if previous:
+                    report.updated += 1
+                else:
+                    report.added += 1
+                    new.add(entry.path)
+
+        if to_ingest:
+            ingestion = self.pipeline.ingest(iter(to_ingest), progress=progress)
+            report.errors.extend(ingestion.errors)
+            touched.extend(
+                row for path, row in to_ingest.items() if path not in ingestion.failed
+            )
+            self._notify(
+                [path for path in to_ingest if path not in ingestion.failed], added=bool(new)
+            )
+        self.manifest.upsert(touched)
+
+        for path in known.keys() - seen:
+            success, error = self.remove_file(path)
+            if success:
+                report.removed += 1
+            else:
+                report.errors.append(f"{path}: {error}")
+        return report
+
+    def watch_folder(
+        self,
+        folder_path: str,
+        recursive: bool = True,
+        interval: float = 2.0,
+        stop_event: Optional[threading.Event] = None,
+    ) -> None:
+        """
+        Keep the index live by re-syncing a folder whenever it changes. Blocks until `stop_event` is set.
 
-        return len(errors) == 0, errors
+        Uses filesystem notifications (inotify/FSEvents) through `watchdog` when it
+        is installed, and falls back to polling with `sync_folder` every `interval`
+        seconds, which only costs a stat per file.
+
+        Args:
+            folder_path (str): Path to the folder to watch
+            recursive (bool): Whether to watch subfolders recursively
+            interval (float): Seconds between polls, or debounce delay for notifications
+            stop_event (Optional[threading.Event]): Set it to stop watching
+        """
+        stop_event = stop_event or threading.Event()
+        self.sync_folder(folder_path, recursive=recursive)
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            while not stop_event.wait(interval):
+                self.sync_folder(folder_path, recursive=recursive)
+            return
+
+        changed = threading.Event()
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                changed.set()
+
+        observer = Observer()
+        observer.schedule(_Handler(), folder_path, recursive=recursive)
+        observer.start()
+        try:
+            while not stop_event.is_set():
+                if changed.wait(interval) and not stop_event.is_set():
+                    time.sleep(interval)  # Debounce bursts of events, e.g. a git checkout
+                    changed.clear()
+                    self.sync_folder(folder_path, recursive=recursive)
+        finally:
+            observer.stop()
+            observer.join()
 
     def add_url(self, url: str) -> Tuple[bool, Optional[str]]:
         """
@@ -110,29 +407,56 @@ class KnowledgeBase(BaseTool):
         Returns:
             Tuple[bool, Optional[str]]: Success status and error message if any
         """
-        # TODO: Implement URL content fetching and processing
-        pass
+        report = self.add_urls([url])
+        if report.errors:
+            return False, "; ".join(report.errors)
+        return True, None
 
-    def add_files(self, file_paths: List[str]) -> Tuple[bool, List[str]]:
+    def add_urls(self, urls: Iterable[str]) -> URLIngestionReport:
+        """
+        Fetch pages concurrently and add their main text, skipping duplicate and near-duplicate pages.
+
+        Blocks until done; use `aadd_urls` from async code and `ingest_in_background`
+        to return at once.
+
+        Args:
+            urls (Iterable[str]): URLs to fetch and add
+
+        Returns:
+            URLIngestionReport: Fetched, ingested, duplicate and failed pages
+        """
+        return self.web.ingest(urls)
+
+    async def aadd_urls(self, urls: Iterable[str]) -> URLIngestionReport:
+        """Async `add_urls`."""
+        return await self.web.aingest(urls)
+
+    def ingest_in_background(self, urls: Iterable[str]) -> int:
+        """Queue URLs for background ingestion, returning how many were queued."""
+        return self.web.submit(urls)
+
+    def add_files(
+        self,
+        file_paths: Iterable[str],
+        progress: Optional[Callable[[IngestionReport], None]] = None,
+    ) -> Tuple[bool, List[str]]:
         """
         Add multiple files to the knowledge base.
 
         Args:
-            file_paths (List[str]): List of file paths to add
+            file_paths (Iterable[str]): File paths to add
+            progress (Optional[Callable]): Called with the running IngestionReport after each batch
 
         Returns:
             Tuple[bool, List[str]]: Success status and list of errors if any
         """
-        errors = []
-        for file_path in file_paths:
-            success, error = self.add_file(file_path)
-            if not success:
-                errors.append(f"{file_path}: {error}")
-        return len(errors) == 0, errors
+        file_paths = [os.path.abspath(file_path) for file_path in file_paths]
+        report = self._ingest_files(file_paths, progress=progress)
+        return len(report.errors) == 0, report.errors
 
     def add_file(self, file_path: str) -> Tuple[bool, Optional[str]]:
         """
-        Add a single file to the knowledge base.
+        Add a single file to the knowledge base, replacing its previous chunks.
 
         Args:
             file_path (str): Path to the file to add
@@ -140,28 +464,13 @@ class KnowledgeBase(BaseTool):
         Returns:
             Tuple[bool, Optional[str]]: Success status and error message if any
         """
-        try:
-            if not os.path.exists(file_path):
-                return False, f"File not found: {file_path}"
-
-            # Extract file metadata
-            file_stats = os.stat(file_path)
-            metadata = {
-                "source": file_path,
-                "size": file_stats.st_size,
-                "modified": file_stats.st_mtime,
-                "extension": os.path.splitext(file_path)[1].lower(),
-            }
-
-            # TODO: Add file content processing here
-            self.collection.add(
-                documents=[file_path],
-                metadatas=[metadata],
-                ids=[file_path],
-            )
-            return True, None
-        except Exception as e:
-            return False, str(e)
+        if not os.path.exists(file_path):
+            return False, f"File not found: {file_path}"
+        file_path = os.path.abspath(file_path)
+        report = self._ingest_files([file_path], parallel=False)
+        if report.errors:
+            return False, "; ".join(report.errors)
+        return True, None
 
     def remove_file(self, file_path: str) -> Tuple[bool, Optional[str]]:
         """
@@ -173,53 +482,120 @@ class KnowledgeBase(BaseTool):
         Returns:
             Tuple[bool, Optional[str]]: Success status and error message if any
         """
+        file_path = os.path.abspath(file_path)
         try:
             self.collection.delete(
-                ids=[file_path],
+                where={"source": file_path},
             )
+            self.lexical_index.delete_sources([file_path])
+            self.manifest.delete([file_path])
+            self._notify([file_path], added=False)
             return True, None
         except Exception as e:
             return False, str(e)
 
-    def _process_results(self, results: Dict, search_type: str) -> List[SearchResult]:
+    def _process_results(
+        self, results: Dict, search_type: str, query_index: int = 0
+    ) -> ResultSet:
         """
-        Process raw search results into structured SearchResult objects.
+        Process raw search results into a ResultSet.
 
         Args:
             results (Dict): Raw search results from ChromaDB
             search_type (str): Type of search performed ("keyword" or "semantic")
+            query_index (int): Which query of a batched `query` call to process
 
         Returns:
-            List[SearchResult]: Processed search results
+            ResultSet: Processed search results, sharing the documents and metadatas of `results`
         """
-        processed_results = []
-        if not results or "documents" not in results:
-            return processed_results
-
-        for idx, (doc, metadata, distance) in enumerate(
-            zip(
-                results["documents"][0],
-                results["metadatas"][0],
-                results.get("distances", [[]])[0],
-            )
-        ):
-            if doc:  # Skip empty results
-                processed_results.append(
-                    SearchResult(
-                        document_id=str(idx),
-                        content=doc,
-                        relevance_score=(
-                            float(1 - distance) if distance is not None else 0.0
-                        ),
-                        metadata={**metadata, "search_type": search_type},
+        return ResultSet.from_query(results, search_type, query_index=query_index)
+
+    @staticmethod
+    def _where(user_input: KnowledgeBaseInputSchema) -> Optional[Dict]:
+        """Chroma metadata filter of the input's extension and modification date filters."""
+        conditions = []
+        if user_input.extensions:
+            extensions = [
+                extension.lower() if extension.startswith(".") else f".{extension.lower()}"
+                for extension in user_input.extensions
+            ]
+            conditions.append({"extension": {"$in": extensions}})
+        if user_input.modified_after:
+            try:
+                since = datetime.fromisoformat(user_input.modified_after).timestamp()
+            except ValueError:
+                logger.warning("Ignoring invalid modified_after date: %s", user_input.modified_after)
+            else:
+                conditions.append({"modified": {"$gte": since}})
+        if len(conditions) > 1:
+            return {"$and": conditions}
+        return conditions[0] if conditions else None
+
+    def _backfill_lexical_index(self, batch_size: int = 1000) -> None:
+        """
+        Fill an empty BM25 index from the vector store, once per instance.
+
+        Collections built before the lexical index existed have no rows in it, and
+        keyword search would find nothing until every file was re-ingested.
+        """
+        if self._lexical_checked:
+            return
+        with self._lexical_lock:
+            if self._lexical_checked:
+                return
+            if self.lexical_index.count() == 0 and self.collection.count():
+                logger.info("Backfilling the lexical index of %s", self.collection.name)
+                indexed = 0
+                while True:
+                    page = self.collection.get(
+                        limit=batch_size, offset=indexed, include=["documents", "metadatas"]
                     )
-                )
-        return processed_results
+                    if not len(page["ids"]):
+                        break
+                    self.lexical_index.upsert(page["ids"], page["documents"], page["metadatas"])
+                    indexed += len(page["ids"])
+                logger.info("Backfilled %d chunks into the lexical index", indexed)
+            self._lexical_checked = True
+
+    def _keyword_search(self, keywords: List[str], n_results: int = 5, where: Optional[Dict] = None) -> ResultSet:
+        """BM25 search over the lexical index, hydrated from the collection in one `get`."""
+        self._backfill_lexical_index()
+        with span("lexical.search", keywords=len(keywords)) as search_span:
+            # The filter is applied when hydrating, so fetch more hits to keep n_results
+            limit = n_results * 4 if where else n_results
+            hits = self.lexical_index.search(" ".join(keywords), n_results=limit)
+            search_span.set(hits=len(hits))
+        if not hits:
+            return ResultSet("keyword")
+        with span("chroma.get", ids=len(hits)):
+            records = self.collection.get(
+                ids=[chunk_id for chunk_id, _ in hits], where=where, include=["documents", "metadatas"]
+            )
+        kept = set(records["ids"])
+        return ResultSet.from_records(records, [hit for hit in hits if hit[0] in kept][:n_results], "keyword")
+
+    @staticmethod
+    def _fuse(ranked_lists: List[ResultSet], k: int = 60, limit: Optional[int] = None) -> ResultSet:
+        """Reciprocal rank fusion of several rankings, deduplicated by source document (see `ResultSet.fuse`)."""
+        return ResultSet.fuse(ranked_lists, k=k, limit=limit)
+
+    @staticmethod
+    def _search_results(result_set: ResultSet) -> List[SearchResult]:
+        """Materialise hits as SearchResult schemas, at the tool boundary only."""
+        return [
+            SearchResult(document_id=chunk_id, content=content, relevance_score=score, metadata=metadata)
+            for chunk_id, content, score, metadata in result_set
+        ]
 
     def run(self, user_input: KnowledgeBaseInputSchema) -> KnowledgeBaseOutputSchema:
         """
         Perform both keyword and semantic search on the knowledge base.
 
+        Keywords are ranked with BM25 on the lexical index, all questions are
+        embedded and searched in one batched vector store query, and the rankings are
+        merged with reciprocal rank fusion. Both searches apply the extension and
+        modification date filters.
+
         Args:
             user_input (KnowledgeBaseInputSchema): Search parameters including keywords and questions
 
@@ -227,43 +603,48 @@ class KnowledgeBase(BaseTool):
             KnowledgeBaseOutputSchema: Search results including keyword, semantic, and combined results
         """
         try:
-            # Perform keyword search
-            keyword_query = " ".join(user_input.keywords)
-            keyword_results = self.collection.query(
-                query_texts=[keyword_query],
-                n_results=5,
-                include_metadata=True,
-                include_distances=True,
-            )
+            where = self._where(user_input)
+            keyword_processed = self._keyword_search(user_input.keywords, n_results=5, where=where)
+
+            semantic_rankings = []
+            if user_input.questions:
+                with span("chroma.query", queries=len(user_input.questions)) as query_span:
+                    question_results = self.collection.query(
+                        query_texts=user_input.questions,
+                        n_results=5,
+                        where=where,
+                        include=["documents", "metadatas", "distances"],
+                    )
+                    query_span.set(
+                        response_bytes=sum(
+                            len(doc or "") for docs in question_results["documents"] for doc in docs
+                        )
+                    )
+                semantic_rankings = [
+                    self._process_results(question_results, "semantic", query_index=i)
+                    for i in range(len(user_input.questions))
+                ]
+            semantic_results = ResultSet.concat(semantic_rankings, "semantic")
 
-            # Perform semantic search
-            semantic_results = []
-            for question in user_input.questions:
-                question_results = self.collection.query(
-                    query_texts=[question],
-                    n_results=3,
-                    include_metadata=True,
-                    include_distances=True,
-                )
-                semantic_results.extend(
-                    self._process_results(question_results, "semantic")
-                )
-
-            # Process and combine results
-            keyword_processed = self._process_results(keyword_results, "keyword")
-
-            # Merge and rank results
-            all_results = keyword_processed + semantic_results
-            combined_results = sorted(
-                all_results, key=lambda x: x.relevance_score, reverse=True
-            )
+            # Top 5 combined results
+            combined_results = self._fuse([keyword_processed] + semantic_rankings, limit=5)
 
             return KnowledgeBaseOutputSchema(
-                keyword_results=keyword_processed,
-                semantic_results=semantic_results,
-                combined_results=combined_results[:5],  # Return top 5 combined results
+                keyword_results=self._search_results(keyword_processed),
+                semantic_results=self._search_results(semantic_results),
+                combined_results=self._search_results(combined_results),
             )
 
         except Exception as e:
-            print(f"Search error: {e}")
+            logger.error("Search error: %s", e)
             return KnowledgeBaseOutputSchema()
+
+
+register_tool(
+    ToolSpec(
+        name="KnowledgeBase",
+        factory=KnowledgeBase,
+        input_schema=KnowledgeBaseInputSchema,
+        output_schema=KnowledgeBaseOutputSchema,
+    )
+)
@@ -0,0 +1,114 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+## BM25 lexical index kept alongside the Chroma collection
+# Uses SQLite FTS5, whose bm25() ranking runs in C over an inverted index, so keyword
+# search is a real lexical match instead of another embedding query.
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 OR-query of quoted terms, immune to FTS syntax in the input."""
+    terms = dict.fromkeys(token.lower() for token in _TOKEN.findall(text))
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class LexicalIndex:
+    """Full-text index of KnowledgeBase chunks, ranked with BM25."""
+
+    def __init__(self, path: str = "./chroma_db/lexical.sqlite3"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Filtering an FTS5 table on a non-text column scans every row, so ids and sources
+        # live in a plain table sharing the FTS rowid, which keeps deletes indexed.
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunk_ids (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                source TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunk_ids_source ON chunk_ids (source);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                content,
+                tokenize = 'porter unicode61'
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _delete_rowids(self, rowids: List[int]) -> None:
+        self._conn.executemany("DELETE FROM chunks WHERE rowid = ?", ((r,) for r in rowids))
+        self._conn.executemany("DELETE FROM chunk_ids WHERE rowid = ?", ((r,) for r in rowids))
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict]) -> None:
+        """Index chunks, replacing any previous version of the same ids."""
+        with self._lock, self._conn:
+            existing = [
+                row[0]
+                for chunk_id in ids
+                for row in self._conn.execute(
+                    "SELECT rowid FROM chunk_ids WHERE id = ?", (chunk_id,)
+                )
+            ]
+            self._delete_rowids(existing)
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                rowid = self._conn.execute(
+                    "INSERT INTO chunk_ids (id, source) VALUES (?, ?)",
+                    (chunk_id, metadata.get("source", "")),
+                ).lastrowid
+                self._conn.execute(
+                    "INSERT INTO chunks (rowid, content) VALUES (?, ?)", (rowid, document)
+                )
+
+    def count(self) -> int:
+        """Number of indexed chunks."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunk_ids").fetchone()[0]
+
+    def delete_sources(self, sources: Iterable[str]) -> None:
+        """Remove every chunk of the given source files."""
+        with self._lock, self._conn:
+            rowids = [
+                row[0]
+                for source in sources
+                for row in self._conn.execute(
+                    "SELECT rowid FROM chunk_ids WHERE source = ?", (source,)
+                )
+            ]
+            self._delete_rowids(rowids)
+
+    def search(self, text: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        Rank chunks against free text with BM25.
+
+        Args:
+            text (str): The query text
+            n_results (int): Maximum number of hits
+
+        Returns:
+            List[Tuple[str, float]]: (chunk id, bm25 score) pairs, best first. Higher is better.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT chunk_ids.id, bm25(chunks) AS score
+                FROM chunks JOIN chunk_ids ON chunk_ids.rowid = chunks.rowid
+                WHERE chunks MATCH ? ORDER BY score LIMIT ?""",
+                (query, n_results),
+            ).fetchall()
+        # FTS5's bm25() is negated so that ORDER BY ascending puts the best match first
+        return [(chunk_id, -score) for chunk_id, score in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,617 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes from several processes are not serialised
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+## Memory-mapped vector store
+# Embeddings are L2-normalised, quantised to float16 (or int8 with one scale per row) and
+# appended to flat files that every process maps read-only, so workers reading the same
+# store share one copy in the page cache. An IVF index (k-means centroids and the rows of
+# each list, also mapped) narrows a query to the rows of its `nprobe` nearest lists plus
+# the rows added since the index was built; rows are stored in list order, so a probed list
+# is one contiguous slice. Ids, documents and metadata live in a SQLite sidecar whose
+# indexed `source`, `extension` and `modified` columns serve filtered searches; a filter
+# matching few rows is scored exactly over those rows instead, and the rows of recent
+# filters are cached. Deleted and replaced rows are tombstoned in a live-row bitmap and
+# dropped when the index is rebuilt, which writes a new generation of files. One writer at
+# a time (a file lock).
+
+PROMOTED = ("source", "extension", "modified")  # Metadata keys kept in indexed columns
+DTYPES = {"float16": np.float16, "int8": np.int8}
+BLOCK_ROWS = 65536
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_SQL_BATCH = 500
+_CHUNKS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        row INTEGER PRIMARY KEY,
+        id TEXT UNIQUE NOT NULL,
+        source TEXT,
+        extension TEXT,
+        modified REAL,
+        document TEXT,
+        metadata TEXT
+    )
+"""
+# Covering indexes: a filter on extension and modification date never reads the table
+_CHUNKS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)",
+    "CREATE INDEX IF NOT EXISTS chunks_extension ON chunks (extension, modified)",
+    "CREATE INDEX IF NOT EXISTS chunks_modified ON chunks (modified, extension)",
+)
+
+
+def where_sql(where: Dict) -> Tuple[str, List]:
+    """
+    Translate a Chroma `where` filter into a SQL condition on the chunks table.
+
+    Supports field equality, `$eq`, `$ne`, `$gt`, `$gte`, `$lt`, `$lte`, `$in`, `$nin`,
+    `$and` and `$or`.
+
+    Returns:
+        Tuple[str, List]: The condition and its parameters
+    """
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_sql(part) for part in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, part_params in parts:
+                params.extend(part_params)
+            continue
+        if key in PROMOTED:
+            column, column_params = key, []
+        else:
+            column, column_params = "json_extract(metadata, ?)", [f'$."{key}"']
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if operator == "$in" else "1")
+                    continue
+                negation = "NOT " if operator == "$nin" else ""
+                clauses.append(f"{column} {negation}IN ({', '.join('?' * len(values))})")
+                params.extend(column_params + values)
+            elif operator in _OPERATORS:
+                clauses.append(f"{column} {_OPERATORS[operator]} ?")
+                params.extend(column_params + [value])
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+    return " AND ".join(clauses) or "1", params
+
+
+def normalise(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length, so a dot product is the cosine similarity."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class MmapVectorStore:
+    """
+    Vector store over memory-mapped, quantised embeddings with an IVF index and a SQLite
+    metadata sidecar. Implements the VectorStore methods of a Chroma collection, with
+    cosine distances.
+    """
+
+    def __init__(
+        self,
+        path: str = "./chroma_db",
+        name: str = "local_files",
+        embedding_function=None,
+        dtype: str = "float16",
+        nprobe: int = 8,
+        exact_rows: int = 2000,
+        readonly: bool = False,
+        auto_index: bool = True,
+        min_index_rows: int = 50000,
+        reindex_ratio: float = 0.25,
+    ):
+        """
+        Args:
+            path (str): Directory holding the store, next to the knowledge base's other indexes
+            name (str): Store name, its files go in `<path>/<name>.vectors`
+            embedding_function: Chroma-style embedding function for texts, defaults to Chroma's own
+            dtype (str): Storage type of new stores, "float16" or "int8", existing stores keep theirs
+            nprobe (int): IVF lists scanned per query
+            exact_rows (int): Filters matching at most this many rows, or no more than a probe scans, are scored exactly over them
+            readonly (bool): Open without writing, for worker processes sharing the store
+            auto_index (bool): Rebuild the index during writes once enough rows were added
+            min_index_rows (int): Rows from which an index is built, smaller stores are scanned whole
+            reindex_ratio (float): Share of rows added or replaced since the last build that triggers a rebuild
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {sorted(DTYPES)}, got {dtype!r}")
+        self.name = name
+        self.directory = os.path.join(path, f"{name}.vectors")
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        self.exact_rows = exact_rows
+        self.readonly = readonly
+        self.auto_index = auto_index
+        self.min_index_rows = min_index_rows
+        self.reindex_ratio = reindex_ratio
+        self._lock = threading.RLock()
+        database = os.path.join(self.directory, "meta.sqlite3")
+        if readonly:
+            if not os.path.exists(database):
+                raise FileNotFoundError(f"No vector store at {self.directory}")
+            self._conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(database, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute(_CHUNKS_TABLE.format(table="chunks"))
+            for index in _CHUNKS_INDEXES:
+                self._conn.execute(index)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO info (key, value) VALUES (?, ?)",
+                    [("dtype", dtype), ("dim", "0"), ("rows", "0"), ("indexed", "0"), ("generation", "0")],
+                )
+        self._state: Optional[Tuple[int, int]] = None
+        self._filters: "OrderedDict[str, Tuple]" = OrderedDict()  # where -> (version, rows, mask)
+        self._writes = 0
+        with self._snapshot():
+            pass
+
+    def _info(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM info"))
+
+    def _file(self, kind: str, generation: int, suffix: str = "bin") -> str:
+        return os.path.join(self.directory, f"{kind}.{generation}.{suffix}")
+
+    def _map(self, info: Dict[str, str]) -> None:
+        """(Re)map the files of the generation and row count recorded in `info`."""
+        generation, rows = int(info["generation"]), int(info["rows"])
+        self.dtype = info["dtype"]
+        self.dim = int(info["dim"])
+        self._rows = rows
+        self._indexed = int(info["indexed"])
+        self._vectors = np.zeros((0, self.dim), DTYPES[self.dtype])
+        self._scales = np.ones(0, np.float32)
+        self._live = np.zeros(0, np.uint8)
+        self._centroids = self._offsets = None
+        if rows:
+            self._vectors = np.memmap(
+                self._file("vectors", generation), DTYPES[self.dtype], mode="r", shape=(rows, self.dim)
+            )
+            self._live = np.memmap(self._file("live", generation), np.uint8, mode="r", shape=(rows,))
+            if self.dtype == "int8":
+                self._scales = np.memmap(self._file("scales", generation), np.float32, mode="r", shape=(rows,))
+        if self._indexed:
+            self._centroids = np.load(self._file("centroids", generation, "npy"), mmap_mode="r")
+            self._offsets = np.load(self._file("offsets", generation, "npy"), mmap_mode="r")
+        self._state = (generation, rows)
+
+    def _refresh(self) -> None:
+        info = self._info()
+        if (int(info["generation"]), int(info["rows"])) != self._state:
+            self._map(info)
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[None]:
+        """Read under one SQLite snapshot, remapping first if a writer added rows or rebuilt the index."""
+        with self._lock:
+            for attempt in range(3):
+                self._conn.execute("BEGIN")
+                try:
+                    self._refresh()
+                    break
+                except FileNotFoundError:
+                    self._conn.rollback()  # A rebuild removed this generation's files, read the next one
+                    if attempt == 2:
+                        raise
+            try:
+                yield
+            finally:
+                self._conn.rollback()
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        if self.readonly:
+            raise PermissionError(f"Vector store {self.directory} is open read-only")
+        with self._lock:
+            fd = os.open(os.path.join(self.directory, "write.lock"), os.O_RDWR | os.O_CREAT)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                self._refresh()
+                yield
+            finally:
+                self._writes += 1
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _embed(self, texts: Sequence[str]) -> List:
+        if self.embedding_function is None:
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+            self.embedding_function = DefaultEmbeddingFunction()  # What a Chroma collection would use
+        return self.embedding_function(list(texts))
+
+    def _encode(self, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.dtype == "float16":
+            return matrix.astype(np.float16), None
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.rint(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _decode(self, rows) -> np.ndarray:
+        """Dequantised float32 vectors of the given rows (a slice or an index array)."""
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self.dtype == "int8":
+            vectors *= np.asarray(self._scales[rows])[:, None]
+        return vectors
+
+    def _scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Cosine similarities of the query with the given rows, gathered in blocks."""
+        scores = np.empty(len(rows), np.float32)
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block = rows[start : start + BLOCK_ROWS]
+            scores[start : start + len(block)] = self._decode(block) @ query
+        return scores
+
+    def _scan(self, start: int, stop: int, query: np.ndarray) -> np.ndarray:
+        """Cosine similarities of the query with a contiguous range of rows."""
+        return np.concatenate(
+            [self._decode(slice(block, min(block + BLOCK_ROWS, stop))) @ query for block in range(start, stop, BLOCK_ROWS)]
+        )
+
+    def _probe(self, query: np.ndarray) -> List[Tuple[int, int]]:
+        """Row ranges of the query's nearest IVF lists and of the rows added since the index was built."""
+        if self._centroids is None:
+            return [(0, self._rows)]
+        similarities = np.asarray(self._centroids) @ query
+        nprobe = min(self.nprobe, len(similarities))
+        probed = np.argpartition(-similarities, nprobe - 1)[:nprobe]
+        ranges = [(int(self._offsets[i]), int(self._offsets[i + 1])) for i in probed]
+        ranges.append((self._indexed, self._rows))
+        return [(start, stop) for start, stop in ranges if stop > start]
+
+    def _exact_limit(self) -> int:
+        """Rows a filter may match and still be scored exactly: about as many as an IVF probe scans."""
+        probed = self._rows - self._indexed
+        if self._centroids is not None:
+            probed += self.nprobe * self._indexed // len(self._centroids)
+        return max(self.exact_rows, probed)
+
+    def _search(self, query: np.ndarray, n_results: int, allowed: Optional[Tuple]) -> Tuple[np.ndarray, np.ndarray]:
+        live = self._live
+        if allowed is not None and len(allowed[0]) <= self._exact_limit():
+            rows = allowed[0][np.asarray(live[allowed[0]]) == 1]
+            scores = self._scores(rows, query)
+        else:
+            ranges = self._probe(query)
+            rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+            scores = np.concatenate([self._scan(start, stop, query) for start, stop in ranges])
+            keep = np.concatenate([np.asarray(live[start:stop]) == 1 for start, stop in ranges])
+            if allowed is not None:
+                keep &= allowed[1][rows]
+            rows, scores = rows[keep], scores[keep]
+            if allowed is not None and len(rows) < n_results:
+                rows = allowed[0][np.asarray(live[allowed[0]]) == 1]  # The probed lists missed the filter
+                scores = self._scores(rows, query)
+        if len(scores) > n_results:
+            top = np.argpartition(-scores, n_results - 1)[:n_results]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top], scores[top]
+
+    def _allowed(self, where: Dict) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Rows matching a filter, and a row mask when there are too many to score exactly.
+        Cached until the store changes: fetching rows from SQLite costs about 1 µs each.
+        """
+        key = json.dumps(where, sort_keys=True, default=str)
+        version = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._writes, self._state)
+        cached = self._filters.get(key)
+        if cached is not None and cached[0] == version:
+            self._filters.move_to_end(key)
+            return cached[1:]
+        rows = self._select_rows(where)
+        mask = None
+        if len(rows) > self._exact_limit():
+            mask = np.zeros(self._rows, bool)
+            mask[rows] = True
+        self._filters[key] = (version, rows, mask)
+        if len(self._filters) > 16:
+            self._filters.popitem(last=False)
+        return rows, mask
+
+    def _select_rows(self, where: Optional[Dict] = None, ids: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Sorted rows matching a `where` filter and/or ids."""
+        condition, params = where_sql(where) if where else ("1", [])
+        if ids is None:
+            rows = self._conn.execute(f"SELECT row FROM chunks WHERE {condition}", params).fetchall()
+            return np.sort(np.array(rows, np.int64).reshape(-1))
+        found = []
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = list(ids[start : start + _SQL_BATCH])
+            found.extend(
+                row
+                for row, in self._conn.execute(
+                    f"SELECT row FROM chunks WHERE id IN ({', '.join('?' * len(batch))}) AND {condition}",
+                    batch + params,
+                )
+            )
+        return np.sort(np.array(found, np.int64))
+
+    def _records(self, rows: Sequence[int]) -> Dict[int, Tuple[str, Optional[str], Optional[Dict]]]:
+        records = {}
+        rows = [int(row) for row in rows]
+        for start in range(0, len(rows), _SQL_BATCH):
+            batch = rows[start : start + _SQL_BATCH]
+            for row, chunk_id, document, metadata in self._conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({', '.join('?' * len(batch))})",
+                batch,
+            ):
+                records[row] = (chunk_id, document, json.loads(metadata) if metadata else None)
+        return records
+
+    def count(self) -> int:
+        with self._snapshot():
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def query(
+        self,
+        query_texts: Optional[Sequence[str]] = None,
+        query_embeddings=None,
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> Dict:
+        """
+        Nearest chunks of each query, as a Chroma `query` returns them.
+
+        Args:
+            query_texts (Optional[Sequence[str]]): Texts to embed and search with
+            query_embeddings: Embeddings to search with instead of texts
+            n_results (int): Hits per query
+            where (Optional[Dict]): Chroma metadata filter, e.g. {"extension": {"$in": [".py"]}}
+            include (Sequence[str]): Fields to return besides ids
+
+        Returns:
+            Dict: ids, documents, metadatas and distances (1 - cosine similarity), one list per query
+        """
+        if query_embeddings is None:
+            query_embeddings = self._embed(query_texts)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = normalise(queries.reshape(len(queries), -1))
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._snapshot():
+            allowed = self._allowed(where) if where else None
+            for query in queries:
+                if self._rows:
+                    rows, scores = self._search(query, n_results, allowed)
+                else:
+                    rows, scores = np.zeros(0, np.int64), np.zeros(0, np.float32)
+                records = self._records(rows)
+                hits = [(records[int(row)], float(score)) for row, score in zip(rows, scores) if int(row) in records]
+                results["ids"].append([record[0] for record, _ in hits])
+                results["documents"].append([record[1] for record, _ in hits])
+                results["metadatas"].append([record[2] for record, _ in hits])
+                results["distances"].append([1.0 - score for _, score in hits])
+        return {key: value if key == "ids" or key in include else None for key, value in results.items()}
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> Dict:
+        """Chunks by id and/or filter, in storage order, as a Chroma `get` returns them."""
+        with self._snapshot():
+            rows = self._select_rows(where, ids)
+            rows = rows[offset or 0 :][:limit]
+            records = self._records(rows)
+            rows = [int(row) for row in rows if int(row) in records]
+            results = {
+                "ids": [records[row][0] for row in rows],
+                "documents": [records[row][1] for row in rows] if "documents" in include else None,
+                "metadatas": [records[row][2] for row in rows] if "metadatas" in include else None,
+                "embeddings": None,
+            }
+            if "embeddings" in include:
+                results["embeddings"] = self._decode(np.array(rows, np.int64)) if rows else np.zeros((0, self.dim))
+        return results
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Optional[Dict]]] = None,
+        embeddings=None,
+    ) -> None:
+        """
+        Add chunks, replacing any with the same id. Documents are embedded if no embeddings are given.
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        if embeddings is None:
+            embeddings = self._embed(documents)
+        matrix = normalise(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}  # Like Chroma, the last duplicate wins
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids, documents, metadatas = [ids[i] for i in keep], [documents[i] for i in keep], [metadatas[i] for i in keep]
+            matrix = matrix[keep]
+
+        with self._writing():
+            if self.dim and matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match the store's {self.dim}")
+            generation = self._state[0]
+            first = self._rows
+            replaced = self._select_rows(ids=ids)
+            vectors, scales = self._encode(matrix)
+            self._append("vectors", generation, first, vectors)
+            if scales is not None:
+                self._append("scales", generation, first, scales)
+            self._append("live", generation, first, np.ones(len(ids), np.uint8))
+            with self._conn:
+                self._delete_records(replaced)
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, id, source, extension, modified, document, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (first + i, chunk_id, *((metadata or {}).get(key) for key in PROMOTED), document,
+                         json.dumps(metadata) if metadata else None)
+                        for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+                    ),
+                )
+                self._conn.executemany(
+                    "UPDATE info SET value = ? WHERE key = ?",
+                    [(str(first + len(ids)), "rows"), (str(matrix.shape[1]), "dim")],
+                )
+            self._tombstone(replaced, generation)
+            self._refresh()
+            if self.auto_index and self._needs_index():
+                self._rebuild()
+
+    def _append(self, kind: str, generation: int, first: int, rows: np.ndarray) -> None:
+        with open(self._file(kind, generation), "ab") as f:
+            f.truncate(first * rows[:1].nbytes)  # Drop what an interrupted upsert left after the last committed row
+            f.write(rows.tobytes())
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None) -> None:
+        """Delete chunks by id and/or filter."""
+        if ids is None and where is None:
+            raise ValueError("delete needs ids or a where filter")
+        with self._writing():
+            rows = self._select_rows(where, list(ids) if ids is not None else None)
+            if len(rows):
+                with self._conn:
+                    self._delete_records(rows)
+                self._tombstone(rows, self._state[0])
+
+    def _delete_records(self, rows: np.ndarray) -> None:
+        self._conn.executemany("DELETE FROM chunks WHERE row = ?", ((int(row),) for row in rows))
+
+    def _tombstone(self, rows: np.ndarray, generation: int) -> None:
+        """Clear live flags in place; readers see it through their shared mappings."""
+        if not len(rows):
+            return
+        fd = os.open(self._file("live", generation), os.O_WRONLY)
+        try:
+            for row in rows:
+                os.pwrite(fd, b"\x00", int(row))
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        with self._lock:
+            self._vectors = self._scales = self._live = None
+            self._centroids = self._offsets = None
+            self._conn.close()
+
+    def _needs_index(self) -> bool:
+        if self._rows < self.min_index_rows:
+            return False
+        return not self._indexed or self._rows - self._indexed > self.reindex_ratio * self._indexed
+
+    def rebuild_index(self, nlist: Optional[int] = None) -> None:
+        """
+        Drop deleted rows and rebuild the IVF index over all rows, as a new generation of files.
+
+        Args:
+            nlist (Optional[int]): IVF lists, defaults to twice the square root of the row count
+        """
+        with self._writing():
+            self._rebuild(nlist)
+
+    def _rebuild(self, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        generation = self._state[0] + 1
+        rows = self._select_rows()  # SQLite is the truth; rows written by an interrupted upsert are dropped
+        count = len(rows)
+        indexed = 0
+        if count >= self.min_index_rows:
+            centroids, assignment = self._kmeans(rows, nlist or int(2 * np.sqrt(count)), iterations, seed)
+            rows = rows[np.argsort(assignment, kind="stable")]  # Each list's rows next to each other
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))))
+            np.save(self._file("centroids", generation, "npy"), centroids)
+            np.save(self._file("offsets", generation, "npy"), offsets.astype(np.int64))
+            indexed = count
+        with open(self._file("vectors", generation), "wb") as vectors_file:
+            with open(self._file("scales", generation), "wb") as scales_file:
+                for start in range(0, count, BLOCK_ROWS):
+                    block = rows[start : start + BLOCK_ROWS]
+                    vectors_file.write(np.asarray(self._vectors[block]).tobytes())
+                    if self.dtype == "int8":
+                        scales_file.write(np.asarray(self._scales[block]).tobytes())
+        with open(self._file("live", generation), "wb") as f:
+            f.write(b"\x01" * count)
+
+        # Renumber the records to their new positions in one copy of the table
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("CREATE TEMP TABLE moved (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+            self._conn.executemany("INSERT INTO moved (old, new) VALUES (?, ?)", ((int(old), new) for new, old in enumerate(rows)))
+            self._conn.execute(_CHUNKS_TABLE.format(table="chunks_next"))
+            self._conn.execute(
+                "INSERT INTO chunks_next (row, id, source, extension, modified, document, metadata) "
+                "SELECT moved.new, id, source, extension, modified, document, metadata "
+                "FROM chunks JOIN moved ON moved.old = chunks.row ORDER BY moved.new"
+            )
+            self._conn.execute("DROP TABLE chunks")
+            self._conn.execute("DROP TABLE temp.moved")
+            self._conn.execute("ALTER TABLE chunks_next RENAME TO chunks")
+            for index in _CHUNKS_INDEXES:
+                self._conn.execute(index)
+            self._conn.executemany(
+                "UPDATE info SET value = ? WHERE key = ?",
+                [(str(count), "rows"), (str(indexed), "indexed"), (str(generation), "generation")],
+            )
+        self._refresh()
+        for name in os.listdir(self.directory):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[1].isdigit() and int(parts[1]) < generation:
+                try:
+                    os.remove(os.path.join(self.directory, name))  # Readers keep their open mappings
+                except OSError as e:
+                    logger.debug("Could not remove %s: %s", name, e)
+        logger.info("Rebuilt vector store %s: %d rows, %d indexed", self.name, count, indexed)
+
+    def _kmeans(self, rows: np.ndarray, nlist: int, iterations: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Spherical k-means on a sample of the rows, then the nearest centroid of every row."""
+        rng = np.random.default_rng(seed)
+        nlist = max(1, min(nlist, len(rows)))
+        sample = self._decode(np.sort(rng.choice(rows, size=min(len(rows), nlist * 64), replace=False)))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            sizes = np.bincount(assignment, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            filled = sizes > 0
+            sums = sample[rng.choice(len(sample), size=nlist)]  # Empty lists are reseeded at random
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+            centroids = normalise(sums).astype(np.float32)
+
+        assignment = np.empty(len(rows), np.int64)
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block = rows[start : start + BLOCK_ROWS]
+            assignment[start : start + len(block)] = np.argmax(self._decode(block) @ centroids.T, axis=1)
+        return centroids, assignment
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.setup.Tracing import span
+
+
+## Shared HTTP clients for the Perplexica API
+# One pooled session is kept per (pool_size, retries, backoff) so every WebSearchTool
+# reuses the same keep-alive connections instead of paying a TCP handshake per search.
+# Connection errors and 429/5xx responses are retried, read timeouts are not: a search
+# that got stuck would only get stuck again, so each call also has an overall deadline.
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions: Dict[Tuple, requests.Session] = {}
+# Per event loop, then per settings. Entries go away with their loop, so loops started by
+# repeated asyncio.run calls don't pile up clients, and a new loop reusing a dead loop's id
+# can't be handed that loop's client.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def get_session(
+    pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5
+) -> requests.Session:
+    """
+    Get the shared, connection-pooled `requests.Session` for the given settings.
+
+    Args:
+        pool_size (int): Maximum number of keep-alive connections per host
+        max_retries (int): Retries on connection errors, `post_json` retries the statuses
+        backoff_factor (float): Exponential backoff factor between retries, in seconds
+
+    Returns:
+        requests.Session: A session shared by every caller using the same settings
+    """
+    key = (pool_size, max_retries, backoff_factor)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            retry = Retry(
+                total=max_retries,
+                connect=max_retries,
+                read=0,
+                status=0,
+                other=0,
+                backoff_factor=backoff_factor,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return session
+
+
+def get_async_client(
+    pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 120.0
+) -> httpx.AsyncClient:
+    """
+    Get the shared `httpx.AsyncClient` for the running event loop and given settings.
+
+    httpx clients are bound to the loop they were first used on, so one client
+    is kept per loop. Call `close_async_clients` before the loop ends to close its
+    connections.
+
+    Args:
+        pool_size (int): Maximum number of concurrent and keep-alive connections
+        connect_timeout (float): Seconds to wait for a connection to be established
+        read_timeout (float): Seconds to wait for the search to return
+
+    Returns:
+        httpx.AsyncClient: A client shared by every coroutine on the current loop
+    """
+    loop = asyncio.get_running_loop()
+    key = (pool_size, connect_timeout, read_timeout)
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+            clients[key] = client
+        return client
+
+
+def _time_left(end: Optional[float]) -> float:
+    return float("inf") if end is None else end - time.monotonic()
+
+
+def post_json(
+    session: requests.Session,
+    url: str,
+    payload: Dict,
+    timeout: Tuple[float, float],
+    max_retries: int = 3,
+    backoff_factor: float = 0.5,
+    deadline: Optional[float] = None,
+) -> Dict:
+    """
+    POST a JSON payload with exponential backoff on retryable statuses, within an overall deadline.
+
+    Connection errors are retried by the session, read timeouts are not retried. Each
+    attempt's timeouts are cut to the time left, and no retry starts past the deadline.
+
+    Args:
+        timeout (Tuple[float, float]): Connect and read timeouts of one attempt, in seconds
+        deadline (Optional[float]): Seconds the call may take, retries and backoff included
+
+    Raises:
+        requests.RequestException: If the request fails, or still gets a retryable status when out of retries or time
+    """
+    end = None if deadline is None else time.monotonic() + deadline
+    connect_timeout, read_timeout = timeout
+    with span("http.post", url=url) as request_span:
+        for attempt in range(max_retries + 1):
+            request_span.set(attempts=attempt + 1)
+            left = _time_left(end)
+            response = session.post(
+                url, json=payload, timeout=(min(connect_timeout, left), min(read_timeout, left))
+            )
+            delay = backoff_factor * (2**attempt)
+            if (
+                response.status_code not in RETRY_STATUSES
+                or attempt == max_retries
+                or _time_left(end) <= delay
+            ):
+                request_span.set(
+                    status_code=response.status_code,
+                    request_bytes=len(response.request.body or b""),
+                    response_bytes=len(response.content),
+                )
+                response.raise_for_status()
+                return response.json()
+            time.sleep(delay)
+
+
+async def post_json_async(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: Dict,
+    max_retries: int = 3,
+    backoff_factor: float = 0.5,
+    deadline: Optional[float] = None,
+) -> Dict:
+    """
+    POST a JSON payload with exponential backoff on connection errors and retryable statuses.
+
+    Read timeouts are not retried, and the whole call, retries and backoff included,
+    is bounded by `deadline` seconds.
+
+    Raises:
+        httpx.HTTPError: If the request fails, or still gets a retryable status after `max_retries` retries
+        asyncio.TimeoutError: If the call takes longer than `deadline`
+    """
+    return await asyncio.wait_for(
+        _post_json_async(client, url, payload, max_retries, backoff_factor), deadline
+    )
+
+
+async def _post_json_async(
+    client: httpx.AsyncClient, url: str, payload: Dict, max_retries: int, backoff_factor: float
+) -> Dict:
+    with span("http.post", url=url) as request_span:
+        for attempt in range(max_retries + 1):
+            request_span.set(attempts=attempt + 1)
+            try:
+                response = await client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                    request_span.set(
+                        status_code=response.status_code,
+                        request_bytes=len(response.request.content),
+                        response_bytes=len(response.content),
+                    )
+                    response.raise_for_status()
+                    return response.json()
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt == max_retries:
+                    raise
+            await asyncio.sleep(backoff_factor * (2**attempt))
+
+
+def iter_stream_events(lines: Iterator[str]) -> Iterator[Dict]:
+    """
+    Parse Perplexica's newline-delimited streaming response into event dicts.
+
+    Events have a `type` of "init", "sources", "response" (an answer chunk) or "done".
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+async def aiter_stream_events(lines: AsyncIterator[str]) -> AsyncIterator[Dict]:
+    """Async counterpart of `iter_stream_events`."""
+    async for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+async def close_async_clients() -> None:
+    """Close the shared async clients owned by the running event loop."""
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def close_sessions() -> None:
+    """Close every shared sync session, e.g. on shutdown."""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
@@ -1,11 +1,23 @@
-from typing import Union
-from openai import OpenAI
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Union
 from pydantic import Field, BaseModel
 from atomic_agents.lib.base.base_io_schema import BaseIOSchema
 from atomic_agents.lib.base.base_tool import BaseTool, BaseToolConfig
-from atomic_agents.lib.components.agent_memory import Message
 import json
-import requests
+from backend.Agents.PerplexicaClient import (
+    aiter_stream_events,
+    close_sessions,
+    get_async_client,
+    get_session,
+    iter_stream_events,
+    post_json,
+    post_json_async,
+)
+from backend.setup.ToolRegistry import ToolSpec, register_tool
+from backend.setup.Tracing import span
+
+if TYPE_CHECKING:
+    # agent_memory imports instructor, seconds of startup for a type hint
+    from atomic_agents.lib.components.agent_memory import Message
 
 
 class WebSearchInputSchema(BaseIOSchema):
@@ -46,6 +58,27 @@ class WebSearchConfig(BaseToolConfig):
         description="The embedding model used by Perplexica",
         default="nomic-embed-text:latest",
     )
+    pool_size: int = Field(
+        description="Maximum number of pooled keep-alive connections to Perplexica",
+        default=10,
+    )
+    connect_timeout: float = Field(
+        description="Seconds to wait for a connection to Perplexica", default=5.0
+    )
+    read_timeout: float = Field(
+        description="Seconds to wait for Perplexica to answer a search", default=120.0
+    )
+    max_retries: int = Field(
+        description="Retries on connection errors and 429/5xx responses, read timeouts are not retried", default=3
+    )
+    deadline: Optional[float] = Field(
+        description="Seconds a search may take overall, retries and backoff included, None for no limit",
+        default=150.0,
+    )
+    backoff_factor: float = Field(
+        description="Exponential backoff factor between retries, in seconds",
+        default=0.5,
+    )
 
 
 class WebSearchTool(BaseTool):
@@ -58,28 +91,163 @@ class WebSearchTool(BaseTool):
 
     def __init__(
         self,
-        messages: list[Message],
+        messages: Optional[list["Message"]] = None,
         config: BaseToolConfig = WebSearchConfig(),
     ):
         super().__init__(config)
         self.host = config.host
         self.model = config.model
         self.embedding_model = config.embedding_model
-        self.messages = [
-            [message["role"], message["content"]] for message in messages
-        ]  # Convert to [[role, content]]
+        self.config = config
+        self.messages = self._to_history(messages or [])
+
+    @staticmethod
+    def _to_history(messages: list["Message"]) -> List[List]:
+        history = []
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, list):  # AgentMemory.get_history() content parts
+                content = "\n".join(str(part) for part in content)
+            role = "human" if message["role"] == "user" else message["role"]
+            history.append([role, content])  # Convert to [[role, content]]
+        return history
 
-    def run(self, params: WebSearchInputSchema) -> WebSearchOutputSchema:
-        payload = {
+    def _payload(
+        self,
+        params: WebSearchInputSchema,
+        stream: bool = False,
+        history: Optional[list["Message"]] = None,
+    ) -> Dict:
+        """Build the search request. `history` overrides the messages given at construction."""
+        return {
             "chatModel": {"provider": "ollama", "model": self.model},
             "embeddingModel": {"provider": "ollama", "model": self.embedding_model},
             "optimizationMode": params.optimizationMode,
             "focusMode": params.searchMethod,
             "query": params.prompt,
-            "history": self.messages,
+            "history": self.messages if history is None else self._to_history(history),
+            "stream": stream,
         }
 
-        json_ouput = requests.post(url=self.host, json=payload).json()
+    def _session(self):
+        return get_session(
+            pool_size=self.config.pool_size,
+            max_retries=self.config.max_retries,
+            backoff_factor=self.config.backoff_factor,
+        )
+
+    def _async_client(self):
+        return get_async_client(
+            pool_size=self.config.pool_size,
+            connect_timeout=self.config.connect_timeout,
+            read_timeout=self.config.read_timeout,
+        )
+
+    def run(
+        self, params: WebSearchInputSchema, history: Optional[list["Message"]] = None
+    ) -> WebSearchOutputSchema:
+        # No gateway slot is held: Perplexica calls Ollama itself, and holding one of `model`
+        # would queue searches (speculative ones too) behind the Orchestrator's own turns
+        json_ouput = post_json(
+            self._session(),
+            self.host,
+            self._payload(params, history=history),
+            timeout=(self.config.connect_timeout, self.config.read_timeout),
+            max_retries=self.config.max_retries,
+            backoff_factor=self.config.backoff_factor,
+            deadline=self.config.deadline,
+        )
         return WebSearchOutputSchema(
             answer=json_ouput["message"], documents=json_ouput["sources"]
         )
+
+    async def arun(
+        self, params: WebSearchInputSchema, history: Optional[list["Message"]] = None
+    ) -> WebSearchOutputSchema:
+        """Async counterpart of `run`, using the shared pooled `httpx.AsyncClient`."""
+        json_ouput = await post_json_async(
+            self._async_client(),
+            self.host,
+            self._payload(params, history=history),
+            max_retries=self.config.max_retries,
+            backoff_factor=self.config.backoff_factor,
+            deadline=self.config.deadline,
+        )
+        return WebSearchOutputSchema(
+            answer=json_ouput["message"], documents=json_ouput["sources"]
+        )
+
+    def stream(
+        self, params: WebSearchInputSchema, history: Optional[list["Message"]] = None
+    ) -> Iterator[WebSearchOutputSchema]:
+        """
+        Stream the search, yielding the partial answer each time Perplexica sends a chunk.
+
+        Yields:
+            WebSearchOutputSchema: The answer so far and the sources received so far
+        """
+        output = WebSearchOutputSchema(answer="", documents=[])
+        with span("http.stream", url=self.host) as request_span, self._session().post(
+            url=self.host,
+            json=self._payload(params, stream=True, history=history),
+            timeout=(self.config.connect_timeout, self.config.read_timeout),
+            stream=True,
+        ) as response:
+            request_span.set(status_code=response.status_code)
+            response.raise_for_status()
+            for event in iter_stream_events(
+                response.iter_lines(decode_unicode=True)
+            ):
+                request_span.add(events=1)
+                if self._apply_event(output, event):
+                    yield output.model_copy()
+
+    async def astream(
+        self, params: WebSearchInputSchema, history: Optional[list["Message"]] = None
+    ) -> AsyncIterator[WebSearchOutputSchema]:
+        """Async counterpart of `stream`."""
+        output = WebSearchOutputSchema(answer="", documents=[])
+        with span("http.stream", url=self.host) as request_span:
+            async with self._async_client().stream(
+                "POST", self.host, json=self._payload(params, stream=True, history=history)
+            ) as response:
+                request_span.set(status_code=response.status_code)
+                response.raise_for_status()
+                async for event in aiter_stream_events(response.aiter_lines()):
+                    request_span.add(events=1)
+                    if self._apply_event(output, event):
+                        yield output.model_copy()
+
+    @staticmethod
+    def _apply_event(output: WebSearchOutputSchema, event: Dict) -> bool:
+        """Fold a streaming event into `output`, returning whether it changed."""
+        if event.get("type") == "response":
+            output.answer += event.get("data", "")
+            return True
+        if event.get("type") == "sources":
+            output.documents = event.get("data", [])
+            return True
+        return False
+
+    def cache_config(self) -> Dict:
+        """Config values that change the answer, used in result cache keys."""
+        return {
+            "host": self.host,
+            "model": self.model,
+            "embedding_model": self.embedding_model,
+        }
+
+    def close(self) -> None:
+        """Close the pooled sessions shared by WebSearch tools."""
+        close_sessions()
+
+
+register_tool(
+    ToolSpec(
+        name="WebSearch",
+        factory=WebSearchTool,
+        input_schema=WebSearchInputSchema,
+        output_schema=WebSearchOutputSchema,
+        uses_history=True,
+    )
+)
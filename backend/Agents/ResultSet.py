@@ -0,0 +1,154 @@
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+## Column-wise container for KnowledgeBase search hits
+# A search touches dozens of hits per question but only a handful reach the agent. Hits are
+# kept as arrays of scores and row indices into the documents and metadatas lists Chroma
+# already returned, so no per-hit object or merged metadata dict is built until the results
+# are converted to SearchResult schemas at the tool boundary.
+
+Row = Tuple[str, str, float, Dict]  # (document_id, content, relevance_score, metadata)
+
+
+class ResultSet:
+    """
+    Ranked search hits of one search type, stored column-wise.
+
+    Content and metadata stay in the lists they came from (`_columns`); each hit
+    records which list (`_column`) and which position in it (`_row`). Metadata is
+    merged with the search type only when a hit is read.
+    """
+
+    __slots__ = ("search_type", "ids", "scores", "_columns", "_column", "_row")
+
+    def __init__(self, search_type: str):
+        self.search_type = search_type
+        self.ids: List[str] = []
+        self.scores = array("d")
+        self._columns: List[Tuple[Sequence[str], Sequence[Optional[Dict]]]] = []
+        self._column = array("H")
+        self._row = array("I")
+
+    @classmethod
+    def from_query(cls, results: Dict, search_type: str, query_index: int = 0) -> "ResultSet":
+        """
+        Hits of one query of a batched Chroma `query` call, scored 1 - distance.
+
+        Args:
+            results (Dict): Raw Chroma query results
+            search_type (str): Type of search performed ("keyword" or "semantic")
+            query_index (int): Which query of the batch to take
+        """
+        result_set = cls(search_type)
+        if not results or not results.get("documents"):
+            return result_set
+        ids = results["ids"][query_index]
+        documents = results["documents"][query_index]
+        distances = (results.get("distances") or [[] for _ in results["ids"]])[query_index]
+        column = result_set._add_column(documents, results["metadatas"][query_index])
+        for row, doc in enumerate(documents):
+            if doc:  # Skip empty results
+                distance = distances[row] if distances else None
+                result_set._append(ids[row], float(1 - distance) if distance is not None else 0.0, column, row)
+        return result_set
+
+    @classmethod
+    def from_records(cls, records: Dict, hits: Sequence[Tuple[str, float]], search_type: str) -> "ResultSet":
+        """
+        Scored ids, in order, with content and metadata from a Chroma `get`.
+
+        Args:
+            records (Dict): Raw Chroma get results for the ids
+            hits (Sequence[Tuple[str, float]]): (id, score) pairs, best first
+            search_type (str): Type of search performed
+        """
+        result_set = cls(search_type)
+        documents = records["documents"]
+        column = result_set._add_column(documents, records["metadatas"])
+        positions = {chunk_id: row for row, chunk_id in enumerate(records["ids"])}
+        for chunk_id, score in hits:
+            row = positions.get(chunk_id)
+            if row is not None and documents[row]:
+                result_set._append(chunk_id, score, column, row)
+        return result_set
+
+    def _add_column(self, documents: Sequence[str], metadatas: Sequence[Optional[Dict]]) -> int:
+        for index, (column_documents, _) in enumerate(self._columns):
+            if column_documents is documents:
+                return index
+        self._columns.append((documents, metadatas))
+        return len(self._columns) - 1
+
+    def _append(self, chunk_id: str, score: float, column: int, row: int) -> None:
+        self.ids.append(chunk_id)
+        self.scores.append(score)
+        self._column.append(column)
+        self._row.append(row)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def content(self, index: int) -> str:
+        return self._columns[self._column[index]][0][self._row[index]]
+
+    def raw_metadata(self, index: int) -> Dict:
+        """The stored metadata of a hit, without the search type. Not a copy."""
+        return self._columns[self._column[index]][1][self._row[index]] or {}
+
+    def metadata(self, index: int) -> Dict:
+        return {**self.raw_metadata(index), "search_type": self.search_type}
+
+    def row(self, index: int) -> Row:
+        return self.ids[index], self.content(index), self.scores[index], self.metadata(index)
+
+    def __iter__(self) -> Iterator[Row]:
+        return (self.row(index) for index in range(len(self)))
+
+    def take(self, source: "ResultSet", index: int, score: float) -> None:
+        """Append hit `index` of `source` with a new score, sharing its content."""
+        documents, metadatas = source._columns[source._column[index]]
+        column = self._add_column(documents, metadatas)
+        self._append(source.ids[index], score, column, source._row[index])
+
+    @classmethod
+    def fuse(cls, rankings: Sequence["ResultSet"], k: int = 60, limit: Optional[int] = None) -> "ResultSet":
+        """
+        Reciprocal rank fusion of several rankings, deduplicated by source document.
+
+        Each chunk scores sum(1 / (k + rank)) over the rankings it appears in, and
+        only the best chunk of each source file is kept.
+
+        Args:
+            rankings (Sequence[ResultSet]): Hits of each ranking, best first
+            k (int): Rank offset damping the weight of the top ranks
+            limit (Optional[int]): Keep at most this many hits
+        """
+        scores: Dict[str, float] = {}
+        first: Dict[str, Tuple[ResultSet, int]] = {}
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking.ids, start=1):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (k + rank)
+                first.setdefault(chunk_id, (ranking, rank - 1))
+
+        fused = cls("hybrid")
+        seen_sources = set()
+        for chunk_id in sorted(scores, key=scores.get, reverse=True):
+            if limit is not None and len(fused) >= limit:
+                break
+            ranking, index = first[chunk_id]
+            source = ranking.raw_metadata(index).get("source", chunk_id)
+            if source in seen_sources:
+                continue
+            seen_sources.add(source)
+            fused.take(ranking, index, scores[chunk_id])
+        return fused
+
+    @classmethod
+    def concat(cls, result_sets: Sequence["ResultSet"], search_type: str) -> "ResultSet":
+        """All hits of several sets, in order."""
+        merged = cls(search_type)
+        for result_set in result_sets:
+            for index in range(len(result_set)):
+                merged.take(result_set, index, result_set.scores[index])
+        return merged
@@ -0,0 +1,164 @@
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional, Protocol, Sequence, runtime_checkable
+
+logger = logging.getLogger(__name__)
+
+## Storage backends of the KnowledgeBase
+# KnowledgeBase, IngestionPipeline and WebIngestor use a handful of methods of a Chroma
+# collection. VectorStore names that subset: a Chroma collection implements it as is, and
+# MmapVectorStore (MmapStore.py) implements it over memory-mapped quantised embeddings that
+# several worker processes can share read-only.
+# `python -m backend.Agents.VectorStore --path ./chroma_db` copies a Chroma collection,
+# embeddings included, into an mmap store; start the server with MOA_VECTOR_STORE=mmap.
+
+STORES = ("chroma", "mmap")
+
+
+@runtime_checkable
+class VectorStore(Protocol):
+    """The Chroma collection methods the knowledge base relies on. `where` takes Chroma filters."""
+
+    name: str
+
+    def count(self) -> int: ...
+
+    def query(
+        self,
+        query_texts: Optional[Sequence[str]] = None,
+        query_embeddings=None,
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Sequence[str] = ...,
+    ) -> Dict: ...
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ...,
+    ) -> Dict: ...
+
+    def upsert(self, ids: Sequence[str], documents=None, metadatas=None, embeddings=None) -> None: ...
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None) -> None: ...
+
+
+def chroma_client(path: str = "./chroma_db"):
+    """Persistent Chroma client of a knowledge base directory."""
+    import chromadb  # Over a second to import, only needed once a Chroma store is opened
+    from chromadb.config import DEFAULT_TENANT, DEFAULT_DATABASE, Settings
+
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(),
+        tenant=DEFAULT_TENANT,
+        database=DEFAULT_DATABASE,
+    )
+
+
+def open_store(
+    kind: str = "chroma",
+    path: str = "./chroma_db",
+    collection_name: str = "local_files",
+    embedding_function=None,
+    client=None,
+    **options,
+) -> VectorStore:
+    """
+    Open (or create) a vector store.
+
+    Args:
+        kind (str): "chroma" for a Chroma collection, "mmap" for an MmapVectorStore
+        path (str): Knowledge base directory
+        collection_name (str): Collection or store name
+        embedding_function: Chroma embedding function, defaults to Chroma's own
+        client: Chroma client to use instead of opening one on `path`
+        **options: MmapVectorStore options, e.g. dtype="int8" or readonly=True
+
+    Returns:
+        VectorStore: The store
+    """
+    if kind == "chroma":
+        client = client or chroma_client(path)
+        return client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"},  # Using cosine similarity for better semantic search
+            **({"embedding_function": embedding_function} if embedding_function else {}),
+        )
+    if kind == "mmap":
+        from backend.Agents.MmapStore import MmapVectorStore
+
+        return MmapVectorStore(path=path, name=collection_name, embedding_function=embedding_function, **options)
+    raise ValueError(f"Unknown vector store {kind!r}, expected one of {STORES}")
+
+
+def migrate(
+    source: VectorStore,
+    target: VectorStore,
+    batch_size: int = 5000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Copy every chunk with its embedding, document and metadata from one store to another.
+
+    Args:
+        source (VectorStore): Store to read, e.g. a Chroma collection
+        target (VectorStore): Store to write, its chunks with the same ids are replaced
+        batch_size (int): Chunks read and written per call
+        progress (Optional[Callable[[int], None]]): Called with the number of chunks copied after each batch
+
+    Returns:
+        int: Chunks copied
+    """
+    copied = 0
+    while True:
+        page = source.get(limit=batch_size, offset=copied, include=["documents", "metadatas", "embeddings"])
+        if not len(page["ids"]):
+            break
+        target.upsert(
+            ids=page["ids"], documents=page["documents"], metadatas=page["metadatas"], embeddings=page["embeddings"]
+        )
+        copied += len(page["ids"])
+        if progress:
+            progress(copied)
+    if hasattr(target, "rebuild_index"):
+        target.rebuild_index()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy a knowledge base's Chroma collection into an mmap vector store")
+    parser.add_argument("--path", default="./chroma_db", help="Knowledge base directory")
+    parser.add_argument("--collection", default="local_files")
+    parser.add_argument("--dtype", default="float16", choices=["float16", "int8"])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    source = open_store("chroma", args.path, args.collection)
+    target = open_store("mmap", args.path, args.collection, dtype=args.dtype, auto_index=False)
+    start = time.perf_counter()
+    copied = migrate(source, target, args.batch_size, progress=lambda n: logger.info("Copied %d chunks", n))
+    target.close()
+    store_bytes = sum(entry.stat().st_size for entry in os.scandir(target.directory) if entry.is_file())
+    print(
+        json.dumps(
+            {
+                "chunks": copied,
+                "seconds": round(time.perf_counter() - start, 3),
+                "store": target.directory,
+                "store_mb": round(store_bytes / 2**20, 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,609 @@
+import asyncio
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urlsplit
+
+import httpx
+import numpy as np
+
+from backend.setup.Tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+## Web pages into the KnowledgeBase
+# URLs are fetched concurrently on a bounded pool with a limit per host, the main text of
+# each page is extracted, and pages whose text was already ingested (same content hash)
+# or nearly so (64-bit simhash within a few bits) are dropped before anything is embedded.
+# WebIngestor.submit does the same in the background, for the sources of web searches.
+
+USER_AGENT = "Mozilla/5.0 (compatible; MixtureOfAgents/1.0; +https://github.com)"
+TEXT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_STOP = object()
+
+
+class _MainTextExtractor(HTMLParser):
+    """
+    Collects the text blocks of an HTML page with their link density.
+
+    Scripts, styles and page furniture (navigation, headers, footers, forms) are
+    skipped. Blocks inside <main> or <article> are flagged, so the main content
+    can be told apart from the rest of the page.
+    """
+
+    SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe"}
+    BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "form", "button", "menu", "select"}
+    BLOCK_TAGS = {
+        "p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr", "td", "th",
+        "pre", "blockquote", "br", "hr", "dd", "dt", "figcaption",
+        "h1", "h2", "h3", "h4", "h5", "h6",
+    }
+    HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.blocks: List[Tuple[str, int, bool, bool]] = []  # (text, link chars, in main, heading)
+        self._parts: List[str] = []
+        self._link_chars = 0
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._link_depth = 0
+        self._heading = False
+        self._in_title = False
+
+    def _close_block(self):
+        text = " ".join(" ".join(self._parts).split())
+        if text:
+            self.blocks.append((text, self._link_chars, self._main_depth > 0, self._heading))
+        self._parts, self._link_chars, self._heading = [], 0, False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS or tag in self.BOILERPLATE_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self.BLOCK_TAGS:
+            self._close_block()
+            self._heading = tag in self.HEADINGS
+            if tag in ("main", "article"):
+                self._main_depth += 1
+        elif tag == "a":
+            self._link_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS or tag in self.BOILERPLATE_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in self.BLOCK_TAGS:
+            self._close_block()
+            if tag in ("main", "article"):
+                self._main_depth = max(0, self._main_depth - 1)
+        elif tag == "a":
+            self._link_depth = max(0, self._link_depth - 1)
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data.strip()
+        elif not self._skip_depth and data.strip():
+            self._parts.append(data)
+            if self._link_depth:
+                self._link_chars += len(data.strip())
+
+    def close(self):
+        super().close()
+        self._close_block()
+
+
+def extract_main_text(html: str, min_main_chars: int = 200) -> Tuple[str, str]:
+    """
+    The title and main text of an HTML page.
+
+    Only <main>/<article> content is kept when it has at least `min_main_chars`,
+    and blocks that are mostly link text (menus, tag clouds, related links) or
+    too short to be prose are dropped.
+
+    Returns:
+        Tuple[str, str]: Title and text, one block per line
+    """
+    parser = _MainTextExtractor()
+    parser.feed(html)
+    parser.close()
+    blocks = parser.blocks
+    main = [block for block in blocks if block[2]]
+    if sum(len(block[0]) for block in main) >= min_main_chars:
+        blocks = main
+    lines = []
+    for text, link_chars, _, heading in blocks:
+        if link_chars > 0.5 * len(text):
+            continue
+        if not heading and len(text.split()) < 4:
+            continue
+        lines.append(text)
+    return parser.title, "\n".join(lines)
+
+
+def content_hash(text: str) -> str:
+    """Hash of a text's words, insensitive to case and whitespace."""
+    return hashlib.blake2b(" ".join(_WORD.findall(text.lower())).encode(), digest_size=16).hexdigest()
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64-bit simhash of a text's word shingles; near-duplicate texts differ in few bits."""
+    words = _WORD.findall(text.lower())
+    if len(words) < shingle:
+        words = words + [""] * (shingle - len(words))
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(" ".join(words[start : start + shingle]).encode(), digest_size=8).digest(), "big")
+            for start in range(len(words) - shingle + 1)
+        ),
+        dtype=np.uint64,
+    )
+    # Bit b is set if most shingle hashes have it set
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    majority = bits.sum(axis=0) * 2 > len(hashes)
+    return sum(1 << bit for bit in np.flatnonzero(majority).tolist())
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def normalise_url(url: str) -> str:
+    return urldefrag(url.strip())[0]
+
+
+class URLIndex:
+    """
+    SQLite-backed map of ingested URL -> (content hash, simhash, fetch time).
+
+    Simhashes are also kept in memory split in `max_distance + 1` bands: two hashes
+    within `max_distance` bits of each other share at least one band, so near-duplicates
+    are found by looking up that many buckets instead of comparing with every page.
+    """
+
+    def __init__(self, path: str = "./chroma_db/urls.sqlite3", max_distance: int = 3):
+        """
+        Args:
+            path (str): SQLite file holding the index
+            max_distance (int): Largest simhash distance `near_duplicate` can search for, more bands are looked up for larger ones
+        """
+        if not 0 <= max_distance < 64:
+            raise ValueError(f"max_distance must be between 0 and 63, got {max_distance}")
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = 64 // bands
+        # (shift, mask) per band, the last one takes the bits left over
+        self._band_keys = [(band * width, (1 << width) - 1) for band in range(bands - 1)]
+        self._band_keys.append(((bands - 1) * width, (1 << (64 - (bands - 1) * width)) - 1))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                simhash INTEGER NOT NULL,
+                fetched REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS urls_hash ON urls (hash);
+            """
+        )
+        self._conn.commit()
+        self._bands: List[Dict[int, Set[str]]] = [{} for _ in self._band_keys]
+        self._simhashes: Dict[str, int] = {}
+        for url, value in self._conn.execute("SELECT url, simhash FROM urls"):
+            self._index(url, value & (1 << 64) - 1)  # Stored signed
+
+    def _unindex(self, url: str) -> None:
+        previous = self._simhashes.pop(url, None)
+        if previous is not None:
+            for (shift, mask), buckets in zip(self._band_keys, self._bands):
+                buckets.get(previous >> shift & mask, set()).discard(url)
+
+    def _index(self, url: str, value: int) -> None:
+        self._unindex(url)
+        self._simhashes[url] = value
+        for (shift, mask), buckets in zip(self._band_keys, self._bands):
+            buckets.setdefault(value >> shift & mask, set()).add(url)
+
+    def get(self, url: str) -> Optional[Tuple[str, float]]:
+        """(content hash, fetch time) of a URL, if it was ingested."""
+        with self._lock:
+            return self._conn.execute("SELECT hash, fetched FROM urls WHERE url = ?", (url,)).fetchone()
+
+    def with_hash(self, digest: str, exclude: str) -> Optional[str]:
+        """Another URL whose text has this content hash."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url FROM urls WHERE hash = ? AND url != ? LIMIT 1", (digest, exclude)
+            ).fetchone()
+        return row[0] if row else None
+
+    def near_duplicate(self, value: int, exclude: str, max_distance: int = 3) -> Optional[str]:
+        """
+        Another URL whose simhash is within `max_distance` bits.
+
+        Raises:
+            ValueError: If `max_distance` is larger than the index's, the bands could miss matches
+        """
+        if max_distance > self.max_distance:
+            raise ValueError(
+                f"max_distance {max_distance} is larger than the {self.max_distance} this index was built for"
+            )
+        with self._lock:
+            for (shift, mask), buckets in zip(self._band_keys, self._bands):
+                for url in buckets.get(value >> shift & mask, ()):
+                    if url != exclude and hamming(self._simhashes[url], value) <= max_distance:
+                        return url
+        return None
+
+    def put(self, url: str, digest: str, value: int) -> None:
+        signed = value - (1 << 64) if value >= 1 << 63 else value
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, hash, simhash, fetched) VALUES (?, ?, ?, ?)",
+                (url, digest, signed, time.time()),
+            )
+            self._index(url, value)
+
+    def touch(self, url: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE urls SET fetched = ? WHERE url = ?", (time.time(), url))
+
+    def delete(self, url: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM urls WHERE url = ?", (url,))
+            self._unindex(url)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class URLIngestionReport:
+    """Outcome of ingesting a set of URLs."""
+
+    requested: int = 0
+    fetched: int = 0
+    ingested: int = 0
+    chunks: int = 0
+    unchanged: int = 0  # Fetched recently, or the same text as last time
+    duplicates: int = 0  # Same text as another URL
+    near_duplicates: int = 0
+    skipped: int = 0  # Not text, or too little text
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+    ingested_urls: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class WebIngestor:
+    """
+    Fetches URLs into a KnowledgeBase, deduplicated by content.
+
+    `ingest`/`aingest` process a list of URLs and return a report. `submit`
+    queues URLs for a background worker that ingests them in batches, for
+    callers that mustn't wait, like the Orchestrator after a web search.
+
+    Example:
+        ingestor = WebIngestor(kb)
+        report = ingestor.ingest(["https://example.org/a", "https://example.org/b"])
+    """
+
+    def __init__(
+        self,
+        knowledge_base,
+        index: Optional[URLIndex] = None,
+        max_concurrency: int = 16,
+        per_host: int = 2,
+        timeout: float = 15.0,
+        max_bytes: int = 5 * 1024 * 1024,
+        min_chars: int = 200,
+        near_duplicate_bits: int = 3,
+        refetch_after: Optional[float] = 24 * 3600.0,
+        batch_size: int = 32,
+        flush_interval: float = 1.0,
+        max_queue: int = 1000,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        Args:
+            knowledge_base (KnowledgeBase): Where the pages go
+            index (Optional[URLIndex]): Hashes of ingested pages, next to the knowledge base by default
+            max_concurrency (int): Pages fetched at once
+            per_host (int): Pages fetched at once from the same host
+            timeout (float): Seconds per page
+            max_bytes (int): Larger pages are cut off
+            min_chars (int): Pages with less main text are skipped
+            near_duplicate_bits (int): Simhash distance up to which a page counts as a near-duplicate, -1 to disable. At most the index's `max_distance`
+            refetch_after (Optional[float]): Seconds before an ingested URL is fetched again, None to always refetch
+            batch_size (int): URLs the background worker ingests together
+            flush_interval (float): Seconds the background worker waits to fill a batch
+            max_queue (int): URLs queued for the background worker before new ones are dropped
+            transport (Optional[httpx.AsyncBaseTransport]): HTTP transport, for tests and benchmarks
+        """
+        self.knowledge_base = knowledge_base
+        self.index = index or URLIndex(max_distance=max(3, near_duplicate_bits))
+        if near_duplicate_bits > self.index.max_distance:
+            raise ValueError(
+                f"near_duplicate_bits {near_duplicate_bits} is larger than the index's max_distance {self.index.max_distance}"
+            )
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.min_chars = min_chars
+        self.near_duplicate_bits = near_duplicate_bits
+        self.refetch_after = refetch_after
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.transport = transport
+        self.stats = {"submitted": 0, "dropped": 0, "ingested": 0, "duplicates": 0, "failed": 0}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._close_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def _count(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    async def _fetch(
+        self, client: httpx.AsyncClient, url: str, limit: asyncio.Semaphore, hosts: Dict[str, asyncio.Semaphore]
+    ) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+        """(url, content type, body, error) of one page, within the global and per-host limits."""
+        host = urlsplit(url).netloc.lower()
+        host_limit = hosts.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with limit, host_limit:
+            with span("web.fetch", host=host) as fetch_span:
+                try:
+                    async with client.stream("GET", url) as response:
+                        fetch_span.set(status=response.status_code)
+                        if response.status_code >= 400:
+                            return url, None, None, f"HTTP {response.status_code}"
+                        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                        if content_type and content_type not in TEXT_TYPES:
+                            return url, content_type, None, None
+                        body = bytearray()
+                        async for chunk in response.aiter_bytes():
+                            body += chunk
+                            if len(body) >= self.max_bytes:
+                                break
+                        fetch_span.set(response_bytes=len(body))
+                        return url, content_type or "text/html", body.decode(response.encoding or "utf-8", errors="replace"), None
+                except httpx.HTTPError as e:
+                    return url, None, None, f"{type(e).__name__}: {e}"
+
+    def _select(
+        self, pages: List[Tuple[str, Optional[str], Optional[str], Optional[str]]], report: URLIngestionReport
+    ) -> Tuple[List[Tuple[str, str, Dict]], List[Tuple[str, str, int]]]:
+        """Extract the pages' text and keep the pages that aren't duplicates, as documents to ingest."""
+        documents = []
+        accepted: List[Tuple[str, str, int]] = []
+        for url, content_type, body, error in pages:
+            if error:
+                report.errors.append(f"{url}: {error}")
+                continue
+            report.fetched += 1
+            if body is None:
+                report.skipped += 1
+                continue
+            if content_type == "text/plain":
+                title, text = "", body.strip()
+            else:
+                title, text = extract_main_text(body)
+            if len(text) < self.min_chars:
+                report.skipped += 1
+                continue
+            digest = content_hash(text)
+            known = self.index.get(url)
+            if known and known[0] == digest:
+                self.index.touch(url)
+                report.unchanged += 1
+                continue
+            if self.index.with_hash(digest, exclude=url) or any(digest == other for _, other, _ in accepted):
+                report.duplicates += 1
+                continue
+            fingerprint = simhash(text)
+            if self.near_duplicate_bits >= 0 and (
+                self.index.near_duplicate(fingerprint, exclude=url, max_distance=self.near_duplicate_bits)
+                or any(hamming(fingerprint, other) <= self.near_duplicate_bits for _, _, other in accepted)
+            ):
+                report.near_duplicates += 1
+                continue
+            accepted.append((url, digest, fingerprint))
+            documents.append(
+                (url, text, {"title": title[:300], "url": url, "extension": ".html", "fetched": time.time()})
+            )
+        return documents, accepted
+
+    async def aingest(self, urls: Iterable[str]) -> URLIngestionReport:
+        """
+        Fetch, extract, deduplicate and embed pages.
+
+        Args:
+            urls (Iterable[str]): Pages to ingest; fragments are ignored and repeats fetched once
+
+        Returns:
+            URLIngestionReport: What happened to the pages, and the URLs that were ingested
+        """
+        started = time.perf_counter()
+        report = URLIngestionReport()
+        urls = list(dict.fromkeys(normalise_url(url) for url in urls if url and url.strip()))
+        report.requested = len(urls)
+        to_fetch = []
+        for url in urls:
+            if urlsplit(url).scheme not in ("http", "https"):
+                report.errors.append(f"{url}: not an http(s) URL")
+                continue
+            known = self.index.get(url)
+            if known and self.refetch_after is not None and time.time() - known[1] < self.refetch_after:
+                report.unchanged += 1
+            else:
+                to_fetch.append(url)
+
+        with span("web.ingest", urls=len(to_fetch)) as ingest_span:
+            limit = asyncio.Semaphore(self.max_concurrency)
+            hosts: Dict[str, asyncio.Semaphore] = {}
+            async with httpx.AsyncClient(
+                transport=self.transport,
+                timeout=self.timeout,
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(max_connections=self.max_concurrency),
+            ) as client:
+                pages = await asyncio.gather(*(self._fetch(client, url, limit, hosts) for url in to_fetch))
+
+            # Extraction and hashing are CPU-bound, keep them off the event loop
+            documents, accepted = await asyncio.to_thread(self._select, pages, report)
+
+            if documents:
+                ingestion = await asyncio.to_thread(self.knowledge_base.pipeline.ingest_texts, documents)
+                report.errors.extend(ingestion.errors)
+                report.chunks = ingestion.chunks
+                for url, digest, fingerprint in accepted:
+                    if url not in ingestion.failed:
+                        self.index.put(url, digest, fingerprint)
+                        report.ingested_urls.append(url)
+                report.ingested = len(report.ingested_urls)
+                self.knowledge_base._notify(report.ingested_urls, added=True)
+            ingest_span.set(
+                ingested=report.ingested,
+                duplicates=report.duplicates + report.near_duplicates,
+                errors=len(report.errors),
+            )
+        report.seconds = time.perf_counter() - started
+        self._count(
+            ingested=report.ingested,
+            duplicates=report.duplicates + report.near_duplicates,
+            failed=len(report.errors),
+        )
+        return report
+
+    def ingest(self, urls: Iterable[str]) -> URLIngestionReport:
+        """Blocking `aingest`, for callers without an event loop."""
+        return asyncio.run(self.aingest(urls))
+
+    def submit(self, urls: Iterable[str]) -> int:
+        """
+        Queue URLs for background ingestion and return at once.
+
+        Returns:
+            int: URLs queued; repeats of queued URLs and URLs over the queue limit are left out
+        """
+        self._start()
+        queued = 0
+        for url in urls:
+            url = normalise_url(url or "")
+            if not url.startswith(("http://", "https://")):
+                continue
+            with self._lock:
+                if url in self._pending:
+                    continue
+                self._pending.add(url)
+            try:
+                self._queue.put_nowait(url)
+                queued += 1
+            except queue.Full:
+                with self._lock:
+                    self._pending.discard(url)
+                self._count(dropped=1)
+        self._count(submitted=queued)
+        return queued
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every submitted URL has been processed.
+
+        Returns:
+            bool: False if `timeout` expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Ingest what is queued (up to `timeout`), then stop the worker."""
+        with self._close_lock:
+            worker = self._worker
+            if worker is None:
+                return
+            self.flush(timeout)
+            self._queue.put(_STOP)
+            worker.join(timeout)
+            # Cleared only now, so a `submit` during the flush can't start a second worker
+            with self._lock:
+                self._worker = None
+
+    def _start(self) -> None:
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="web-ingestion", daemon=True)
+                self._worker.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                report = asyncio.run(self.aingest(batch))
+                logger.info(
+                    "Ingested %d of %d search sources (%d duplicates, %d errors)",
+                    report.ingested,
+                    len(batch),
+                    report.duplicates + report.near_duplicates,
+                    len(report.errors),
+                )
+            except Exception:
+                logger.exception("Background URL ingestion failed")
+            finally:
+                with self._lock:
+                    self._pending.difference_update(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
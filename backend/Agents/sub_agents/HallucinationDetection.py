@@ -2,46 +2,303 @@
 
 # https://github.com/open-llm-lab/deepeval
 
-from deepeval.metrics import (
-    ContextualPrecisionMetric,
-    ContextualRecallMetric,
-    ContextualRelevancyMetric
-)
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-contextual_precision = ContextualPrecisionMetric()
-contextual_recall = ContextualRecallMetric()
-contextual_relevancy = ContextualRelevancyMetric()
+from backend.setup.Gateway import DEFAULT_BASE_URL, LLMGateway, get_gateway
+from backend.setup.Tracing import span
 
+try:
+  import fcntl
+except ImportError:  # Windows: O_APPEND writes of one line are still atomic enough for a local store
+  fcntl = None
 
-from deepeval.test_case import LLMTestCase
+logger = logging.getLogger(__name__)
+
+
+## Off the request path hallucination scoring
+# The Orchestrator submits (query, answer, retrieval context) triples and returns
+# immediately. A background worker scores them in batches with bounded concurrency,
+# and the low scoring ones are appended to a JSONL store that the fine-tuning job reads.
+# With a `judge_model` each case holds a background slot of that model in the LLM gateway,
+# so scoring waits until the judge is loaded instead of swapping out the agent's model.
+# The metric itself judges with the model deepeval is configured with.
+
+
+@dataclass
+class HallucinationCase:
+  query: str
+  answer: str
+  retrieval_context: List[str]
+  session_id: Optional[str] = None
+  submitted: float = field(default_factory=time.time)
+
+
+def faithfulness_metric(threshold: float = 0.5):
+  """Default metric: is the answer supported by the retrieval context. Needs no expected output."""
+  from deepeval.metrics import FaithfulnessMetric
+
+  return FaithfulnessMetric(threshold=threshold, async_mode=False)
+
+
+class HallucinationStore:
+  """
+  Append-only JSONL file of low scoring cases, one compact line per case.
+
+  Each batch is written with a single `write` on an O_APPEND descriptor while
+  holding an exclusive `flock`, so concurrent writers (threads or processes) never
+  interleave lines.
+  """
+
+  def __init__(self, path: str = "./hallucinations/cases.jsonl"):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self.path = path
+
+  def append(self, records: List[Dict]) -> None:
+    if not records:
+      return
+    data = "".join(
+      json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records
+    ).encode()
+    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+      if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+      view = memoryview(data)
+      while view:
+        view = view[os.write(fd, view):]
+    finally:
+      if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+      os.close(fd)
+
+  def __iter__(self) -> Iterator[Dict]:
+    """Stored cases, oldest first. A line cut short by a crash is skipped."""
+    if not os.path.exists(self.path):
+      return
+    with open(self.path, encoding="utf-8") as f:
+      for line in f:
+        try:
+          yield json.loads(line)
+        except json.JSONDecodeError:
+          continue
+
+
+_STOP = object()
 
 
 class HallucinationDetection:
-  def __init__(self):
-    pass
-
-  def percentage_hallucination(self, query: str, text: str, rag: str) -> float:
-    test_case = LLMTestCase(
-      input=query,
-      actual_output=text,
-      retrieval_context=rag,
-    )
-
-    
-    print("Score: ", contextual_precision.score)
-    print("Reason: ", contextual_precision.reason)
-    
-    if contextual_precision.score < 0.5:
+  """
+  Scores answers against their retrieval context without blocking the caller.
+
+  `submit` enqueues a case and returns at once. A worker thread drains the queue
+  in batches of up to `batch_size` (or whatever arrived within `flush_interval`)
+  and scores each batch on `max_concurrency` threads. Cases scoring below
+  `threshold` are appended to `store`. When the queue is full new cases are
+  dropped and counted rather than slowing down the request.
+  """
+
+  def __init__(
+    self,
+    threshold: float = 0.5,
+    batch_size: int = 8,
+    max_concurrency: int = 4,
+    max_queue: int = 1000,
+    flush_interval: float = 1.0,
+    store: Optional[HallucinationStore] = None,
+    metric_factory: Optional[Callable[[float], object]] = None,
+    judge_model: Optional[str] = None,
+    gateway: Optional[LLMGateway] = None,
+  ):
+    """
+    Args:
+      threshold (float): Cases scoring below this are stored
+      batch_size (int): Maximum number of cases scored together
+      max_concurrency (int): Cases scored at the same time, i.e. concurrent judge LLM calls
+      max_queue (int): Pending cases kept before new ones are dropped
+      flush_interval (float): Seconds the worker waits to fill a batch
+      store (Optional[HallucinationStore]): Where low scoring cases go, ./hallucinations/cases.jsonl by default
+      metric_factory (Optional[Callable]): Builds a deepeval-style metric (`measure`, `score`, `reason`) from the threshold, FaithfulnessMetric by default
+      judge_model (Optional[str]): Ollama model to reserve a background gateway slot of while a case is scored, so scoring waits until it is loaded. It is not passed to the metric, configure deepeval to judge with the same model
+      gateway (Optional[LLMGateway]): Gateway holding the judge's slots, the process-wide one for the default URL if None
+    """
+    self.threshold = threshold
+    self.batch_size = batch_size
+    self.max_concurrency = max_concurrency
+    self.flush_interval = flush_interval
+    self.store = store or HallucinationStore()
+    self.metric_factory = metric_factory or faithfulness_metric
+    self.judge_model = judge_model
+    self.gateway = gateway
+    self.stats = {"submitted": 0, "dropped": 0, "scored": 0, "failed": 0, "stored": 0}
+    self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+    self._lock = threading.Lock()
+    self._close_lock = threading.Lock()
+    self._worker: Optional[threading.Thread] = None
+    self._pool: Optional[ThreadPoolExecutor] = None
+
+  def submit(
+    self,
+    query: str,
+    answer: str,
+    retrieval_context: Union[str, List[str]],
+    session_id: Optional[str] = None,
+  ) -> bool:
+    """
+    Queue a case for scoring. Never blocks.
+
+    Returns:
+      bool: False if the queue was full and the case was dropped
+    """
+    if isinstance(retrieval_context, str):
+      retrieval_context = [retrieval_context]
+    self._start()
+    try:
+      self._queue.put_nowait(HallucinationCase(query, answer, retrieval_context, session_id))
+    except queue.Full:
+      self._count("dropped")
+      return False
+    self._count("submitted")
+    return True
+
+  def score(self, case: HallucinationCase) -> Tuple[float, Optional[str]]:
+    """Score one case synchronously, returning (score, reason)."""
+    from deepeval.test_case import LLMTestCase
+
+    with span("hallucination.score", request_bytes=len(case.answer) + sum(map(len, case.retrieval_context))) as score_span:
+      metric = self.metric_factory(self.threshold)  # metrics keep their result on the instance, one per case
+      metric.measure(
+        LLMTestCase(
+          input=case.query,
+          actual_output=case.answer,
+          retrieval_context=case.retrieval_context,
+        )
+      )
+      score_span.set(score=metric.score)
+    return metric.score, getattr(metric, "reason", None)
+
+  def percentage_hallucination(self, query: str, text: str, rag: Union[str, List[str]]) -> float:
+    """Blocking scoring of one answer, storing it if it scores below the threshold."""
+    case = HallucinationCase(query, text, [rag] if isinstance(rag, str) else rag)
+    score, reason = self.score(case)
+    logger.debug("Score: %s", score)
+    logger.debug("Reason: %s", reason)
+    if score < self.threshold:
       ## really bad ones, we train these in the background when the user isn't using the app
-      
-      import os
-      os.makedirs("hallucinations", exist_ok=True)
-      with open("hallucinations/query.txt", "w") as f:
-        f.write(query)
-      with open("hallucinations/text.txt", "w") as f:
-        f.write(text)
-      with open("hallucinations/rag.txt", "w") as f:
-        f.write(rag)
+      self.store.append([self._record(case, score, reason)])
+    return score
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
+    """
+    Wait until every submitted case has been scored.
+
+    Returns:
+      bool: False if `timeout` expired first
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while self._queue.unfinished_tasks:
+      if deadline is not None and time.monotonic() >= deadline:
+        return False
+      time.sleep(0.05)
+    return True
+
+  def close(self, timeout: Optional[float] = 10.0) -> None:
+    """Score what is queued (up to `timeout`), then stop the worker."""
+    with self._close_lock:
+      worker = self._worker
+      if worker is None:
+        return
+      self.flush(timeout)
+      self._queue.put(_STOP)
+      worker.join(timeout)
+      self._pool.shutdown(wait=False, cancel_futures=True)
+      # Cleared only now, so a `submit` during the flush can't start a second worker
+      with self._lock:
+        self._worker = None
+
+  def _start(self) -> None:
+    if self._worker is not None:
+      return
+    with self._lock:
+      if self._worker is None:
+        self._pool = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="hallucination")
+        self._worker = threading.Thread(target=self._run, name="hallucination-batches", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+  def _count(self, name: str, n: int = 1) -> None:
+    with self._lock:
+      self.stats[name] += n
+
+  def _run(self) -> None:
+    while True:
+      item = self._queue.get()
+      if item is _STOP:
+        self._queue.task_done()
+        return
+      batch = [item]
+      stop = False
+      deadline = time.monotonic() + self.flush_interval
+      while len(batch) < self.batch_size:
+        try:
+          item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+          break
+        if item is _STOP:
+          stop = True
+          break
+        batch.append(item)
+      try:
+        self._score_batch(batch)
+      finally:
+        for _ in batch:
+          self._queue.task_done()
+      if stop:
+        self._queue.task_done()
+        return
+
+  def _score_batch(self, batch: List[HallucinationCase]) -> None:
+    def safe_score(case):
+      try:
+        with self._judge_slot():
+          return self.score(case)
+      except Exception as e:
+        logger.warning("Hallucination scoring failed: %s", e)
+        return None
 
+    with span("hallucination.batch", cases=len(batch)):
+      results = list(self._pool.map(safe_score, batch))
+      low = []
+      for case, result in zip(batch, results):
+        if result is None:
+          self._count("failed")
+          continue
+        self._count("scored")
+        score, reason = result
+        if score is not None and score < self.threshold:
+          low.append(self._record(case, score, reason))
+      try:
+        self.store.append(low)
+        self._count("stored", len(low))
+      except OSError as e:
+        logger.error("Could not store hallucinations: %s", e)
 
+  def _judge_slot(self):
+    """A background slot of the judge model, so batches don't force it in while the agents run."""
+    if self.judge_model is None:
+      return nullcontext()
+    gateway = self.gateway or get_gateway(DEFAULT_BASE_URL)
+    return gateway.hold(self.judge_model, background=True)
 
+  @staticmethod
+  def _record(case: HallucinationCase, score: float, reason: Optional[str]) -> Dict:
+    return {**asdict(case), "score": score, "reason": reason}
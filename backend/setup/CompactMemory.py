@@ -0,0 +1,211 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from atomic_agents.lib.base.base_io_schema import BaseIOSchema
+from atomic_agents.lib.components.agent_memory import AgentMemory
+
+
+## Token-budgeted memory for long Orchestrator sessions
+# Prompt processing dominates latency on local Ollama, so the history sent to the model
+# is kept under a fixed token budget: large tool payloads are moved out of band and
+# referenced by handle, and the oldest turns are folded into a running summary.
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English and JSON)."""
+    return len(text) // 4 + 1
+
+
+class PayloadStore:
+    """Bounded in-process store for large tool payloads, addressed by content handle."""
+
+    def __init__(self, max_payloads: int = 256):
+        self.max_payloads = max_payloads
+        self._payloads: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, payload: str) -> str:
+        handle = hashlib.sha1(payload.encode()).hexdigest()[:12]
+        with self._lock:
+            self._payloads[handle] = payload
+            self._payloads.move_to_end(handle)
+            while len(self._payloads) > self.max_payloads:
+                self._payloads.popitem(last=False)
+        return handle
+
+    def get(self, handle: str) -> Optional[str]:
+        with self._lock:
+            return self._payloads.get(handle)
+
+
+def _preview(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " …"
+
+
+def extractive_summary(previous: str, texts: List[str], max_chars: int = 2000) -> str:
+    """
+    Default summarizer: one line with the opening of each evicted message, no LLM call.
+
+    The oldest lines are dropped once the summary exceeds `max_chars`.
+    """
+    lines = previous.splitlines() if previous else []
+    lines += [f"- {_preview(' '.join(text.split()), 200)}" for text in texts]
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class CompactMemory(AgentMemory):
+    """
+    AgentMemory that keeps the prompt under `max_tokens`.
+
+    The `keep_recent` newest messages are always kept verbatim. Older messages
+    first have their large string fields replaced by a preview plus a
+    `[payload:<handle>]` reference into `payloads`. If the history is still over
+    budget, the oldest messages are evicted into a running summary that is sent
+    as the first history message.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4000,
+        keep_recent: int = 4,
+        payload_chars: int = 1500,
+        summarizer: Optional[Callable[[str, List[str]], str]] = None,
+        payloads: Optional[PayloadStore] = None,
+        max_messages: Optional[int] = None,
+    ):
+        """
+        Args:
+            max_tokens (int): Token budget of the history sent to the model
+            keep_recent (int): Number of newest messages never compacted
+            payload_chars (int): String fields longer than this are moved out of band once old
+            summarizer (Optional[Callable]): Folds evicted message texts into the previous summary, defaults to `extractive_summary`
+            payloads (Optional[PayloadStore]): Where large payloads go, a new store by default
+            max_messages (Optional[int]): Hard cap on the number of messages, as in AgentMemory
+        """
+        super().__init__(max_messages=max_messages)
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.payload_chars = payload_chars
+        self.summarizer = summarizer or extractive_summary
+        self.payloads = payloads or PayloadStore()
+        self.summary = ""
+
+    def total_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(message.content.model_dump_json()) for message in self.history
+        )
+
+    def _offload(self, content: BaseIOSchema) -> BaseIOSchema:
+        """Replace large string fields with a preview and a payload handle."""
+        updates = {}
+        for field_name in content.__class__.model_fields:
+            value = getattr(content, field_name)
+            if isinstance(value, str) and len(value) > self.payload_chars:
+                handle = self.payloads.put(value)
+                updates[field_name] = (
+                    f"{_preview(value, self.payload_chars // 4)} [payload:{handle}]"
+                )
+        return content.model_copy(update=updates) if updates else content
+
+    def _manage_overflow(self) -> None:
+        super()._manage_overflow()
+        if self.total_tokens() <= self.max_tokens:
+            return
+
+        old = max(0, len(self.history) - self.keep_recent)
+        for i in range(old):
+            message = self.history[i]
+            compacted = self._offload(message.content)
+            if compacted is not message.content:
+                self.history[i] = message.model_copy(update={"content": compacted})
+        if self.total_tokens() <= self.max_tokens:
+            return
+
+        evicted = []
+        while len(self.history) > self.keep_recent and self.total_tokens() > self.max_tokens:
+            message = self.history.pop(0)
+            evicted.append(f"{message.role}: {self._text(message.content)}")
+        if evicted:
+            self.summary = self.summarizer(self.summary, evicted)
+
+    @staticmethod
+    def _text(content: BaseIOSchema) -> str:
+        """Flatten a schema to its string fields, e.g. chat_message or reasoning."""
+        parts = [
+            value
+            for value in (getattr(content, name) for name in content.__class__.model_fields)
+            if isinstance(value, str)
+        ]
+        return " ".join(parts) if parts else content.model_dump_json()
+
+    def get_history(self) -> List[Dict]:
+        history = super().get_history()
+        if self.summary:
+            history.insert(
+                0,
+                {"role": "system", "content": [f"Summary of the earlier conversation:\n{self.summary}"]},
+            )
+        return history
+
+    def get_compact_history(self, max_tokens: int = 1000, max_chars: int = 500) -> List[Dict]:
+        """
+        A short plain-text history for tools such as WebSearch.
+
+        Newest messages are kept first until `max_tokens` is reached, each cut to `max_chars`.
+
+        Returns:
+            List[Dict]: Messages as {"role", "content"} with string content, oldest first
+        """
+        history = []
+        budget = max_tokens
+        for message in reversed(self.history):
+            text = _preview(self._text(message.content), max_chars)
+            budget -= estimate_tokens(text)
+            if budget < 0:
+                break
+            history.append({"role": message.role, "content": text})
+        history.reverse()
+        return history
+
+    def format_tool_result(self, tool_name: str, output: BaseIOSchema, max_chars: int = 4000) -> str:
+        """
+        Format a tool output for the agent, storing the full payload out of band when it is large.
+        """
+        payload = output.model_dump_json()
+        if len(payload) <= max_chars:
+            return f"Tool {tool_name} returned: {payload}"
+        handle = self.payloads.put(payload)
+        compact = _truncate_strings(json.loads(payload), max_chars // 8)
+        return f"Tool {tool_name} returned (truncated, full result [payload:{handle}]): {_preview(json.dumps(compact), max_chars)}"
+
+    def copy(self) -> "CompactMemory":
+        new_memory = CompactMemory(
+            max_tokens=self.max_tokens,
+            keep_recent=self.keep_recent,
+            payload_chars=self.payload_chars,
+            summarizer=self.summarizer,
+            payloads=self.payloads,
+            max_messages=self.max_messages,
+        )
+        new_memory.load(self.dump())
+        new_memory.current_turn_id = self.current_turn_id
+        new_memory.summary = self.summary
+        return new_memory
+
+
+def _truncate_strings(value, max_chars: int):
+    """Cut every string inside a JSON value, e.g. each document's pageContent."""
+    if isinstance(value, str):
+        return _preview(value, max_chars)
+    if isinstance(value, list):
+        return [_truncate_strings(item, max_chars) for item in value]
+    if isinstance(value, dict):
+        return {key: _truncate_strings(item, max_chars) for key, item in value.items()}
+    return value
@@ -0,0 +1,64 @@
+from typing import Any, Dict, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+## Events streamed by Orchestrator.astream
+# Serialised as JSON with a `type` discriminator for the SSE / WebSocket endpoints.
+
+
+class ReasoningDelta(BaseModel):
+    """New reasoning text from the agent, as it is generated."""
+
+    type: Literal["reasoning"] = "reasoning"
+    iteration: int = Field(..., description="Agent turn the text belongs to")
+    delta: str = Field(..., description="Text appended since the previous event")
+
+
+class ToolStarted(BaseModel):
+    """A tool call was dispatched."""
+
+    type: Literal["tool_started"] = "tool_started"
+    iteration: int
+    call_id: str = Field(..., description="Identifies the call across started/finished events")
+    tool: str
+    parameters: Dict[str, Any]
+    speculative: bool = Field(False, description="Started while the model was still writing its turn")
+
+
+class ToolFinished(BaseModel):
+    """A tool call returned, failed or timed out."""
+
+    type: Literal["tool_finished"] = "tool_finished"
+    iteration: int
+    call_id: str
+    tool: str
+    duration: float = Field(..., description="Wall time of the call in seconds")
+    output: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class FinalAnswer(BaseModel):
+    """The agent's answer. Always the last event of a stream."""
+
+    type: Literal["final_answer"] = "final_answer"
+    answer: str
+    completed: bool = Field(
+        ..., description="False if the agent stopped at max_iterations before it was done"
+    )
+    cached: bool = Field(
+        False, description="The answer of a similar earlier question, from the semantic answer cache"
+    )
+
+
+class StreamError(BaseModel):
+    """The query could not be completed, e.g. because the server is overloaded. Ends the stream."""
+
+    type: Literal["error"] = "error"
+    message: str
+    retry_after: Optional[float] = Field(
+        None, description="Seconds after which retrying is likely to succeed, if the error is transient"
+    )
+
+
+OrchestratorEvent = Union[ReasoningDelta, ToolStarted, ToolFinished, FinalAnswer, StreamError]
@@ -0,0 +1,552 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from backend.setup.ModelScheduler import ModelScheduler, native_url
+from backend.setup.Tracing import current_span
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI  # Imported when the first client is built, it takes a second
+
+
+## Client-side gateway in front of the local LLM server
+# Every OpenAI-compatible client built by the gateway sends its HTTP requests through
+# one private event loop, where they are:
+#  - coalesced: an identical request (same endpoint, same JSON body) already in flight is
+#    not sent again, the new caller reads the same response, streamed or not
+#  - micro-batched: embedding requests for the same model arriving within `batch_window`
+#    seconds go out as one request with all their inputs
+#  - capped per model: at most `model_limits[model]` requests of a model reach the server
+#    at once, the rest wait in the gateway instead of inside Ollama
+#  - grouped by model: with OLLAMA_MAX_LOADED_MODELS set, requests of models that aren't
+#    loaded wait until their model is swapped in (ModelScheduler.py), and background
+#    clients' requests wait until their model is loaded anyway
+# Work that loads a model outside these clients (Perplexica searches, deepeval judges) can
+# hold a model slot with `hold`/`ahold`, so it counts against the same cap.
+
+DEFAULT_BASE_URL = "http://127.0.0.1:11434/v1"
+PRIORITY_HEADER = "x-gateway-priority"
+
+_gateways: Dict[str, "LLMGateway"] = {}
+_lock = threading.Lock()
+
+
+class _Shared:
+    """
+    One upstream response, pushed to every caller that sent the same request.
+
+    Each caller subscribes with a `push` callable that hands items over to its own
+    thread or loop: the response's chunks in order, then None at the end or the
+    exception the upstream request failed with. A caller joining late is sent the
+    chunks received so far first.
+    """
+
+    def __init__(self):
+        self.head: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.head.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.listeners: List[Callable] = []
+        self.task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def complete(cls, status: int, headers: List[Tuple[str, str]], body: bytes) -> "_Shared":
+        shared = cls()
+        shared.head.set_result((status, headers))
+        shared.chunks.append(body)
+        shared.done = True
+        return shared
+
+    def subscribe(self, push: Callable) -> None:
+        for chunk in self.chunks:
+            push(chunk)
+        if self.done:
+            push(self.error)
+        else:
+            self.listeners.append(push)
+
+    def feed(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        for push in self.listeners:
+            push(chunk)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        for push in self.listeners:
+            push(error)
+        self.listeners = []
+
+    def release(self, push: Callable) -> None:
+        """A caller stopped reading. The upstream request is cancelled once nobody reads it."""
+        if push in self.listeners:
+            self.listeners.remove(push)
+        if not self.listeners and not self.done and self.task is not None:
+            self.task.cancel()
+
+
+class _Hold:
+    """A model slot held for work the gateway doesn't see. Both methods run on the gateway loop."""
+
+    def __init__(self, gateway: "LLMGateway", model: str, background: bool = False):
+        self.gateway = gateway
+        self.model = model
+        self.background = background
+        self.acquired = False
+        self.released = False
+
+    async def acquire(self) -> None:
+        await self.gateway._acquire(self.model, background=self.background)
+        if self.released:  # The caller gave up while waiting
+            self.gateway._release(self.model)
+        else:
+            self.acquired = True
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            if self.acquired:
+                self.gateway._release(self.model)
+
+
+class _Batch:
+    def __init__(self, url: str, headers: List[Tuple[str, str]], params: Dict):
+        self.url = url
+        self.headers = headers
+        self.params = params
+        self.entries: List[Tuple[List, asyncio.Future]] = []
+        self.size = 0
+        self.sending = False
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class _AsyncStream(httpx.AsyncByteStream):
+    def __init__(self, gateway: "LLMGateway", shared: _Shared, queue: asyncio.Queue, push: Callable):
+        self.gateway = gateway
+        self.shared = shared
+        self.queue = queue
+        self.push = push
+        self.closed = False
+
+    async def __aiter__(self):
+        while (item := await self.queue.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    async def aclose(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.gateway._loop.call_soon_threadsafe(self.shared.release, self.push)
+
+
+class _SyncStream(httpx.SyncByteStream):
+    def __init__(self, gateway: "LLMGateway", shared: _Shared, queue: "queue.SimpleQueue", push: Callable):
+        self.gateway = gateway
+        self.shared = shared
+        self.queue = queue
+        self.push = push
+        self.closed = False
+
+    def __iter__(self):
+        while (item := self.queue.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.gateway._loop.call_soon_threadsafe(self.shared.release, self.push)
+
+
+class _AsyncGatewayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, gateway: "LLMGateway"):
+        self.gateway = gateway
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+
+        def push(item):
+            loop.call_soon_threadsafe(items.put_nowait, item)
+
+        shared, status, headers, joined = await self.gateway._acall(
+            self.gateway._open(
+                request.method, str(request.url), request.headers.multi_items(), body,
+                request.extensions.get("timeout"), push,
+            )
+        )
+        if joined:
+            current_span().add(coalesced=1)
+        return httpx.Response(status, headers=headers, stream=_AsyncStream(self.gateway, shared, items, push))
+
+
+class _SyncGatewayTransport(httpx.BaseTransport):
+    def __init__(self, gateway: "LLMGateway"):
+        self.gateway = gateway
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        items = queue.SimpleQueue()
+        shared, status, headers, joined = self.gateway._call(
+            self.gateway._open(
+                request.method, str(request.url), request.headers.multi_items(), body,
+                request.extensions.get("timeout"), items.put,
+            )
+        )
+        if joined:
+            current_span().add(coalesced=1)
+        return httpx.Response(status, headers=headers, stream=_SyncStream(self.gateway, shared, items, items.put))
+
+
+class LLMGateway:
+    """
+    Coalesces, micro-batches and caps the requests of every client it builds.
+
+    The gateway runs its own event loop on a daemon thread, so its clients can be
+    used from any thread and any event loop: the sync client from worker threads
+    (instructor inside `BaseAgent.run`), the async one from the server's loop.
+    Upstream connections are pooled once, on the gateway loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        default_limit: Optional[int] = None,
+        model_limits: Optional[Dict[str, Optional[int]]] = None,
+        batch_window: float = 0.005,
+        max_batch: int = 64,
+        coalesce: bool = True,
+        max_connections: int = 64,
+        max_loaded_models: Optional[int] = None,
+        residency: Optional[Dict] = None,
+    ):
+        """
+        Args:
+            base_url (str): OpenAI-compatible endpoint of the Ollama server
+            default_limit (Optional[int]): Requests of one model sent at once, OLLAMA_NUM_PARALLEL (default 4) if None, 0 for no cap
+            model_limits (Optional[Dict[str, Optional[int]]]): Per-model overrides, 0 or None for no cap
+            batch_window (float): Seconds an embedding request waits for others to share its batch
+            max_batch (int): Inputs that send an embedding batch before the window ends, 1 disables batching
+            coalesce (bool): Share the response of identical requests in flight
+            max_connections (int): Connections kept to the server
+            max_loaded_models (Optional[int]): Models the server keeps loaded at once, OLLAMA_MAX_LOADED_MODELS if None, 0 to leave residency to the server
+            residency (Optional[Dict]): Other ModelScheduler arguments (max_wait, idle_grace, max_defer, keep_alive, residency_hints)
+        """
+        self.base_url = base_url
+        if default_limit is None:
+            default_limit = int(os.environ.get("OLLAMA_NUM_PARALLEL", 4))
+        self.default_limit = default_limit
+        self.model_limits = dict(model_limits or {})
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.coalesce = coalesce
+        self.stats = {
+            "requests": 0,
+            "upstream": 0,
+            "coalesced": 0,
+            "embedding_requests": 0,
+            "embedding_batches": 0,
+        }
+        self._inflight: Dict[str, _Shared] = {}
+        self._batches: Dict[Tuple, _Batch] = {}
+        self._clients: Dict[bool, "OpenAI"] = {}
+        self._async_clients: Dict[bool, "AsyncOpenAI"] = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._http: httpx.AsyncClient = self._call(self._make_http(limits))
+        if max_loaded_models is None:
+            max_loaded_models = int(os.environ.get("OLLAMA_MAX_LOADED_MODELS", 0))
+        self.scheduler = ModelScheduler(
+            default_limit,
+            self.model_limits,
+            max_loaded=max_loaded_models or None,
+            base_url=native_url(base_url),
+            http=self._http,
+            **(residency or {}),
+        )
+        self.models = self.scheduler.models
+        if self.scheduler.max_loaded and self.scheduler.hints:
+            asyncio.run_coroutine_threadsafe(self.scheduler.refresh(), self._loop)
+
+    @staticmethod
+    async def _make_http(limits: httpx.Limits) -> httpx.AsyncClient:
+        return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(600.0, connect=5.0))
+
+    def _call(self, coroutine):
+        """Run a coroutine on the gateway loop and wait for it, from a thread outside it."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _acall(self, coroutine):
+        """Run a coroutine on the gateway loop and await it, from another event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._loop))
+
+    def client(self, background: bool = False) -> "OpenAI":
+        """
+        The gateway's shared OpenAI client, e.g. for `instructor.from_openai`.
+
+        Args:
+            background (bool): The client of background jobs, whose requests wait until their model is loaded
+        """
+        if background not in self._clients:
+            from openai import OpenAI
+
+            self._clients[background] = OpenAI(
+                base_url=self.base_url,
+                api_key="ollama",
+                default_headers={PRIORITY_HEADER: "background"} if background else None,
+                http_client=httpx.Client(transport=_SyncGatewayTransport(self), timeout=600.0),
+            )
+        return self._clients[background]
+
+    def async_client(self, background: bool = False) -> "AsyncOpenAI":
+        """The gateway's shared AsyncOpenAI client, usable from any event loop. See `client`."""
+        if background not in self._async_clients:
+            from openai import AsyncOpenAI
+
+            self._async_clients[background] = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key="ollama",
+                default_headers={PRIORITY_HEADER: "background"} if background else None,
+                http_client=httpx.AsyncClient(transport=_AsyncGatewayTransport(self), timeout=600.0),
+            )
+        return self._async_clients[background]
+
+    @contextmanager
+    def hold(self, model: str, background: bool = False):
+        """`with gateway.hold(model):` around work that keeps the model busy elsewhere."""
+        hold = _Hold(self, model, background)
+        future = asyncio.run_coroutine_threadsafe(hold.acquire(), self._loop)
+        try:
+            future.result()
+            yield
+        finally:
+            self._loop.call_soon_threadsafe(hold.release)
+
+    @asynccontextmanager
+    async def ahold(self, model: str, background: bool = False):
+        """Async counterpart of `hold`."""
+        hold = _Hold(self, model, background)
+        try:
+            await self._acall(hold.acquire())
+            yield
+        finally:
+            self._loop.call_soon_threadsafe(hold.release)
+
+    # Everything below runs on the gateway loop
+
+    async def _acquire(self, model: str, background: bool = False, embedding: bool = False) -> None:
+        await self.scheduler.acquire(model, background=background, embedding=embedding)
+
+    def _release(self, model: str) -> None:
+        self.scheduler.release(model)
+
+    @asynccontextmanager
+    async def _slot(self, model: Optional[str], background: bool = False, embedding: bool = False):
+        if model is None:
+            yield
+            return
+        await self._acquire(model, background=background, embedding=embedding)
+        try:
+            yield
+        finally:
+            self._release(model)
+
+    async def _open(
+        self,
+        method: str,
+        url: str,
+        headers: List[Tuple[str, str]],
+        body: bytes,
+        timeout: Optional[Dict],
+        push: Callable,
+    ) -> Tuple[_Shared, int, List[Tuple[str, str]], bool]:
+        """Start or join the upstream request, returning once its status and headers are in."""
+        self.stats["requests"] += 1
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            payload = None
+        model = payload.get("model") if isinstance(payload, dict) else None
+        background = any(k.lower() == PRIORITY_HEADER and v == "background" for k, v in headers)
+
+        if model is not None and url.endswith("/embeddings") and self.max_batch > 1:
+            texts = payload.get("input")
+            if isinstance(texts, str) or (isinstance(texts, list) and all(isinstance(t, str) for t in texts)):
+                shared = await self._embed(url, headers, payload)
+                shared.subscribe(push)
+                status, response_headers = shared.head.result()
+                return shared, status, response_headers, False
+
+        key = None
+        joined = False
+        if self.coalesce and method == "POST" and model is not None:
+            key = hashlib.sha256(url.encode() + b"\0" + body + (b"\0bg" if background else b"")).hexdigest()
+            shared = self._inflight.get(key)
+            joined = shared is not None and bool(shared.listeners)
+        if joined:
+            self.stats["coalesced"] += 1
+        else:
+            shared = _Shared()
+            shared.task = asyncio.create_task(
+                self._upstream(shared, key, model, background, method, url, headers, body, timeout)
+            )
+            if key is not None:
+                self._inflight[key] = shared
+        shared.subscribe(push)
+        try:
+            status, response_headers = await asyncio.shield(shared.head)
+        except BaseException:
+            shared.release(push)
+            raise
+        return shared, status, response_headers, joined
+
+    async def _upstream(self, shared: _Shared, key, model, background, method, url, headers, body, timeout) -> None:
+        try:
+            async with self._slot(model, background=background, embedding=url.endswith("/embeddings")):
+                headers = [(k, v) for k, v in headers if k.lower() != PRIORITY_HEADER]
+                request = self._http.build_request(
+                    method, url, headers=headers, content=body,
+                    extensions={"timeout": timeout} if timeout else None,
+                )
+                response = await self._http.send(request, stream=True)
+                self.stats["upstream"] += 1
+                try:
+                    shared.head.set_result((response.status_code, response.headers.multi_items()))
+                    async for chunk in response.aiter_raw():
+                        shared.feed(chunk)
+                finally:
+                    await response.aclose()
+            shared.finish()
+        except asyncio.CancelledError:
+            shared.head.cancel()
+            shared.finish(httpx.ReadError("Upstream request cancelled"))
+            raise
+        except Exception as e:
+            if not shared.head.done():
+                shared.head.set_exception(e)
+            shared.finish(e)
+        finally:
+            if key is not None and self._inflight.get(key) is shared:
+                del self._inflight[key]
+
+    async def _embed(self, url: str, headers: List[Tuple[str, str]], payload: Dict) -> _Shared:
+        """Queue an embedding request into the open batch of its model and parameters."""
+        self.stats["embedding_requests"] += 1
+        texts = payload["input"]
+        texts = [texts] if isinstance(texts, str) else texts
+        params = {k: v for k, v in payload.items() if k != "input"}
+        key = (url, json.dumps(params, sort_keys=True))
+        batch = self._batches.get(key)
+        if batch is None or batch.size >= self.max_batch:
+            batch = self._batches[key] = _Batch(url, headers, params)
+            batch.timer = self._loop.call_later(self.batch_window, self._flush, key, batch)
+        future = self._loop.create_future()
+        batch.entries.append((texts, future))
+        batch.size += len(texts)
+        if batch.size >= self.max_batch:
+            self._flush(key, batch)
+        status, response_headers, body = await future
+        return _Shared.complete(status, response_headers, body)
+
+    def _flush(self, key: Tuple, batch: _Batch) -> None:
+        if not batch.sending:
+            batch.sending = True
+            batch.timer.cancel()
+            asyncio.create_task(self._send_batch(key, batch))
+
+    async def _send_batch(self, key: Tuple, batch: _Batch) -> None:
+        """Send a batch once its model has a free slot. Until then it keeps taking requests."""
+        try:
+            async with self._slot(batch.params["model"], embedding=True):
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+                self.stats["embedding_batches"] += 1
+                headers = [(k, v) for k, v in batch.headers if k.lower() not in ("content-length", "host")]
+                body = json.dumps({**batch.params, "input": [t for texts, _ in batch.entries for t in texts]})
+                response = await self._http.post(batch.url, content=body.encode(), headers=headers)
+                self.stats["upstream"] += 1
+            results = self._split_batch(response, batch)
+        except Exception as e:
+            # A malformed upstream reply fails every caller of the batch instead of leaving them waiting
+            for _, future in batch.entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch.entries, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _split_batch(response: httpx.Response, batch: _Batch) -> List[Tuple[int, List, bytes]]:
+        """Split the upstream reply to a batch into one reply per request, in the order of its entries."""
+        if response.status_code != 200:
+            return [(response.status_code, response.headers.multi_items(), response.content)] * len(batch.entries)
+        output = response.json()
+        data = sorted(output["data"], key=lambda item: item["index"])
+        if len(data) != batch.size:
+            raise ValueError(f"Upstream returned {len(data)} embeddings for a batch of {batch.size} inputs")
+        usage = output.get("usage") or {}
+        results, start = [], 0
+        for texts, _ in batch.entries:
+            share = len(texts) / max(1, batch.size)
+            part = {
+                **output,
+                "data": [{**item, "index": i} for i, item in enumerate(data[start : start + len(texts)])],
+                "usage": {name: int(value * share) for name, value in usage.items() if isinstance(value, int)},
+            }
+            results.append((200, [("content-type", "application/json")], json.dumps(part).encode()))
+            start += len(texts)
+        return results
+
+    async def _snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "in_flight_requests": len(self._inflight),
+            "models": {model: dict(stats) for model, stats in self.models.items()},
+            "residency": self.scheduler.snapshot(),
+        }
+
+    def snapshot(self) -> Dict:
+        """Counters of the gateway, per model its cap, loads and the requests in flight and waiting, and the swaps."""
+        return self._call(self._snapshot())
+
+    def close(self) -> None:
+        if not self._loop.is_running():
+            return
+        self._call(self._http.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def get_gateway(base_url: str = DEFAULT_BASE_URL) -> LLMGateway:
+    """The process-wide gateway to the server at `base_url`, created on first use."""
+    with _lock:
+        gateway = _gateways.get(base_url)
+        if gateway is None:
+            gateway = _gateways[base_url] = LLMGateway(base_url)
+        return gateway
+
+
+def close_gateways() -> None:
+    """Close every process-wide gateway, e.g. on server shutdown."""
+    with _lock:
+        gateways = list(_gateways.values())
+        _gateways.clear()
+    for gateway in gateways:
+        gateway.close()
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+## Model-affinity admission of the LLM gateway's requests
+# Ollama keeps OLLAMA_MAX_LOADED_MODELS models in memory. A request for another model
+# evicts one and loads its weights, seconds of dead time, and interleaving the requests of
+# more models than fit (qwen2.5 turns, nomic-embed-text lookups, llama3.1 repairs) pays
+# that on almost every request. With `max_loaded` set the scheduler:
+#  - sends the requests of resident models (up to each model's cap) and queues the others
+#    by model, so one load serves everything queued for that model
+#  - loads a queued model when a slot is free or a resident model is idle, or once its
+#    oldest request waited `max_wait` seconds: the least recently used model then takes no
+#    new requests and is swapped out when its last one finishes
+#  - holds background work (fine-tune repair, hallucination scoring) until its model is
+#    resident, or until no foreground work is queued and a resident model has been idle for
+#    `idle_grace` seconds (`max_defer` at most)
+#  - sends residency hints to Ollama's native API: a load with `keep_alive` when it loads a
+#    model, `keep_alive: 0` for the model it swaps out, and reads /api/ps to learn what other
+#    processes loaded. The hints' duration is the time lost to loads and swaps.
+# Without `max_loaded` only the per-model caps apply.
+
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+def model_tag(model: str) -> str:
+    """Ollama's name for a model: `nomic-embed-text` is `nomic-embed-text:latest`."""
+    return model if ":" in model else f"{model}:latest"
+
+
+def native_url(base_url: str) -> str:
+    """Ollama's native API root from its OpenAI-compatible endpoint."""
+    base_url = base_url.rstrip("/")
+    return base_url[: -len("/v1")] if base_url.endswith("/v1") else base_url
+
+
+class _Waiter:
+    __slots__ = ("future", "since")
+
+    def __init__(self, since: float):
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.since = since
+
+
+class ModelScheduler:
+    """
+    Per-model caps and model residency for the requests of an LLMGateway.
+
+    Every method runs on the gateway loop, so the state needs no lock. A model's queued
+    requests are admitted in arrival order, foreground before background.
+    """
+
+    def __init__(
+        self,
+        default_limit: Optional[int],
+        model_limits: Optional[Dict[str, Optional[int]]] = None,
+        max_loaded: Optional[int] = None,
+        max_wait: float = 2.0,
+        idle_grace: float = 2.0,
+        max_defer: Optional[float] = 300.0,
+        keep_alive: str = DEFAULT_KEEP_ALIVE,
+        residency_hints: bool = True,
+        refresh_interval: float = 5.0,
+        base_url: Optional[str] = None,
+        http: Optional[httpx.AsyncClient] = None,
+    ):
+        """
+        Args:
+            default_limit (Optional[int]): Requests of one model sent at once, 0 or None for no cap
+            model_limits (Optional[Dict[str, Optional[int]]]): Per-model overrides, 0 or None for no cap
+            max_loaded (Optional[int]): Models the server keeps loaded at once, None to leave residency to the server
+            max_wait (float): Seconds a request of a model that isn't loaded waits before a busy model is swapped out for it
+            idle_grace (float): Seconds a resident model must be unused before background work may swap it out
+            max_defer (Optional[float]): Seconds background work waits at most before it counts as foreground, None for no limit
+            keep_alive (str): How long the server keeps a model the scheduler loads (Ollama duration)
+            residency_hints (bool): Send loads and unloads to the server's native API and read its /api/ps
+            refresh_interval (float): Seconds between /api/ps reads while requests wait for a model
+            base_url (Optional[str]): Root of Ollama's native API, hints are off without it
+            http (Optional[httpx.AsyncClient]): Client for the hints, on the gateway loop
+        """
+        self.default_limit = default_limit
+        self.model_limits = dict(model_limits or {})
+        self.max_loaded = max_loaded
+        self.max_wait = max_wait
+        self.idle_grace = idle_grace
+        self.max_defer = max_defer
+        self.keep_alive = keep_alive
+        self.hints = residency_hints and base_url is not None and http is not None
+        self.refresh_interval = refresh_interval
+        self.base_url = base_url
+        self.http = http
+        self.models: Dict[str, Dict] = {}
+        self.stats = {
+            "loads": 0,
+            "swaps": 0,
+            "forced_swaps": 0,
+            "load_seconds": 0.0,
+            "swap_seconds": 0.0,
+            "deferred": 0,
+            "deferred_seconds": 0.0,
+            "hint_errors": 0,
+        }
+        # Residency is keyed by model tag, the rest by the name requests use
+        self.resident: Dict[str, float] = {}  # tag -> last use, least recently used first
+        self._queues: Dict[str, Tuple[Deque[_Waiter], Deque[_Waiter]]] = {}
+        self._embedding: Set[str] = set()
+        self._loading: Set[str] = set()
+        self._drain: Optional[Tuple[str, str]] = None  # (tag swapped out, model loaded instead)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._refreshed = 0.0
+        self._refreshing = False
+
+    @classmethod
+    def from_env(cls, default_limit: Optional[int], **kwargs) -> "ModelScheduler":
+        """A scheduler with `max_loaded` from OLLAMA_MAX_LOADED_MODELS, residency left to the server if unset."""
+        max_loaded = int(os.environ.get("OLLAMA_MAX_LOADED_MODELS", 0)) or None
+        return cls(default_limit, max_loaded=max_loaded, **kwargs)
+
+    def _model(self, model: str) -> Dict:
+        if model not in self.models:
+            limit = self.model_limits.get(model, self.default_limit)
+            self._queues[model] = (deque(), deque())
+            self.models[model] = {
+                "limit": limit,
+                "in_flight": 0,
+                "waiting": 0,
+                "requests": 0,
+                "loads": 0,
+            }
+        return self.models[model]
+
+    async def acquire(self, model: str, background: bool = False, embedding: bool = False) -> None:
+        """Wait for a slot of `model`: under its cap, and once it is loaded if residency is managed."""
+        stats = self._model(model)
+        stats["requests"] += 1
+        if embedding:
+            self._embedding.add(model)
+        queues = self._queues[model]
+        if self._ready(model) and not (queues[0] or queues[1]) and self._free(model):
+            self._start(model)
+            return
+
+        now = asyncio.get_running_loop().time()
+        deferred = background and not self._ready(model)
+        waiter = _Waiter(now)
+        queues[1 if background else 0].append(waiter)
+        stats["waiting"] += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.cancelled():  # Gave up while queued
+                if waiter in queues[1 if background else 0]:
+                    queues[1 if background else 0].remove(waiter)
+                stats["waiting"] -= 1
+                self._dispatch()
+            else:  # Admitted, then cancelled before using the slot
+                self.release(model)
+            raise
+        if deferred:
+            self.stats["deferred"] += 1
+            self.stats["deferred_seconds"] += asyncio.get_running_loop().time() - now
+
+    def release(self, model: str) -> None:
+        self.models[model]["in_flight"] -= 1
+        self._touch(model)
+        self._dispatch()
+
+    def _ready(self, model: str) -> bool:
+        if self.max_loaded is None:
+            return True
+        tag = model_tag(model)
+        return tag in self.resident and not (self._drain and self._drain[0] == tag)
+
+    def _free(self, model: str) -> bool:
+        stats = self.models[model]
+        return not stats["limit"] or stats["in_flight"] < stats["limit"]
+
+    def _start(self, model: str) -> None:
+        self.models[model]["in_flight"] += 1
+        self._touch(model)
+
+    def _touch(self, model: str) -> None:
+        tag = model_tag(model)
+        if tag in self.resident:
+            del self.resident[tag]  # Re-inserted last, the dict stays in LRU order
+            self.resident[tag] = asyncio.get_running_loop().time()
+
+    def _admit(self, model: str) -> None:
+        stats = self.models[model]
+        for queue in self._queues[model]:
+            while queue and self._free(model):
+                waiter = queue.popleft()
+                if waiter.future.done():  # Cancelled, `acquire` fixes the count
+                    continue
+                stats["waiting"] -= 1
+                self._start(model)
+                waiter.future.set_result(None)
+
+    def _dispatch(self) -> None:
+        """Admit what can go now, start the loads and swaps that are due and set a timer for the next."""
+        loop = asyncio.get_running_loop()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for model in self.models:
+            if self._ready(model):
+                self._admit(model)
+        if self.max_loaded is None:
+            return
+
+        now = loop.time()
+        wake: List[float] = []
+        if self._drain is not None:
+            tag, model = self._drain
+            if model_tag(model) in self.resident or model_tag(model) in self._loading:
+                self._drain = None  # Loaded meanwhile, e.g. by another process
+            elif not any(self.models[name]["in_flight"] for name in self.models if model_tag(name) == tag):
+                self._drain = None
+                self._swap(tag, model)
+
+        pending = [
+            model for model, (foreground, background) in self._queues.items()
+            if (foreground or background) and model_tag(model) not in self.resident
+            and model_tag(model) not in self._loading
+        ]
+        urgent, deferred = [], []
+        for model in pending:
+            foreground, background = self._queues[model]
+            if foreground:
+                urgent.append((foreground[0].since, model))
+            elif self.max_defer is not None and now - background[0].since >= self.max_defer:
+                urgent.append((background[0].since, model))
+            else:
+                deferred.append((background[0].since, model))
+                if self.max_defer is not None:
+                    wake.append(background[0].since + self.max_defer)
+        urgent.sort()
+        deferred.sort()
+
+        for since, model in urgent:
+            if model_tag(model) in self._loading:
+                continue
+            if self._slots() > 0:
+                self._swap(None, model)
+                continue
+            victim = self._victim(now, grace=0.0)
+            if victim is not None:
+                self._swap(victim, model)
+                continue
+            if self._drain is None and self.resident:
+                if now - since >= self.max_wait:
+                    # Everything resident is busy, stop feeding the least recently used model
+                    self._drain = (next(iter(self.resident)), model)
+                    self.stats["forced_swaps"] += 1
+                else:
+                    wake.append(since + self.max_wait)
+            break
+
+        if deferred and not urgent and self._drain is None:
+            for since, model in deferred:
+                if model_tag(model) in self._loading:
+                    continue
+                if self._slots() > 0:
+                    self._swap(None, model)
+                    continue
+                victim = self._victim(now, grace=self.idle_grace)
+                if victim is not None:
+                    self._swap(victim, model)
+                    continue
+                wake.extend(
+                    used + self.idle_grace for tag, used in self.resident.items() if self._idle(tag)
+                )
+                break
+
+        if pending and self.hints and not self._refreshing:
+            if now - self._refreshed >= self.refresh_interval:
+                self._refreshing = True
+                loop.create_task(self.refresh())
+            else:
+                wake.append(self._refreshed + self.refresh_interval)
+        if wake:
+            self._timer = loop.call_at(max(min(wake), now + 0.001), self._dispatch)
+
+    def _slots(self) -> int:
+        return self.max_loaded - len(self.resident) - len(self._loading)
+
+    def _idle(self, tag: str) -> bool:
+        """A resident model with nothing in flight or queued."""
+        for model, stats in self.models.items():
+            if model_tag(model) == tag and (stats["in_flight"] or stats["waiting"]):
+                return False
+        return tag not in self._loading
+
+    def _victim(self, now: float, grace: float) -> Optional[str]:
+        """The least recently used resident model that has been idle for `grace` seconds."""
+        for tag, used in self.resident.items():
+            if now - used >= grace and self._idle(tag):
+                return tag
+        return None
+
+    def _swap(self, victim: Optional[str], model: str) -> None:
+        tag = model_tag(model)
+        if victim is not None:
+            del self.resident[victim]
+        self._loading.add(tag)
+        asyncio.get_running_loop().create_task(self._load(victim, model))
+
+    async def _load(self, victim: Optional[str], model: str) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            if self.hints and victim is not None:
+                await self._hint(victim, 0)
+            if self.hints:
+                await self._hint(model, self.keep_alive)
+        finally:
+            seconds = loop.time() - start
+            tag = model_tag(model)
+            self._loading.discard(tag)
+            self.resident[tag] = loop.time()
+            self._model(model)["loads"] += 1
+            self.stats["loads"] += 1
+            self.stats["load_seconds"] += seconds
+            if victim is not None:
+                self.stats["swaps"] += 1
+                self.stats["swap_seconds"] += seconds
+                logger.info("Swapped %s out for %s in %.2fs", victim, model, seconds)
+            self._dispatch()
+
+    async def _hint(self, model: str, keep_alive) -> None:
+        """Load (or with keep_alive 0 unload) a model through the native API, which does nothing else."""
+        if model_tag(model) in {model_tag(name) for name in self._embedding}:
+            url, payload = f"{self.base_url}/api/embed", {"model": model, "input": [], "keep_alive": keep_alive}
+        else:
+            url, payload = f"{self.base_url}/api/generate", {"model": model, "keep_alive": keep_alive}
+        try:
+            response = await self.http.post(url, json=payload)
+        except httpx.HTTPError as e:
+            self.stats["hint_errors"] += 1
+            logger.debug("Residency hint for %s failed: %s", model, e)
+            return
+        if response.status_code == 404 and "model" not in response.text.lower():
+            self.hints = False  # Not an Ollama server, requests load their models themselves
+            logger.info("%s has no native Ollama API, residency hints are off", self.base_url)
+        elif response.status_code != 200:
+            self.stats["hint_errors"] += 1
+            logger.debug("Residency hint for %s: HTTP %s", model, response.status_code)
+
+    async def refresh(self) -> None:
+        """Sync the resident models with the server's /api/ps, picking up what other processes loaded."""
+        loop = asyncio.get_running_loop()
+        try:
+            response = await self.http.get(f"{self.base_url}/api/ps")
+            if response.status_code == 404:
+                self.hints = False
+                return
+            response.raise_for_status()
+            loaded = response.json().get("models") or []
+        except (httpx.HTTPError, ValueError) as e:
+            logger.debug("Could not read the loaded models: %s", e)
+            return
+        finally:
+            self._refreshing = False
+            self._refreshed = loop.time()
+
+        now = loop.time()
+        tags = {model_tag(entry.get("name") or entry.get("model", "")): entry for entry in loaded}
+        for tag in list(self.resident):
+            if tag not in tags and self._idle(tag):
+                del self.resident[tag]  # Expired or evicted by someone else
+        for tag, entry in tags.items():
+            if tag in self.resident or tag in self._loading:
+                continue
+            # Unknown use, assume the server's default keep_alive of 5 minutes runs from it
+            used = now
+            try:
+                expires = datetime.fromisoformat(entry["expires_at"].replace("Z", "+00:00")).timestamp()
+                used = min(now, now - 300.0 + (expires - time.time()))
+            except (KeyError, ValueError, AttributeError):
+                pass
+            self.resident = {tag: used, **self.resident}
+        self._dispatch()
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "max_loaded": self.max_loaded,
+            "resident": list(self.resident),
+            "loading": sorted(self._loading),
+            "draining": self._drain[0] if self._drain else None,
+        }
@@ -1,23 +1,81 @@
-from typing import Union, Literal
-from atomic_agents.agents.base_agent import (
-    BaseAgent,
-    BaseAgentConfig,
-    BaseAgentInputSchema,
-    BaseIOSchema,
-)
-from atomic_agents.lib.base.base_tool import BaseTool
-from atomic_agents.lib.components.agent_memory import AgentMemory
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import time
+import uuid
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Literal, Optional, Union
+from atomic_agents.lib.base.base_io_schema import BaseIOSchema
 from atomic_agents.lib.components.system_prompt_generator import SystemPromptGenerator
 from backend.Agents.PerplexityLocal import (
     WebSearchInputSchema,
     WebSearchOutputSchema,
-    WebSearchTool,
-    WebSearchConfig,
 )
-from backend.Agents.KnowledgeBase import KnowledgeBase, KnowledgeBaseInputSchema, KnowledgeBaseOutputSchema
-import instructor
-from openai import OpenAI as OllamaClient
-from pydantic import BaseModel, Field
+from backend.Agents.PerplexicaClient import close_async_clients
+from backend.Agents.KnowledgeBase import KnowledgeBaseInputSchema, KnowledgeBaseOutputSchema
+from backend.Agents.FileCatalog import FileCatalogInputSchema, FileCatalogOutputSchema
+from backend.setup.ToolCache import SQLiteTier, ToolCache, cache_key
+from backend.setup.ToolRegistry import ToolRegistry
+from backend.setup.Events import (
+    FinalAnswer,
+    OrchestratorEvent,
+    ReasoningDelta,
+    ToolFinished,
+    ToolStarted,
+)
+from backend.setup.Planner import (
+    PlanAnswerSchema,
+    PlanExecutor,
+    PlanOutputSchema,
+    match_tool_parameters,
+    output_text,
+)
+from backend.setup.Gateway import LLMGateway, get_gateway
+from backend.setup.Scheduler import FairScheduler
+from backend.setup.SemanticCache import SemanticCache, SemanticHit
+from backend.setup.StructuredOutput import (
+    SchemaStats,
+    StructuredClient,
+    check_mode,
+    completion_tokens,
+    instructor_mode,
+    structured_request,
+)
+from backend.setup.Tracing import current_span, get_tracer, span
+from jiter import from_json
+from pydantic import BaseModel, Field, ValidationError, model_validator
+
+if TYPE_CHECKING:
+    from atomic_agents.lib.components.agent_memory import AgentMemory
+    from backend.Agents.sub_agents.HallucinationDetection import HallucinationDetection
+    from openai import AsyncOpenAI as AsyncOllamaClient
+    from openai import OpenAI as OllamaClient
+
+logger = logging.getLogger(__name__)
+
+## Cold start
+# instructor (through google-genai and anthropic when they are installed), atomic_agents'
+# BaseAgent and memory, openai and chromadb take seconds to import. They are imported
+# where they are first used: the instructor clients, the BaseAgent and the default memory
+# are built on the first query, not in __init__, so building an Orchestrator is quick.
+# Servers start importing them in the background (Startup.prewarm).
+
+
+def agent_input(chat_message: str) -> BaseIOSchema:
+    """A user message as atomic_agents' BaseAgentInputSchema, whose module imports instructor."""
+    from atomic_agents.agents.base_agent import BaseAgentInputSchema
+
+    return BaseAgentInputSchema(chat_message=chat_message)
+
+
+def partial_json(text: str) -> Dict:
+    """Parse a JSON object that may still be being generated, {} if it can't be parsed yet."""
+    try:
+        parsed = from_json(text.strip().encode() or b"{}", partial_mode="trailing-strings")
+    except ValueError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
 
 
 class OrchestratorInputSchema(BaseIOSchema):
@@ -49,6 +107,82 @@ class OrchestratorOutputSchema(BaseIOSchema):
     )
 
 
+class ToolCall(BaseIOSchema):
+    """A single tool invocation requested by the Orchestrator."""
+
+    tool: Literal["WebSearch", "KnowledgeBase", "FileCatalog"] = Field(
+        ..., description="The tool to use. Must be one of the available tools."
+    )
+    tool_parameters: Union[WebSearchInputSchema, KnowledgeBaseInputSchema, FileCatalogInputSchema] = Field(
+        ..., description="The parameters for the selected tool"
+    )
+
+    _match_tool_parameters = model_validator(mode="before")(match_tool_parameters)
+
+
+class ParallelOrchestratorOutputSchema(BaseIOSchema):
+    """Output schema for the Orchestrator Agent when several tools can be called in one step."""
+
+    reasoning: str = Field(
+        ...,
+        description="Your explanation to the user for using these tools. You should tie this into the previous tool use and the global context of the task.",
+    )
+    tool_calls: List[ToolCall] = Field(
+        default_factory=list,
+        description="Independent tool calls to run concurrently in this step. Leave empty when done.",
+    )
+    done: bool = Field(
+        ...,
+        description="Whether the Agent is done and has returned the final answer in the reasoning field",
+    )
+
+
+class SpeculativeOrchestratorOutputSchema(BaseIOSchema):
+    """Output schema for the Orchestrator Agent in speculative mode. The tool call comes first, so it can start while the reasoning is written."""
+
+    tool: Literal["WebSearch"] = Field(
+        ..., description="The tool to use. Must be one of the available tools."
+    )
+    tool_parameters: WebSearchInputSchema = Field(
+        ..., description="The parameters for the selected tool"
+    )
+    reasoning: str = Field(
+        ...,
+        description="Your explanation to the user for using this tool. You should tie this into the previous tool use and the global context of the task.",
+    )
+    done: bool = Field(
+        ...,
+        description="Whether the Agent is done and has returned the final answer in the reasoning field",
+    )
+
+
+class SpeculativeParallelOrchestratorOutputSchema(BaseIOSchema):
+    """Output schema for the Orchestrator Agent in speculative, parallel mode. The tool calls come first, so they can start while the reasoning is written."""
+
+    tool_calls: List[ToolCall] = Field(
+        default_factory=list,
+        description="Independent tool calls to run concurrently in this step. Leave empty when done.",
+    )
+    reasoning: str = Field(
+        ...,
+        description="Your explanation to the user for using these tools. You should tie this into the previous tool use and the global context of the task.",
+    )
+    done: bool = Field(
+        ...,
+        description="Whether the Agent is done and has returned the final answer in the reasoning field",
+    )
+
+
+def query_keywords(query: str, limit: int = 6) -> List[str]:
+    """Distinct longer words of a question, as keywords for a knowledge base lookup."""
+    words = []
+    for word in query.split():
+        word = word.strip(".,;:!?\"'()[]").lower()
+        if len(word) > 3 and word not in words:
+            words.append(word)
+    return words[:limit]
+
+
 class Orchestrator:
     input_schema = OrchestratorInputSchema
     output_schema = OrchestratorOutputSchema
@@ -56,14 +190,82 @@ class Orchestrator:
     def __init__(
         self,
         model="qwen2.5:7b",
+        parallel: bool = False,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        cache: Union[ToolCache, bool] = True,
+        tools: Optional[ToolRegistry] = None,
+        memory: Optional["AgentMemory"] = None,
+        base_url: str = "http://127.0.0.1:11434/v1",
+        evaluator: Optional["HallucinationDetection"] = None,
+        llm: Optional["OllamaClient"] = None,
+        async_llm: Optional["AsyncOllamaClient"] = None,
+        scheduler: Optional[FairScheduler] = None,
+        session_id: Optional[str] = None,
+        gateway: Optional[LLMGateway] = None,
+        answer_cache: Optional[SemanticCache] = None,
+        speculative: bool = False,
+        prefetch_knowledge_base: bool = False,
+        ingest_web_sources: bool = False,
+        structured_output: str = "json",
+        schema_stats: Optional[SchemaStats] = None,
     ):
-        self.client = instructor.from_openai(
-            OllamaClient(base_url="http://127.0.0.1:11434/v1", api_key="ollama"),
-            mode=instructor.Mode.JSON,
-        )
+        """
+        Args:
+            model (str): The Ollama model used for reasoning
+            parallel (bool): Let the model request several tool calls per step (see `arun`)
+            tool_timeouts (Optional[Dict[str, float]]): Per-tool timeouts in seconds used by `arun`
+            cache (Union[ToolCache, bool]): Tool result cache, True for the default memory + SQLite cache, False to disable
+            tools (Optional[ToolRegistry]): Where tools are looked up, defaults to the process-wide registry
+            memory (Optional[AgentMemory]): Conversation memory, defaults to a token-budgeted CompactMemory
+            base_url (str): OpenAI-compatible endpoint of the Ollama server
+            evaluator (Optional[HallucinationDetection]): Scores each final answer against the tool results in the background
+            llm (Optional[OpenAI]): Client for the Ollama endpoint, the gateway's by default
+            async_llm (Optional[AsyncOpenAI]): Async client for the Ollama endpoint, the gateway's by default
+            scheduler (Optional[FairScheduler]): Admission control for the async LLM calls, shared by the sessions of a server
+            session_id (Optional[str]): Identifies this conversation to the scheduler and in traces
+            gateway (Optional[LLMGateway]): Coalesces and caps the LLM requests, the process-wide one for base_url by default
+            answer_cache (Optional[SemanticCache]): Answers a conversation's first question from similar earlier ones (`astream`, `astream_plan`)
+            speculative (bool): In `astream`, start each tool call as soon as the model has written it, before its reasoning
+            prefetch_knowledge_base (bool): In `astream`, search the knowledge base for a conversation's first question while the model plans
+            ingest_web_sources (bool): Add the pages WebSearch cites to the knowledge base in the background
+            structured_output (str): "json" to ask the server for a JSON object, "json_schema" to constrain its decoding to the output schema
+            schema_stats (Optional[SchemaStats]): Where repaired and regenerated outputs are counted, shared by the sessions of a server
+        """
+        self.structured_output = check_mode(structured_output)
+        self.schema_stats = schema_stats or SchemaStats()
+        self.tools = tools or ToolRegistry.default()
+        if parallel:
+            self.output_schema = ParallelOrchestratorOutputSchema
+        if speculative:
+            # Fields are generated in schema order, the tool calls must come before the reasoning
+            self.output_schema = (
+                SpeculativeParallelOrchestratorOutputSchema if parallel else SpeculativeOrchestratorOutputSchema
+            )
+        self.speculative = speculative
+        self.prefetch_knowledge_base = prefetch_knowledge_base
+        self._prefetched: Dict[str, asyncio.Task] = {}  # Speculative tool calls by cache key
+        self.prefetch_stats = {"started": 0, "used": 0, "discarded": 0}
+        self.ingest_web_sources = ingest_web_sources
+        self.tool_timeouts = {"WebSearch": 120.0, "KnowledgeBase": 30.0, "FileCatalog": 30.0}
+        self.tool_timeouts.update(tool_timeouts or {})
+        if cache is True:
+            cache = ToolCache(disk=SQLiteTier())
+        self.cache = cache or None
+        self.gateway = gateway or get_gateway(base_url)
+        self._llm = llm
+        if async_llm is not None:
+            self.async_llm = async_llm
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.scheduler = scheduler
+        self.evaluator = evaluator
+        self.answer_cache = answer_cache
+        self._retrieved: List[str] = []  # Tool results of the current query, for the evaluator and answer cache
+        self._sources: set = set()  # Knowledge base sources of the current query
+        self._searched_knowledge_base = False
         self.model = model
-        self.memory = AgentMemory()
-        self.tool_names = ["WebSearch", "KnowledgeBase"]
+        if memory is not None:
+            self.memory = memory
+        self.tool_names = ["WebSearch", "KnowledgeBase", "FileCatalog"]
         self.system_prompt_gen = SystemPromptGenerator(
             background=[
                 # adapt prompts to generate full thought process ThoughtProcessOutputSchema -> ToolCallingInputSchema -> Union[all tool input schemas]
@@ -74,7 +276,14 @@ class Orchestrator:
             steps=[
                 "Break down the user's task into tool calls",
                 "Explain your reasoning at each step",
-            ],
+            ]
+            + (
+                [
+                    "Request every tool call that does not depend on another one in the same step, they will run concurrently",
+                ]
+                if parallel
+                else []
+            ),
             output_instructions=[
                 "You should return using JSON only and following the given JSON Schema",
                 "Be original and creative, consider thoroughly the subjects during each step to bring original, underrepresented opinions and points of view to the user",
@@ -82,9 +291,87 @@ class Orchestrator:
                 f"The tool field must be one of: {', '.join(self.tool_names)}",
             ],
         )
-        self.agent = BaseAgent(
+        self.plan_prompt_gen = SystemPromptGenerator(
+            background=[
+                "You are a planning Agent that answers questions with tools.",
+                f"You have access to the following tools: {', '.join(self.tool_names)}",
+            ],
+            steps=[
+                "Plan every tool call needed to answer the user's request at once, as steps of a dependency graph",
+                "Make steps independent wherever possible, independent steps run concurrently",
+                "When a step needs the result of another one, list it in depends_on and insert its result into a text parameter with '{{id}}'",
+            ],
+            output_instructions=[
+                "You should return using JSON only and following the given JSON Schema",
+                f"The tool field of every step must be one of: {', '.join(self.tool_names)}",
+            ],
+        )
+        self.answer_prompt_gen = SystemPromptGenerator(
+            background=[
+                "You are an Agent that answers questions from the results of the tools it planned.",
+            ],
+            steps=[
+                "Read the results of every step of your plan",
+                "Answer the user's request from them, saying which steps failed if it matters",
+            ],
+            output_instructions=[
+                "You should return using JSON only and following the given JSON Schema",
+                "Be original and creative, consider thoroughly the subjects to bring original, underrepresented opinions and points of view to the user",
+            ],
+        )
+
+    @functools.cached_property
+    def memory(self) -> "AgentMemory":
+        """The conversation memory, a CompactMemory unless one was given."""
+        from backend.setup.CompactMemory import CompactMemory
+
+        return CompactMemory()
+
+    @functools.cached_property
+    def async_llm(self) -> "AsyncOllamaClient":
+        return self.gateway.async_client()
+
+    @functools.cached_property
+    def client(self) -> StructuredClient:
+        """Client of the sync agent, repairing invalid outputs before regenerating them, with the tracing hooks."""
+        llm = self._llm or self.gateway.client()
+        return StructuredClient(
+            llm,
+            self._instructor(llm),
+            mode=self.structured_output,
+            stats=self.schema_stats,
+            on_request=self._trace_request,
+            on_response=self._trace_usage,
+        )
+
+    @functools.cached_property
+    def async_client(self) -> StructuredClient:
+        """Finishes the streamed turns, see `_astream_turn`."""
+        return StructuredClient(
+            self.async_llm,
+            self._instructor(self.async_llm),
+            mode=self.structured_output,
+            stats=self.schema_stats,
+            on_request=self._trace_request,
+            on_response=self._trace_usage,
+        )
+
+    def _instructor(self, llm):
+        import instructor
+
+        client = instructor.from_openai(llm, mode=instructor_mode(self.structured_output))
+        client.on("completion:kwargs", self._trace_request)
+        client.on("completion:response", self._trace_usage)
+        return client
+
+    @functools.cached_property
+    def agent(self):
+        """The atomic_agents BaseAgent behind `run` and `arun`, sharing this Orchestrator's memory."""
+        from atomic_agents.agents.base_agent import BaseAgent, BaseAgentConfig
+
+        agent = BaseAgent(
             config=BaseAgentConfig(
-                client=self.client,
+                client=self.client.fallback,
                 memory=self.memory,
                 model=self.model,
                 system_prompt_generator=self.system_prompt_gen,
@@ -92,77 +379,709 @@ class Orchestrator:
                 output_schema=self.output_schema,
             )
         )
+        # BaseAgentConfig only accepts an Instructor, the agent only calls chat.completions.create
+        agent.client = self.client
+        return agent
 
-    def execute_tool(
-        self, tool_name: str, params: Union[WebSearchInputSchema, KnowledgeBaseInputSchema]
-    ) -> Union[WebSearchOutputSchema, KnowledgeBaseOutputSchema]:
-        if tool_name == "WebSearch":
-            tool = WebSearchTool(
-                messages=self.agent.memory.get_history(), config=WebSearchConfig()
+    @staticmethod
+    def _trace_request(*args, **kwargs) -> None:
+        """instructor hook: count LLM attempts and request bytes on the current span."""
+        if get_tracer().enabled:
+            current_span().add(
+                llm_attempts=1,
+                request_bytes=len(json.dumps(kwargs.get("messages", []), default=str)),
+            )
+
+    @staticmethod
+    def _trace_usage(response) -> None:
+        """instructor hook: add the completion's token usage to the current span."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            current_span().add(
+                prompt_tokens=usage.prompt_tokens or 0,
+                completion_tokens=usage.completion_tokens or 0,
+            )
+
+    @staticmethod
+    def _payload_bytes(value) -> int:
+        if not get_tracer().enabled or value is None:
+            return 0
+        return len(value.model_dump_json())
+
+    def trace_report(self) -> Optional[Dict]:
+        """
+        Per-operation timings of this Orchestrator's queries, if tracing with summaries is on.
+
+        Returns:
+            Optional[Dict]: {"spans": per span name totals, "folded": flame graph stacks}, or None
+        """
+        summary = get_tracer().summary(self.session_id)
+        if summary is None:
+            return None
+        return {"spans": summary.report(), "folded": summary.folded()}
+
+    def _remember_context(self, output) -> None:
+        if output is None or (self.evaluator is None and self.answer_cache is None):
+            return
+        self._retrieved.append(output_text(output))
+        if isinstance(output, KnowledgeBaseOutputSchema):
+            self._searched_knowledge_base = True
+            self._sources.update(
+                result.metadata["source"] for result in output.combined_results if "source" in result.metadata
             )
-            print(f"\n=== Running {tool_name} ===")
-            print(f"Parameters: {params}")
-            output = tool.run(params=params)
-            print(f"\n=== {tool_name} Results ===")
-            print(f"Main Answer: {output.answer}")
-            print(f"Sources: {output.documents}")
-            print("=" * 50)
+
+    def _start_query(self) -> bool:
+        """Reset the per-query state, returning whether the query starts the conversation."""
+        self._retrieved = []
+        self._sources = set()
+        self._searched_knowledge_base = False
+        return self.memory.get_message_count() == 0
+
+    async def _cached_answer(self, query: str, standalone: bool) -> Optional[SemanticHit]:
+        """
+        A similar earlier question's answer or tool results.
+
+        Only the first question of a conversation is looked up (and stored), later
+        ones usually depend on what was said before.
+        """
+        if self.answer_cache is None or not standalone:
+            return None
+        hit = await asyncio.to_thread(self.answer_cache.lookup, query, self.model)
+        if hit is not None and hit.kind == "answer":
+            self.memory.initialize_turn()
+            self.memory.add_message("user", agent_input(query))
+            self.memory.add_message("assistant", PlanAnswerSchema(answer=hit.answer))
+        return hit
+
+    @staticmethod
+    def _with_context(query: str, hit: Optional[SemanticHit]) -> str:
+        """The first message of a run, with the tool results of a similar earlier question if there are any."""
+        if hit is None or hit.kind != "context" or not hit.context:
+            return query
+        return (
+            f"{query}\n\nResults of the tools run for the similar earlier question "
+            f"\"{hit.query}\":\n{hit.context}\n\n"
+            "Answer from them if they are enough, otherwise use the tools."
+        )
+
+    def _store_answer(self, query: str, answer: str, standalone: bool, started: float) -> None:
+        """Add a conversation's first answer to the answer cache, off the event loop."""
+        if self.answer_cache is None or not standalone:
+            return
+        asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                self.answer_cache.store,
+                query,
+                answer,
+                self.model,
+                sources=sorted(self._sources),
+                used_knowledge_base=self._searched_knowledge_base,
+                context="\n\n".join(self._retrieved),
+                seconds=time.perf_counter() - started,
+            ),
+        )
+
+    def _evaluate(self, query: str, answer: str) -> None:
+        """Hand the answer and this query's tool results to the evaluator, without waiting for a score."""
+        if self.evaluator is not None and self._retrieved:
+            self.evaluator.submit(query, answer, self._retrieved, session_id=self.session_id)
+        self._retrieved = []
+
+    def _llm_slot(self):
+        """Context manager holding a scheduler slot for one async LLM call, if there is a scheduler."""
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.slot(self.session_id)
+
+    async def _agent_arun(self, chat_message: str):
+        async with self._llm_slot():
+            return await asyncio.to_thread(self._agent_run, chat_message)
+
+    def _agent_run(self, chat_message: str):
+        with span("llm.agent_run", model=self.model):
+            return self.agent.run(agent_input(chat_message))
+
+    def _cache_config(self, tool) -> Dict:
+        """The config values that change a tool's answer, part of its cache key."""
+        return tool.cache_config() if hasattr(tool, "cache_config") else {}
+
+    def _cache_get(self, tool_name: str, params):
+        if self.cache is None:
+            return None
+        return self.cache.get(
+            tool_name,
+            params,
+            self.tools.spec(tool_name).output_schema,
+            self._cache_config(self.tools.get(tool_name)),
+        )
+
+    def _cache_set(self, tool_name: str, params, output) -> None:
+        if self.cache is None or output is None:
+            return
+        if isinstance(output, KnowledgeBaseOutputSchema) and not output.combined_results:
+            return  # KnowledgeBase.run returns an empty output on errors, don't pin it
+        self.cache.set(
+            tool_name, params, output, self._cache_config(self.tools.get(tool_name))
+        )
+
+    def _ingest_sources(self, output) -> None:
+        """Queue the pages a web search cited for background ingestion into the knowledge base."""
+        if not self.ingest_web_sources or not isinstance(output, WebSearchOutputSchema):
+            return
+        if "KnowledgeBase" not in self.tools.names():
+            return
+        urls = [
+            document.get("metadata", {}).get("url")
+            for document in output.documents
+            if isinstance(document, dict)
+        ]
+        queued = self.tools.get("KnowledgeBase").ingest_in_background(url for url in urls if url)
+        current_span().add(sources_queued=queued)
+
+    def _tool_kwargs(self, tool_name: str) -> Dict:
+        if not self.tools.spec(tool_name).uses_history:
+            return {}
+        from backend.setup.CompactMemory import CompactMemory
+
+        if isinstance(self.agent.memory, CompactMemory):
+            return {"history": self.agent.memory.get_compact_history()}
+        return {"history": self.agent.memory.get_history()}
+
+    def _format_result(self, tool_name: str, output) -> str:
+        """Tool output as sent to the agent, with large payloads kept out of the prompt."""
+        from backend.setup.CompactMemory import CompactMemory
+
+        if isinstance(self.agent.memory, CompactMemory):
+            return self.agent.memory.format_tool_result(tool_name, output)
+        return f"Tool {tool_name} returned: {output}"
+
+    def execute_tool(
+        self,
+        tool_name: str,
+        params: Union[WebSearchInputSchema, KnowledgeBaseInputSchema, FileCatalogInputSchema],
+    ) -> Union[WebSearchOutputSchema, KnowledgeBaseOutputSchema, FileCatalogOutputSchema]:
+        with span(
+            "tool.execute", tool=tool_name, request_bytes=self._payload_bytes(params)
+        ) as tool_span:
+            cached = self._cache_get(tool_name, params)
+            tool_span.set(cache="off" if self.cache is None else "hit" if cached is not None else "miss")
+            if cached is not None:
+                logger.info("=== %s (cached) ===", tool_name)
+                output = cached
+            else:
+                output = self._execute_tool(tool_name, params)
+                self._cache_set(tool_name, params, output)
+                self._ingest_sources(output)
+            tool_span.set(response_bytes=self._payload_bytes(output))
+            self._remember_context(output)
             return output
-        elif tool_name == "KnowledgeBase":
-            tool = KnowledgeBase()
-            print(f"\n=== Running {tool_name} ===")
-            print(f"Parameters: {params}")
-            output = tool.run(params=params)
-            print(f"\n=== {tool_name} Results ===")
-            print(f"Main Answer: {output.answer}")
-            print(f"Sources: {output.documents}")
-            print("=" * 50)
-            
 
-    def __call__(self, query: str, max_iterations: int = 5) -> OrchestratorOutputSchema:
+    def _execute_tool(
+        self,
+        tool_name: str,
+        params: Union[WebSearchInputSchema, KnowledgeBaseInputSchema, FileCatalogInputSchema],
+    ) -> Union[WebSearchOutputSchema, KnowledgeBaseOutputSchema, FileCatalogOutputSchema]:
+        tool = self.tools.get(tool_name)
+        logger.info("=== Running %s ===", tool_name)
+        logger.debug("Parameters: %s", params)
+        output = tool.run(params, **self._tool_kwargs(tool_name))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("=== %s Results ===\n%s", tool_name, str(output)[:1000])
+        return output
+
+    async def execute_tool_async(
+        self,
+        tool_name: str,
+        params: Union[WebSearchInputSchema, KnowledgeBaseInputSchema, FileCatalogInputSchema],
+        remember: bool = True,
+    ) -> Union[WebSearchOutputSchema, KnowledgeBaseOutputSchema, FileCatalogOutputSchema]:
         """
-        Execute the agent's task with the given query, running tools and continuing until done.
+        Run a tool without blocking the event loop, bounded by the tool's timeout.
+
+        Args:
+            remember (bool): Keep the result as context of the current query, False for speculative calls
+
+        Raises:
+            asyncio.TimeoutError: If the tool did not finish within its timeout
         """
-        current_iteration = 0
-        print(f"\n🤖 Initial Query: {query}\n")
-        response = self.agent.run(BaseAgentInputSchema(chat_message=query))
-        print(f"🤔 Agent Reasoning: {response.reasoning}\n")
-
-        while not response.done and current_iteration < max_iterations:
-            if response.tool and response.tool_parameters:
-                try:
-                    print(f"\n📎 Iteration {current_iteration + 1}")
-                    action_result = self.execute_tool(
-                        tool_name=response.tool, params=response.tool_parameters
-                    )
+        with span(
+            "tool.execute", tool=tool_name, request_bytes=self._payload_bytes(params)
+        ) as tool_span:
+            cached = self._cache_get(tool_name, params)
+            tool_span.set(cache="off" if self.cache is None else "hit" if cached is not None else "miss")
+            if cached is not None:
+                if remember:
+                    self._remember_context(cached)
+                return cached
+            tool = self.tools.get(tool_name)
+            if hasattr(tool, "arun"):
+                # Native async tools, so a timeout really cancels e.g. the HTTP request
+                call = tool.arun(params, **self._tool_kwargs(tool_name))
+            else:
+                call = asyncio.to_thread(self._execute_tool, tool_name, params)
+            output = await asyncio.wait_for(call, timeout=self.tool_timeouts.get(tool_name))
+            self._cache_set(tool_name, params, output)
+            self._ingest_sources(output)
+            tool_span.set(response_bytes=self._payload_bytes(output))
+            if remember:
+                self._remember_context(output)
+            return output
+
+    def _prefetch(self, call: ToolCall) -> str:
+        """Start a tool call before it is known to be needed, returning its key. Started once per key."""
+        key = cache_key(call.tool, call.tool_parameters)
+        if key not in self._prefetched:
+            task = asyncio.create_task(
+                self.execute_tool_async(call.tool, call.tool_parameters, remember=False)
+            )
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Discarded tasks may fail unseen
+            self._prefetched[key] = task
+            self.prefetch_stats["started"] += 1
+            current_span().add(prefetch_started=1)
+        return key
+
+    def _speculate(self, partial: Dict) -> None:
+        """
+        Prefetch the tool calls of a partial speculative output that are complete.
+
+        A call is complete once the model has moved past it: to the next call, or
+        to the reasoning and done fields that follow the calls.
+        """
+        moved_on = "reasoning" in partial or "done" in partial
+        if isinstance(partial.get("tool_calls"), list):
+            raw_calls = partial["tool_calls"] if moved_on else partial["tool_calls"][:-1]
+        elif moved_on and "tool" in partial and "tool_parameters" in partial:
+            raw_calls = [{"tool": partial["tool"], "tool_parameters": partial["tool_parameters"]}]
+        else:
+            return
+        for raw in raw_calls:
+            try:
+                self._prefetch(ToolCall.model_validate(raw))
+            except ValidationError:
+                continue  # Invalid calls are left to the final validation
+
+    def _discard_prefetched(self, keep: Optional[set] = None) -> None:
+        """Cancel the speculative calls whose key isn't in `keep`."""
+        for key in [key for key in self._prefetched if key not in (keep or set())]:
+            task = self._prefetched.pop(key)
+            task.cancel()
+            self.prefetch_stats["discarded"] += 1
+            current_span().add(prefetch_discarded=1)
+
+    def _tool_calls(self, response: BaseIOSchema) -> List[ToolCall]:
+        """Normalise single and parallel agent outputs into a list of tool calls."""
+        if hasattr(response, "tool_calls"):
+            return response.tool_calls
+        if response.tool and response.tool_parameters:
+            return [ToolCall(tool=response.tool, tool_parameters=response.tool_parameters)]
+        return []
+
+    async def _run_step(self, calls: List[ToolCall]) -> str:
+        """
+        Run all tool calls of one step concurrently and format their results for the agent.
+
+        Calls that fail or time out are reported back to the agent instead of
+        aborting the step, so the next LLM turn starts as soon as every call has
+        either returned or been cancelled.
+        """
+        with span("orchestrator.step", tool_calls=len(calls)):
+            tasks = [
+                asyncio.create_task(self.execute_tool_async(call.tool, call.tool_parameters))
+                for call in calls
+            ]
+            try:
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+        lines = []
+        for call, result in zip(calls, results):
+            if isinstance(result, asyncio.TimeoutError):
+                lines.append(
+                    f"❌ Tool {call.tool} timed out after {self.tool_timeouts.get(call.tool)}s"
+                )
+            elif isinstance(result, Exception):
+                lines.append(f"❌ Error executing tool {call.tool}: {str(result)}")
+            else:
+                lines.append(self._format_result(call.tool, result))
+        return "\n".join(lines)
+
+    async def arun(
+        self, query: str, max_iterations: int = 5
+    ) -> Union[OrchestratorOutputSchema, ParallelOrchestratorOutputSchema]:
+        """
+        Async counterpart of `__call__` that runs the tool calls of each step concurrently.
+
+        The LLM turns run in a worker thread so several orchestrators can share
+        one event loop, and each tool call is bounded by `tool_timeouts`.
+        """
+        with span("orchestrator.run", session_id=self.session_id, mode="async") as run_span:
+            current_iteration = 0
+            self._start_query()
+            logger.info("🤖 Initial Query: %s", query)
+            response = await self._agent_arun(query)
+            logger.info("🤔 Agent Reasoning: %s", response.reasoning)
+
+            while not response.done and current_iteration < max_iterations:
+                calls = self._tool_calls(response)
+                if calls:
+                    logger.info("📎 Iteration %d (%d tool calls)", current_iteration + 1, len(calls))
+                    next_prompt = await self._run_step(calls)
+                    response = await self._agent_arun(next_prompt)
+                    logger.info("🤔 Agent Reasoning: %s", response.reasoning)
+
+                current_iteration += 1
+
+            run_span.set(iterations=current_iteration)
+            if current_iteration >= max_iterations:
+                logger.warning("⚠️ Reached maximum iterations (%d)", max_iterations)
+                return self.agent.memory.get_history()
+
+            logger.info("✅ Task completed!")
+            self._evaluate(query, response.reasoning)
+            return response
+
+    async def _astream_turn(
+        self,
+        chat_message: str,
+        iteration: int,
+        result: Dict,
+        output_schema: Optional[type] = None,
+        system_prompt_gen: Optional[SystemPromptGenerator] = None,
+        stream_field: str = "reasoning",
+        speculate: bool = False,
+    ) -> AsyncIterator[ReasoningDelta]:
+        """
+        One agent turn, streamed.
 
-                    # Get next action from agent
-                    next_prompt = f"Tool {response.tool} returned: {action_result}"
-                    response = self.agent.run(
-                        BaseAgentInputSchema(chat_message=next_prompt)
+        Mirrors `BaseAgent.run` (same prompt, same structured output request and
+        memory updates) but yields the reasoning as it is generated. instructor's
+        own partial models reject half-written `Literal` values such as `tool`, so
+        the stream is parsed with jiter's partial mode instead and the complete
+        output is validated at the end. An output that doesn't validate is repaired
+        locally if it can be, and regenerated with instructor otherwise. The
+        response is left in `result["response"]`.
+
+        Args:
+            output_schema (Optional[type]): Defaults to the agent's output schema
+            system_prompt_gen (Optional[SystemPromptGenerator]): Defaults to the agent's system prompt
+            stream_field (str): The string field streamed as ReasoningDelta events
+            speculate (bool): Start tool calls as soon as they are complete in the partial output
+        """
+        output_schema = output_schema or self.output_schema
+        system_prompt_gen = system_prompt_gen or self.system_prompt_gen
+        with span("llm.stream_turn", model=self.model, iteration=iteration) as turn_span:
+            self.memory.initialize_turn()
+            self.memory.add_message("user", agent_input(chat_message))
+            messages = [
+                {"role": "system", "content": system_prompt_gen.generate_prompt()}
+            ] + self.memory.get_history()
+            request = structured_request(output_schema, messages, self.structured_output)
+            self._trace_request(**request)
+
+            text = ""
+            reasoning = ""
+            tokens = 0
+            started = time.perf_counter()
+            async with self._llm_slot():
+                turn_span.set(queued_ms=round((time.perf_counter() - started) * 1000, 2))
+                started = time.perf_counter()
+                stream = await self.async_llm.chat.completions.create(
+                    model=self.model,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **request,
+                )
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        self._trace_usage(chunk)
+                        tokens = completion_tokens(chunk)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    if not text:
+                        turn_span.set(first_token_ms=round((time.perf_counter() - started) * 1000, 2))
+                    text += delta
+                    partial = partial_json(text)
+                    if speculate:
+                        self._speculate(partial)
+                    current = partial.get(stream_field) or ""
+                    if isinstance(current, str) and len(current) > len(reasoning):
+                        yield ReasoningDelta(iteration=iteration, delta=current[len(reasoning) :])
+                        reasoning = current
+
+                response = await self.async_client.asettle(
+                    text, tokens, started, messages, self.model, output_schema
+                )
+            self.memory.add_message("assistant", response)
+            result["response"] = response
+
+    async def _astream_step(
+        self, calls: List[ToolCall], iteration: int, results: List[str]
+    ) -> AsyncIterator[OrchestratorEvent]:
+        """
+        Run a step's tool calls concurrently, yielding an event as each one starts and settles.
+
+        Calls already started speculatively are awaited instead of run again.
+        """
+
+        async def timed(index: int, call: ToolCall, prefetched: Optional[asyncio.Task]):
+            start = time.perf_counter()
+            try:
+                if prefetched is not None:
+                    output = await prefetched
+                    self._remember_context(output)
+                else:
+                    output = await self.execute_tool_async(call.tool, call.tool_parameters)
+                return index, call, output, None, time.perf_counter() - start
+            except asyncio.TimeoutError:
+                error = f"timed out after {self.tool_timeouts.get(call.tool)}s"
+            except Exception as e:
+                error = str(e)
+            return index, call, None, error, time.perf_counter() - start
+
+        with span("orchestrator.step", iteration=iteration, tool_calls=len(calls)):
+            tasks = []
+            for index, call in enumerate(calls):
+                prefetched = self._prefetched.pop(cache_key(call.tool, call.tool_parameters), None)
+                if prefetched is not None:
+                    self.prefetch_stats["used"] += 1
+                    current_span().add(prefetch_used=1)
+                yield ToolStarted(
+                    iteration=iteration,
+                    call_id=f"{iteration}.{index}",
+                    tool=call.tool,
+                    parameters=call.tool_parameters.model_dump(),
+                    speculative=prefetched is not None,
+                )
+                tasks.append(asyncio.create_task(timed(index, call, prefetched)))
+
+            lines = [""] * len(calls)
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    index, call, output, error, duration = await next_done
+                    if error is None:
+                        lines[index] = self._format_result(call.tool, output)
+                    else:
+                        lines[index] = f"❌ Error executing tool {call.tool}: {error}"
+                    yield ToolFinished(
+                        iteration=iteration,
+                        call_id=f"{iteration}.{index}",
+                        tool=call.tool,
+                        duration=duration,
+                        output=output.model_dump() if output is not None else None,
+                        error=error,
                     )
-                    print(f"\n🤔 Agent Reasoning: {response.reasoning}\n")
+            finally:
+                for task in tasks:
+                    task.cancel()
+        results.append("\n".join(lines))
+
+    async def astream(
+        self, query: str, max_iterations: int = 5
+    ) -> AsyncIterator[OrchestratorEvent]:
+        """
+        Run the agent loop and yield typed events as they happen.
+
+        Reasoning is streamed token by token from the partial structured output,
+        tool calls emit started/finished events, and a FinalAnswer always ends the
+        stream. Closing the generator cancels in-flight tool calls. With an answer
+        cache, a conversation's first question may be answered (FinalAnswer.cached)
+        or given tool results from a similar earlier question.
+        """
+        with span("orchestrator.run", session_id=self.session_id, mode="stream") as run_span:
+            current_iteration = 0
+            started = time.perf_counter()
+            standalone = self._start_query()
+            hit = await self._cached_answer(query, standalone)
+            run_span.set(answer_cache=hit.kind if hit else "miss")
+            if hit is not None and hit.kind == "answer":
+                yield FinalAnswer(answer=hit.answer, completed=True, cached=True)
+                return
+            try:
+                question_lookup = None
+                if self.prefetch_knowledge_base and standalone and hit is None:
+                    question_lookup = self._prefetch_question(query)
+                turn = {}
+                async for event in self._astream_turn(
+                    self._with_context(query, hit), current_iteration, turn, speculate=self.speculative
+                ):
+                    yield event
+                response = turn["response"]
 
-                except Exception as e:
-                    error_message = f"❌ Error executing tool {response.tool}: {str(e)}"
-                    print(error_message)
-                    response = self.agent.run(
-                        BaseAgentInputSchema(chat_message=error_message)
+                while not response.done and current_iteration < max_iterations:
+                    calls = self._tool_calls(response)
+                    self._discard_prefetched(
+                        keep={cache_key(call.tool, call.tool_parameters) for call in calls} | {question_lookup}
                     )
-                    print(f"\n🤔 Agent Reasoning: {response.reasoning}\n")
+                    if calls:
+                        results = []
+                        async for event in self._astream_step(calls, current_iteration, results):
+                            yield event
+                        if question_lookup in self._prefetched:
+                            results[0] += await self._question_results(question_lookup)
+                        question_lookup = None
+                        turn = {}
+                        async for event in self._astream_turn(
+                            results[0], current_iteration + 1, turn, speculate=self.speculative
+                        ):
+                            yield event
+                        response = turn["response"]
+
+                    current_iteration += 1
+            finally:
+                self._discard_prefetched()
+
+            run_span.set(iterations=current_iteration, **self.prefetch_stats)
+        if response.done:
+            self._store_answer(query, response.reasoning, standalone, started)
+            self._evaluate(query, response.reasoning)
+        yield FinalAnswer(answer=response.reasoning, completed=bool(response.done))
+
+    def _prefetch_question(self, query: str) -> Optional[str]:
+        """Start a knowledge base search for the question itself, returning its key."""
+        if "KnowledgeBase" not in self.tools.names():
+            return None
+        params = KnowledgeBaseInputSchema(keywords=query_keywords(query), questions=[query])
+        return self._prefetch(ToolCall(tool="KnowledgeBase", tool_parameters=params))
+
+    async def _question_results(self, key: str) -> str:
+        """The prefetched knowledge base search for the question, to add to the first tool results."""
+        task = self._prefetched.pop(key)
+        try:
+            output = await task
+        except Exception as e:
+            logger.warning("Knowledge base prefetch failed: %s", e)
+            self.prefetch_stats["discarded"] += 1
+            return ""
+        self.prefetch_stats["used"] += 1
+        current_span().add(prefetch_used=1)
+        self._remember_context(output)
+        return "\nKnowledgeBase results for the question: " + self._format_result("KnowledgeBase", output)
+
+    async def astream_plan(self, query: str) -> AsyncIterator[OrchestratorEvent]:
+        """
+        Plan-then-execute: one LLM call plans every tool call, one writes the answer.
+
+        The plan is a dependency graph (PlanOutputSchema), executed by PlanExecutor
+        with independent steps running concurrently and results fed into the
+        steps that depend on them. Events are the same as `astream`: the plan's
+        reasoning streams as iteration 0, the answer as iteration 1.
+        """
+        with span("orchestrator.run", session_id=self.session_id, mode="plan") as run_span:
+            started = time.perf_counter()
+            standalone = self._start_query()
+            hit = await self._cached_answer(query, standalone)
+            run_span.set(answer_cache=hit.kind if hit else "miss")
+            if hit is not None and hit.kind == "answer":
+                yield FinalAnswer(answer=hit.answer, completed=True, cached=True)
+                return
+            turn = {}
+            async for event in self._astream_turn(
+                self._with_context(query, hit),
+                0,
+                turn,
+                output_schema=PlanOutputSchema,
+                system_prompt_gen=self.plan_prompt_gen,
+            ):
+                yield event
+            plan = turn["response"]
+            run_span.set(plan_nodes=len(plan.nodes))
+
+            executor = PlanExecutor(self.execute_tool_async, timeouts=self.tool_timeouts)
+            async for event in executor.run(plan.nodes, iteration=0):
+                yield event
+
+            lines = [
+                f"Step {node.id}: "
+                + (
+                    self._format_result(node.tool, executor.outputs[node.id])
+                    if node.id in executor.outputs
+                    else f"❌ Error executing tool {node.tool}: {executor.errors.get(node.id)}"
+                )
+                for node in plan.nodes
+            ]
+            turn = {}
+            async for event in self._astream_turn(
+                "\n".join(lines) or "No tools were needed, answer the request directly.",
+                1,
+                turn,
+                output_schema=PlanAnswerSchema,
+                system_prompt_gen=self.answer_prompt_gen,
+                stream_field="answer",
+            ):
+                yield event
+        self._store_answer(query, turn["response"].answer, standalone, started)
+        self._evaluate(query, turn["response"].answer)
+        yield FinalAnswer(answer=turn["response"].answer, completed=True)
+
+    async def arun_plan(self, query: str) -> PlanAnswerSchema:
+        """Plan-then-execute without events, see `astream_plan`."""
+        answer = None
+        async for event in self.astream_plan(query):
+            if isinstance(event, FinalAnswer):
+                answer = PlanAnswerSchema(answer=event.answer)
+        return answer
+
+    def run_plan(self, query: str) -> PlanAnswerSchema:
+        """Blocking `arun_plan`, for scripts."""
+
+        async def run() -> PlanAnswerSchema:
+            try:
+                return await self.arun_plan(query)
+            finally:
+                await close_async_clients()  # The loop ends with this call, so do its clients
+
+        return asyncio.run(run())
+
+    def __call__(self, query: str, max_iterations: int = 5) -> OrchestratorOutputSchema:
+        """
+        Execute the agent's task with the given query, running tools and continuing until done.
+        """
+        with span("orchestrator.run", session_id=self.session_id, mode="sync") as run_span:
+            current_iteration = 0
+            self._start_query()
+            logger.info("🤖 Initial Query: %s", query)
+            response = self._agent_run(query)
+            logger.info("🤔 Agent Reasoning: %s", response.reasoning)
+
+            while not response.done and current_iteration < max_iterations:
+                if response.tool and response.tool_parameters:
+                    try:
+                        logger.info("📎 Iteration %d", current_iteration + 1)
+                        action_result = self.execute_tool(
+                            tool_name=response.tool, params=response.tool_parameters
+                        )
+
+                        # Get next action from agent
+                        next_prompt = self._format_result(response.tool, action_result)
+                        response = self._agent_run(next_prompt)
+                        logger.info("🤔 Agent Reasoning: %s", response.reasoning)
+
+                    except Exception as e:
+                        error_message = f"❌ Error executing tool {response.tool}: {str(e)}"
+                        logger.error(error_message)
+                        response = self._agent_run(error_message)
+                        logger.info("🤔 Agent Reasoning: %s", response.reasoning)
 
-            current_iteration += 1
+                current_iteration += 1
 
-        if current_iteration >= max_iterations:
-            print(f"\n⚠️ Warning: Reached maximum iterations ({max_iterations})")
-            return self.agent.memory.get_history()
+            run_span.set(iterations=current_iteration)
+            if current_iteration >= max_iterations:
+                logger.warning("⚠️ Reached maximum iterations (%d)", max_iterations)
+                return self.agent.memory.get_history()
 
-        print("\n✅ Task completed!")
-        # add messages to evaluation dataset
-        return response
+            logger.info("✅ Task completed!")
+            self._evaluate(query, response.reasoning)
+            return response
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    ToolRegistry.default().warmup()
     ag = Orchestrator()
     r = ag("Hello Agent, can you tell me about setting up Hyprland on Fedora Linux?")
     print("\n🔍 Final Response:")
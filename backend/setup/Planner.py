@@ -0,0 +1,269 @@
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional, Type, Union
+
+from atomic_agents.lib.base.base_io_schema import BaseIOSchema
+from pydantic import BaseModel, Field, ValidationError, model_validator
+
+from backend.Agents.FileCatalog import FileCatalogInputSchema
+from backend.Agents.KnowledgeBase import KnowledgeBaseInputSchema, KnowledgeBaseOutputSchema
+from backend.Agents.PerplexityLocal import WebSearchInputSchema, WebSearchOutputSchema
+from backend.setup.Events import ToolFinished, ToolStarted
+from backend.setup.Tracing import span
+
+
+## Plan-then-execute
+# The model emits every tool call of a query as a dependency graph in one structured
+# output, the graph is executed with independent nodes running concurrently, and one
+# reflection call turns the results into the answer: ~2 LLM calls per query instead of
+# one per tool step.
+
+PLACEHOLDER = re.compile(r"\{\{\s*([\w-]+)\s*\}\}")
+
+# The `tool_parameters` Unions are untagged: without `match_tool_parameters` any tool's
+# parameters validate for any tool, and the mismatch only fails when the tool runs.
+TOOL_INPUT_SCHEMAS: Dict[str, Type[BaseModel]] = {
+    "WebSearch": WebSearchInputSchema,
+    "KnowledgeBase": KnowledgeBaseInputSchema,
+    "FileCatalog": FileCatalogInputSchema,
+}
+
+
+def match_tool_parameters(data: Any) -> Any:
+    """
+    Validate a tool call's `tool_parameters` with the input schema of its `tool`.
+
+    Runs as a `mode="before"` model validator, so parameters of the wrong tool are a
+    ValidationError that structured output can repair or re-ask.
+    """
+    if not isinstance(data, dict):
+        return data
+    schema = TOOL_INPUT_SCHEMAS.get(data.get("tool"))
+    params = data.get("tool_parameters")
+    if schema is None or params is None or isinstance(params, schema):
+        return data
+    if isinstance(params, BaseModel):
+        params = params.model_dump()
+    try:
+        return {**data, "tool_parameters": schema.model_validate(params)}
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+        raise ValueError(f"tool_parameters are not valid {schema.__name__} for {data['tool']}: {problems}") from None
+
+
+class PlanNode(BaseIOSchema):
+    """One tool call of a plan."""
+
+    id: str = Field(..., description="Short unique identifier of this step, e.g. 'search_1'")
+    tool: Literal["WebSearch", "KnowledgeBase", "FileCatalog"] = Field(
+        ..., description="The tool to use. Must be one of the available tools."
+    )
+    tool_parameters: Union[WebSearchInputSchema, KnowledgeBaseInputSchema, FileCatalogInputSchema] = Field(
+        ...,
+        description="The parameters for the selected tool. Text parameters may contain '{{id}}' to insert the result of a step listed in depends_on.",
+    )
+    depends_on: List[str] = Field(
+        default_factory=list,
+        description="Ids of the steps whose results this step needs. Leave empty so the step runs immediately.",
+    )
+
+    _match_tool_parameters = model_validator(mode="before")(match_tool_parameters)
+
+
+class PlanOutputSchema(BaseIOSchema):
+    """The full plan of tool calls for the user's request, as a dependency graph."""
+
+    reasoning: str = Field(
+        ..., description="Your explanation to the user of how the plan answers the request."
+    )
+    nodes: List[PlanNode] = Field(
+        default_factory=list,
+        description="Every tool call needed to answer. Steps without dependencies between them run concurrently. Leave empty if no tool is needed.",
+    )
+
+    @model_validator(mode="after")
+    def check_graph(self) -> "PlanOutputSchema":
+        """Reject duplicate ids, unknown dependencies and cycles, so instructor re-asks the model."""
+        execution_order(self.nodes)
+        return self
+
+
+class PlanAnswerSchema(BaseIOSchema):
+    """The final answer, written from the results of the executed plan."""
+
+    answer: str = Field(
+        ..., description="The answer to the user's request, based on the tool results."
+    )
+
+
+def execution_order(nodes: List[PlanNode]) -> List[List[PlanNode]]:
+    """
+    Group plan nodes into waves that can run concurrently (Kahn's algorithm).
+
+    Raises:
+        ValueError: If ids are duplicated, a dependency is unknown or the graph has a cycle
+    """
+    by_id: Dict[str, PlanNode] = {}
+    for node in nodes:
+        if node.id in by_id:
+            raise ValueError(f"Duplicate step id: {node.id}")
+        by_id[node.id] = node
+    for node in nodes:
+        unknown = [dependency for dependency in node.depends_on if dependency not in by_id]
+        if unknown:
+            raise ValueError(f"Step {node.id} depends on unknown steps: {', '.join(unknown)}")
+
+    remaining = {node.id: set(node.depends_on) for node in nodes}
+    waves = []
+    while remaining:
+        ready = [node_id for node_id, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError(f"Steps depend on each other in a cycle: {', '.join(remaining)}")
+        waves.append([by_id[node_id] for node_id in ready])
+        for node_id in ready:
+            del remaining[node_id]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+    return waves
+
+
+def output_text(output: BaseModel, max_chars: int = 1000) -> str:
+    """Short text of a tool result to insert into a dependent step's parameters."""
+    if isinstance(output, WebSearchOutputSchema):
+        text = output.answer
+    elif isinstance(output, KnowledgeBaseOutputSchema):
+        text = "\n".join(result.content for result in output.combined_results)
+    else:
+        text = output.model_dump_json()
+    return text[:max_chars]
+
+
+def resolve_parameters(params: BaseModel, results: Dict[str, str]) -> BaseModel:
+    """Replace '{{id}}' placeholders in string (and list of string) parameters with dependency results."""
+
+    def substitute(value):
+        if isinstance(value, str):
+            return PLACEHOLDER.sub(lambda match: results.get(match.group(1), match.group(0)), value)
+        if isinstance(value, list):
+            return [substitute(item) for item in value]
+        return value
+
+    updates = {}
+    for name in params.__class__.model_fields:
+        value = getattr(params, name)
+        resolved = substitute(value)
+        if resolved != value:
+            updates[name] = resolved
+    return params.model_copy(update=updates) if updates else params
+
+
+class PlanExecutor:
+    """
+    Runs a plan's nodes as soon as their dependencies have finished.
+
+    A node whose dependency failed is not run and fails too. Results are kept in
+    `outputs` and `errors`, keyed by node id.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[str, BaseModel], Awaitable[BaseModel]],
+        timeouts: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            execute (Callable): Runs one tool call, e.g. Orchestrator.execute_tool_async
+            timeouts (Optional[Dict[str, float]]): Per-tool timeouts, only used in error messages
+        """
+        self.execute = execute
+        self.timeouts = timeouts or {}
+        self.outputs: Dict[str, BaseModel] = {}
+        self.errors: Dict[str, str] = {}
+
+    async def _run_node(
+        self,
+        node: PlanNode,
+        dependencies: List["asyncio.Task"],
+        iteration: int,
+        events: "asyncio.Queue",
+    ) -> None:
+        """Run one node. Whatever happens, it ends with a ToolFinished event, which `run` counts."""
+        start = None
+        output, error = None, None
+        try:
+            if dependencies:
+                await asyncio.gather(*dependencies, return_exceptions=True)
+            failed = [dependency for dependency in node.depends_on if dependency in self.errors]
+            if failed:
+                error = f"skipped, dependency {', '.join(failed)} failed"
+                return
+
+            params = resolve_parameters(
+                node.tool_parameters,
+                {dependency: output_text(self.outputs[dependency]) for dependency in node.depends_on},
+            )
+            events.put_nowait(
+                ToolStarted(
+                    iteration=iteration, call_id=node.id, tool=node.tool, parameters=params.model_dump()
+                )
+            )
+            start = time.perf_counter()
+            try:
+                result = await self.execute(node.tool, params)
+            except asyncio.TimeoutError:
+                error = f"timed out after {self.timeouts.get(node.tool)}s"
+                return
+            output = result.model_dump()
+            self.outputs[node.id] = result
+        except asyncio.CancelledError:
+            error = "cancelled"
+            if asyncio.current_task().cancelling():
+                raise  # The plan is being closed; a cancel from inside the call is just a failed node
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            if error is not None:
+                output = None
+                self.errors[node.id] = error
+            events.put_nowait(
+                ToolFinished(
+                    iteration=iteration,
+                    call_id=node.id,
+                    tool=node.tool,
+                    duration=0.0 if start is None else time.perf_counter() - start,
+                    output=output,
+                    error=error,
+                )
+            )
+
+    async def run(
+        self, nodes: List[PlanNode], iteration: int = 0
+    ) -> AsyncIterator[Union[ToolStarted, ToolFinished]]:
+        """
+        Execute the plan, yielding an event as each node starts and settles.
+
+        Closing the generator cancels the nodes still running.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[str, asyncio.Task] = {}
+        with span("plan.execute", nodes=len(nodes)):
+            for wave in execution_order(nodes):
+                for node in wave:
+                    tasks[node.id] = asyncio.create_task(
+                        self._run_node(
+                            node,
+                            [tasks[dependency] for dependency in node.depends_on],
+                            iteration,
+                            events,
+                        )
+                    )
+            try:
+                finished = 0
+                while finished < len(nodes):
+                    event = await events.get()
+                    finished += isinstance(event, ToolFinished)
+                    yield event
+            finally:
+                for task in tasks.values():
+                    task.cancel()
@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+
+## Admission control for LLM calls
+# A local Ollama instance serves a handful of requests at once; everything above that
+# only queues inside Ollama, where one session's burst delays every other session.
+# The scheduler keeps at most `max_concurrent` LLM calls in flight and hands free
+# slots to the waiting session that has used the LLM the least.
+
+
+class Overloaded(Exception):
+    """Raised when too many LLM calls are already waiting for a slot."""
+
+
+class FairScheduler:
+    """
+    Bounds concurrent LLM calls and shares them fairly between sessions.
+
+    Each session accrues virtual time for the seconds it holds a slot. A free
+    slot goes to the waiting session with the lowest virtual time, so a session
+    running long, heavy turns yields to light ones instead of starving them. A
+    session returning after being idle starts at the current virtual time
+    rather than with banked credit. Calls of the same session are served in
+    arrival order.
+
+    Not thread-safe: use it from one event loop.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_waiting: int = 512, idle_timeout: float = 3600.0):
+        """
+        Args:
+            max_concurrent (int): LLM calls in flight at once, e.g. OLLAMA_NUM_PARALLEL
+            max_waiting (int): Calls allowed to wait for a slot before `acquire` raises Overloaded
+            idle_timeout (float): Seconds after which an idle session's virtual time is forgotten
+        """
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.idle_timeout = idle_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        self._vtime: Dict[str, float] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._floor = 0.0  # Virtual time of the last dispatched session
+        self.stats = {"admitted": 0, "rejected": 0, "queued": 0, "wait_seconds": 0.0}
+
+    def overloaded(self) -> bool:
+        """Whether a new call would be rejected right now, for an early 503."""
+        return self.waiting >= self.max_waiting
+
+    async def acquire(self, session_id: str) -> None:
+        """
+        Wait for an LLM slot.
+
+        Raises:
+            Overloaded: If `max_waiting` calls are already waiting
+        """
+        self._vtime[session_id] = max(self._vtime.get(session_id, 0.0), self._floor)
+        self._last_seen[session_id] = time.monotonic()
+        if self.in_flight < self.max_concurrent and not self.waiting:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return
+        if self.waiting >= self.max_waiting:
+            self.stats["rejected"] += 1
+            raise Overloaded(f"{self.waiting} LLM calls are already waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append(future)
+        self.waiting += 1
+        self.stats["queued"] += 1
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(session_id, 0.0)  # The slot was handed over as we were cancelled
+            else:
+                queue = self._queues.get(session_id)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    self.waiting -= 1
+                    if not queue:
+                        del self._queues[session_id]
+            raise
+        self.stats["admitted"] += 1
+        self.stats["wait_seconds"] += time.perf_counter() - start
+
+    def release(self, session_id: str, held: float) -> None:
+        """Free a slot, charging the session for the `held` seconds it used."""
+        self.in_flight -= 1
+        self._vtime[session_id] = self._vtime.get(session_id, self._floor) + held
+        self._dispatch()
+        self._forget_idle()
+
+    @asynccontextmanager
+    async def slot(self, session_id: str):
+        """`async with scheduler.slot(session_id):` around one LLM call."""
+        await self.acquire(session_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(session_id, time.perf_counter() - start)
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_concurrent and self._queues:
+            session_id = min(self._queues, key=self._vtime.__getitem__)
+            queue = self._queues[session_id]
+            future = queue.popleft()
+            self.waiting -= 1
+            if not queue:
+                del self._queues[session_id]
+            if future.cancelled():
+                continue
+            self._floor = max(self._floor, self._vtime[session_id])
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _forget_idle(self) -> None:
+        if len(self._last_seen) < 1024:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        for session_id in [s for s, seen in self._last_seen.items() if seen < cutoff]:
+            if session_id not in self._queues:
+                del self._last_seen[session_id]
+                self._vtime.pop(session_id, None)
+
+    def snapshot(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "waiting_sessions": len(self._queues),
+            "max_concurrent": self.max_concurrent,
+            **self.stats,
+        }
@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from backend.setup.Tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+## Cache of final answers keyed by the meaning of the question
+# Questions are embedded into a dedicated Chroma collection next to the knowledge base.
+# A new question close enough to a stored one gets its answer straight away; one that is
+# merely similar gets the stored tool results, so the agent can answer without new
+# searches. Entries citing knowledge base documents are dropped when those documents
+# change, and every entry expires after `ttl` since web results go stale.
+
+
+@dataclass
+class SemanticHit:
+    """A stored answer found for a new question."""
+
+    kind: str  # "answer": reuse the answer, "context": reuse the tool results
+    query: str
+    answer: str
+    context: str
+    similarity: float
+    seconds: float  # Wall time of the run that produced the answer
+
+
+def _source_key(source: str) -> str:
+    return "src_" + hashlib.sha1(source.encode()).hexdigest()[:16]
+
+
+class SemanticCache:
+    """
+    Final answers of earlier questions, looked up by embedding similarity.
+
+    Example:
+        cache = SemanticCache(knowledge_base=kb)
+        hit = cache.lookup("What is the housing policy?", model="qwen2.5:7b")
+        if hit is None:
+            answer = ...  # full Orchestrator run
+            cache.store(query, answer, model="qwen2.5:7b", sources=[...], context=..., seconds=...)
+    """
+
+    def __init__(
+        self,
+        knowledge_base=None,
+        path: str = "./chroma_db",
+        collection_name: str = "answer_cache",
+        embedding_function=None,
+        threshold: float = 0.92,
+        reuse_threshold: float = 0.80,
+        ttl: Optional[float] = 24 * 3600.0,
+        max_context_chars: int = 8000,
+    ):
+        """
+        Args:
+            knowledge_base (Optional[KnowledgeBase]): Shares its Chroma client and embedding function, and invalidates entries when its documents change
+            path (str): Chroma directory, if no knowledge base is given
+            collection_name (str): Collection holding the cached questions
+            embedding_function: Chroma embedding function, defaults to the knowledge base's or Chroma's own
+            threshold (float): Cosine similarity from which a stored answer is returned as is
+            reuse_threshold (float): Cosine similarity from which a stored answer's tool results are reused, None to disable
+            ttl (Optional[float]): Seconds an answer stays valid, None for no expiry
+            max_context_chars (int): Characters of tool results stored per answer
+        """
+        if knowledge_base is not None:
+            client = knowledge_base.client
+            embedding_function = embedding_function or knowledge_base.embedding_function
+            knowledge_base.add_listener(self.invalidate_sources)
+        else:
+            import chromadb  # Imported with the first cache, it takes over a second
+
+            client = chromadb.PersistentClient(path=path)
+        self.collection = client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"},
+            **({"embedding_function": embedding_function} if embedding_function else {}),
+        )
+        self.threshold = threshold
+        self.reuse_threshold = reuse_threshold
+        self.ttl = ttl
+        self.max_context_chars = max_context_chars
+        self.counters = {
+            "lookups": 0,
+            "answer_hits": 0,
+            "context_hits": 0,
+            "misses": 0,
+            "stored": 0,
+            "invalidated": 0,
+            "lookup_seconds": 0.0,
+            "seconds_saved": 0.0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self.counters[name] += value
+
+    def lookup(self, query: str, model: str) -> Optional[SemanticHit]:
+        """
+        The closest stored answer of `model` to `query`, if it is similar enough.
+
+        Returns:
+            Optional[SemanticHit]: kind "answer" above `threshold`, "context" above `reuse_threshold`, else None
+        """
+        started = time.perf_counter()
+        with span("cache.semantic_lookup") as lookup_span:
+            where = {"model": model}
+            if self.ttl is not None:
+                where = {"$and": [where, {"created": {"$gte": time.time() - self.ttl}}]}
+            try:
+                results = self.collection.query(
+                    query_texts=[query], n_results=1, where=where, include=["metadatas", "distances"]
+                )
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %s", e)
+                results = {"ids": [[]]}
+
+            hit = None
+            if results["ids"][0]:
+                metadata = results["metadatas"][0][0]
+                similarity = 1.0 - results["distances"][0][0]
+                lookup_span.set(similarity=round(similarity, 4))
+                kind = None
+                if similarity >= self.threshold:
+                    kind = "answer"
+                elif self.reuse_threshold is not None and similarity >= self.reuse_threshold:
+                    kind = "context"
+                if kind is not None:
+                    hit = SemanticHit(
+                        kind=kind,
+                        query=metadata["query"],
+                        answer=metadata["answer"],
+                        context=metadata.get("context", ""),
+                        similarity=similarity,
+                        seconds=metadata.get("seconds", 0.0),
+                    )
+            lookup_span.set(result=hit.kind if hit else "miss")
+
+        elapsed = time.perf_counter() - started
+        if hit is None:
+            self._count(lookups=1, misses=1, lookup_seconds=elapsed)
+        elif hit.kind == "answer":
+            self._count(lookups=1, answer_hits=1, lookup_seconds=elapsed, seconds_saved=max(0.0, hit.seconds - elapsed))
+        else:
+            self._count(lookups=1, context_hits=1, lookup_seconds=elapsed)
+        return hit
+
+    def store(
+        self,
+        query: str,
+        answer: str,
+        model: str,
+        sources: Optional[List[str]] = None,
+        used_knowledge_base: bool = False,
+        context: str = "",
+        seconds: float = 0.0,
+    ) -> None:
+        """
+        Remember the answer to a question.
+
+        Args:
+            query (str): The question as asked
+            answer (str): The final answer
+            model (str): Model that wrote it, only questions to the same model hit
+            sources (Optional[List[str]]): Knowledge base sources the answer was based on
+            used_knowledge_base (bool): Whether the knowledge base was searched, new documents then invalidate it
+            context (str): Tool results the answer was based on
+            seconds (float): Wall time of the run, counted as saved on each hit
+        """
+        metadata = {
+            "query": query,
+            "answer": answer,
+            "model": model,
+            "context": context[: self.max_context_chars],
+            "seconds": seconds,
+            "created": time.time(),
+            "knowledge_base": used_knowledge_base,
+        }
+        metadata.update({_source_key(source): True for source in sources or []})
+        try:
+            self.collection.add(ids=[uuid.uuid4().hex], documents=[query], metadatas=[metadata])
+        except Exception as e:
+            logger.warning("Semantic cache store failed: %s", e)
+            return
+        self._count(stored=1)
+
+    def invalidate_sources(self, sources: List[str], added: bool = False) -> None:
+        """
+        Drop answers based on documents that changed.
+
+        Args:
+            sources (List[str]): Knowledge base sources that were re-ingested or removed
+            added (bool): Some of them may be new, so every answer that searched the knowledge base is dropped
+        """
+        conditions = [{_source_key(source): True} for source in sources]
+        if added:
+            conditions.append({"knowledge_base": True})
+        before = self.collection.count()
+        for start in range(0, len(conditions), 100):
+            batch = conditions[start : start + 100]
+            self.collection.delete(where=batch[0] if len(batch) == 1 else {"$or": batch})
+        dropped = before - self.collection.count()
+        if dropped:
+            logger.info("Semantic cache: dropped %d answers after knowledge base changes", dropped)
+        self._count(invalidated=dropped)
+
+    def clear(self) -> None:
+        ids = self.collection.get(include=[])["ids"]
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def stats(self) -> Dict[str, float]:
+        """Counters, the hit rate and the mean lookup latency."""
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["lookups"]
+        stats["hit_rate"] = (stats["answer_hits"] + stats["context_hits"]) / lookups if lookups else 0.0
+        stats["mean_lookup_ms"] = round(stats["lookup_seconds"] / lookups * 1000, 2) if lookups else 0.0
+        stats["entries"] = self.collection.count()
+        return stats
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from backend.Agents.PerplexicaClient import close_async_clients
+from backend.setup.Events import OrchestratorEvent, StreamError
+from backend.setup.Gateway import close_gateways
+from backend.setup.Scheduler import Overloaded
+from backend.setup.SemanticCache import SemanticCache
+from backend.setup.Sessions import Session, SessionManager
+from backend.setup.Startup import prewarm
+from backend.setup.ToolRegistry import ToolRegistry
+
+logger = logging.getLogger(__name__)
+
+## Local multi-session endpoint for the Next.js workbench
+# GET /api/stream?query=...&session_id=... streams Orchestrator events as Server-Sent Events,
+# /api/ws does the same over a WebSocket ({"query": ...} in, one JSON event per message out).
+# plan=true switches to plan-then-execute (Orchestrator.astream_plan).
+# Sessions keep their own memory and share tools and LLM clients; LLM calls of all
+# sessions go through one FairScheduler sized for the local Ollama instance.
+# A session's first question may be answered from the semantic answer cache
+# (MOA_ANSWER_CACHE=0 turns it off). Pages cited by web searches are added to the
+# knowledge base in the background (MOA_INGEST_SOURCES=0 turns it off).
+# The server accepts connections right away: slow imports and tool warmup run in the
+# background at startup, and a query that needs them first waits for them.
+
+RETRY_AFTER = 5.0
+
+
+class SocketRequest(BaseModel):
+    """A query sent over the WebSocket."""
+
+    query: str
+    max_iterations: int = 5
+    plan: bool = False
+
+
+async def session_events(
+    session: Session, query: str, max_iterations: int = 5, plan: bool = False
+) -> AsyncIterator[OrchestratorEvent]:
+    """Run one query in a session, after any query of the same session still running."""
+    async with session.lock:
+        session.queries += 1
+        orchestrator = session.orchestrator
+        if plan:
+            stream = orchestrator.astream_plan(query)
+        else:
+            stream = orchestrator.astream(query, max_iterations=max_iterations)
+        try:
+            async for event in stream:
+                yield event
+        except Overloaded as e:
+            yield StreamError(message=str(e), retry_after=RETRY_AFTER)
+        except Exception as e:
+            # End the stream with an error event instead of cutting it off
+            logger.exception("Query failed in session %s", session.id)
+            yield StreamError(message=str(e) or type(e).__name__)
+
+
+def log_warmup_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Tool warmup failed: %r", task.exception())
+
+
+def create_app(manager: Optional[SessionManager] = None) -> FastAPI:
+    """
+    Args:
+        manager (Optional[SessionManager]): Sessions to serve, by default one built at startup
+            with OLLAMA_NUM_PARALLEL (default 4) concurrent LLM calls and a semantic answer cache
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        warmup = None
+        if manager is None:
+            prewarm()
+            answer_cache = None
+            if os.environ.get("MOA_ANSWER_CACHE", "1") != "0":
+                answer_cache = SemanticCache(knowledge_base=ToolRegistry.default().get("KnowledgeBase"))
+            app.state.sessions = SessionManager(
+                max_concurrent_llm=int(os.environ.get("OLLAMA_NUM_PARALLEL", 4)),
+                answer_cache=answer_cache,
+                ingest_web_sources=os.environ.get("MOA_INGEST_SOURCES", "1") != "0",
+                structured_output=os.environ.get("MOA_STRUCTURED_OUTPUT", "json"),
+            )
+            warmup = asyncio.create_task(asyncio.to_thread(ToolRegistry.default().warmup))
+            warmup.add_done_callback(log_warmup_error)
+        yield
+        if warmup is not None:
+            await asyncio.gather(warmup, return_exceptions=True)
+        await app.state.sessions.aclose()
+        await close_async_clients()
+        if manager is None:
+            ToolRegistry.default().shutdown()
+            close_gateways()
+
+    app = FastAPI(title="Mixture of Agents", lifespan=lifespan)
+    app.state.sessions = manager
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Session-Id"],
+    )
+
+    @app.post("/api/sessions")
+    async def create_session():
+        return {"session_id": app.state.sessions.create().id}
+
+    @app.delete("/api/sessions/{session_id}")
+    async def delete_session(session_id: str):
+        if not app.state.sessions.close(session_id):
+            raise HTTPException(status_code=404, detail="Unknown session")
+        return {"session_id": session_id}
+
+    @app.get("/api/stats")
+    async def stats():
+        return app.state.sessions.stats()
+
+    @app.get("/api/stream")
+    async def stream(
+        query: str, session_id: Optional[str] = None, max_iterations: int = 5, plan: bool = False
+    ):
+        sessions: SessionManager = app.state.sessions
+        if sessions.scheduler.overloaded():
+            raise HTTPException(
+                status_code=503,
+                detail="Too many queries in progress",
+                headers={"Retry-After": str(int(RETRY_AFTER))},
+            )
+        session = sessions.get(session_id)
+
+        async def events():
+            async for event in session_events(session, query, max_iterations, plan):
+                yield f"event: {event.type}\ndata: {event.model_dump_json()}\n\n"
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+                "X-Session-Id": session.id,
+            },
+        )
+
+    @app.websocket("/api/ws")
+    async def websocket(socket: WebSocket, session_id: Optional[str] = None):
+        await socket.accept()
+        session = app.state.sessions.get(session_id)
+        try:
+            while True:
+                try:
+                    request = SocketRequest.model_validate_json(await socket.receive_text())
+                except ValidationError as e:
+                    # A malformed message fails on its own, the socket stays open for the next one
+                    await socket.send_text(StreamError(message=f"Invalid request: {e}").model_dump_json())
+                    continue
+                async for event in session_events(
+                    session, request.query, max_iterations=request.max_iterations, plan=request.plan
+                ):
+                    await socket.send_text(event.model_dump_json())
+        except WebSocketDisconnect:
+            pass
+
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=8000)
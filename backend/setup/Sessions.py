@@ -0,0 +1,155 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Union
+
+from backend.setup.Gateway import LLMGateway, get_gateway
+from backend.setup.Orchestrator import Orchestrator
+from backend.setup.Scheduler import FairScheduler
+from backend.setup.SemanticCache import SemanticCache
+from backend.setup.StructuredOutput import SchemaStats
+from backend.setup.ToolCache import SQLiteTier, ToolCache
+from backend.setup.ToolRegistry import ToolRegistry
+
+
+## Many concurrent conversations in one process
+# Every session gets its own Orchestrator and CompactMemory. The LLM gateway and its
+# clients, tools, result cache and LLM scheduler are built once and shared by all sessions.
+
+
+@dataclass
+class Session:
+    """One user's conversation. `lock` serialises its queries, since they share one memory."""
+
+    id: str
+    orchestrator: Orchestrator
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    queries: int = 0
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+
+class SessionManager:
+    """
+    Creates, looks up and expires sessions that share clients, tools, cache and scheduler.
+
+    Sessions idle for `idle_timeout` seconds, or the least recently used ones
+    beyond `max_sessions`, are dropped, except while they are running a query.
+    """
+
+    def __init__(
+        self,
+        model: str = "qwen2.5:7b",
+        base_url: str = "http://127.0.0.1:11434/v1",
+        max_concurrent_llm: int = 4,
+        max_waiting: int = 512,
+        max_sessions: int = 1000,
+        idle_timeout: float = 1800.0,
+        parallel: bool = True,
+        tools: Optional[ToolRegistry] = None,
+        cache: Union[ToolCache, bool] = True,
+        memory_tokens: int = 4000,
+        gateway: Optional[LLMGateway] = None,
+        answer_cache: Optional[SemanticCache] = None,
+        ingest_web_sources: bool = False,
+        structured_output: str = "json",
+    ):
+        """
+        Args:
+            model (str): The Ollama model used by every session
+            base_url (str): OpenAI-compatible endpoint of the Ollama server
+            max_concurrent_llm (int): LLM calls in flight at once across all sessions
+            max_waiting (int): LLM calls allowed to queue before requests are rejected
+            max_sessions (int): Sessions kept in memory
+            idle_timeout (float): Seconds of inactivity after which a session is dropped
+            parallel (bool): Let sessions request several tool calls per step
+            tools (Optional[ToolRegistry]): Defaults to the process-wide registry
+            cache (Union[ToolCache, bool]): Shared tool result cache, True for the default memory + SQLite cache
+            memory_tokens (int): Token budget of each session's CompactMemory
+            gateway (Optional[LLMGateway]): Where LLM requests go, the process-wide one for base_url by default
+            answer_cache (Optional[SemanticCache]): Shared cache answering sessions' first questions from similar earlier ones
+            ingest_web_sources (bool): Add the pages web searches cite to the knowledge base in the background
+            structured_output (str): "json", or "json_schema" to constrain the model's decoding to each output schema
+        """
+        self.model = model
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.parallel = parallel
+        self.memory_tokens = memory_tokens
+        self.tools = tools or ToolRegistry.default()
+        if cache is True:
+            cache = ToolCache(disk=SQLiteTier())
+        self.cache = cache or False
+        self.scheduler = FairScheduler(max_concurrent=max_concurrent_llm, max_waiting=max_waiting)
+        # The scheduler decides which session's call goes next, the gateway then coalesces
+        # identical calls of different sessions and caps each model
+        self.gateway = gateway or get_gateway(base_url)
+        self.answer_cache = answer_cache
+        self.ingest_web_sources = ingest_web_sources
+        self.structured_output = structured_output
+        self.schema_stats = SchemaStats()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def create(self, session_id: Optional[str] = None) -> Session:
+        from backend.setup.CompactMemory import CompactMemory
+
+        session_id = session_id or uuid.uuid4().hex
+        orchestrator = Orchestrator(
+            model=self.model,
+            parallel=self.parallel,
+            cache=self.cache,
+            tools=self.tools,
+            memory=CompactMemory(max_tokens=self.memory_tokens),
+            gateway=self.gateway,
+            answer_cache=self.answer_cache,
+            ingest_web_sources=self.ingest_web_sources,
+            scheduler=self.scheduler,
+            session_id=session_id,
+            structured_output=self.structured_output,
+            schema_stats=self.schema_stats,
+        )
+        session = Session(id=session_id, orchestrator=orchestrator)
+        self._sessions[session_id] = session
+        self._expire()
+        return session
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """The session with this id, created if it doesn't exist (or if no id is given)."""
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            return self.create(session_id)
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session.id)
+        return session
+
+    def close(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.idle_timeout
+        for session in list(self._sessions.values()):
+            over_capacity = len(self._sessions) > self.max_sessions
+            if not (over_capacity or session.last_used < cutoff):
+                break  # Ordered by last use, the rest are newer
+            if not session.busy:
+                del self._sessions[session.id]
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "busy_sessions": sum(session.busy for session in self._sessions.values()),
+            "scheduler": self.scheduler.snapshot(),
+            "gateway": self.gateway.snapshot(),
+            "cache": self.cache.stats() if self.cache else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "structured_outputs": self.schema_stats.stats(),
+        }
+
+    async def aclose(self) -> None:
+        self._sessions.clear()
@@ -0,0 +1,140 @@
+import argparse
+import importlib
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+## Cold start
+# Backend modules import instructor, atomic_agents' BaseAgent, openai and chromadb where
+# they are first used, so entry points start in well under a second. A server calls
+# prewarm() at startup to import them on a daemon thread while it accepts connections,
+# instead of on the first query. `python -m backend.setup.Startup` reports where import
+# time goes and how long an Orchestrator takes to be ready.
+
+HEAVY_MODULES = (
+    "openai",
+    "chromadb",
+    "instructor",
+    "atomic_agents.agents.base_agent",
+    "backend.setup.CompactMemory",
+)
+
+
+def prewarm(modules: Iterable[str] = HEAVY_MODULES) -> threading.Thread:
+    """
+    Import modules on a daemon thread. Python's import lock makes a query that needs one
+    of them before the thread is done wait for that import instead of starting it again.
+
+    Args:
+        modules (Iterable[str]): Modules to import, by default the slow dependencies of the Orchestrator
+
+    Returns:
+        threading.Thread: The started thread
+    """
+    modules = list(modules)
+
+    def run():
+        for module in modules:
+            start = time.perf_counter()
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                logger.warning("Could not prewarm %s: %s", module, e)
+                continue
+            logger.debug("Prewarmed %s in %.2fs", module, time.perf_counter() - start)
+
+    thread = threading.Thread(target=run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_profile(module: str) -> List[Dict]:
+    """
+    Import a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): Dotted module name
+
+    Returns:
+        List[Dict]: One entry per imported module with its own ("self_ms") and cumulative
+            ("cumulative_ms") import time in milliseconds and its nesting depth, in import order
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    profile = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        profile.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return profile
+
+
+def readiness() -> Dict[str, float]:
+    """
+    Seconds to import the Orchestrator, to build one and to build its agent, which is when
+    instructor and atomic_agents' BaseAgent are imported. Run in a fresh interpreter to
+    measure a cold start.
+    """
+    start = time.perf_counter()
+    from backend.setup.Orchestrator import Orchestrator
+
+    imported = time.perf_counter()
+    orchestrator = Orchestrator(cache=False)
+    built = time.perf_counter()
+    orchestrator.agent
+    first_use = time.perf_counter()
+    return {
+        "import_s": round(imported - start, 3),
+        "construct_s": round(built - imported, 3),
+        "ready_s": round(built - start, 3),
+        "first_query_imports_s": round(first_use - built, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time per module and Orchestrator readiness")
+    parser.add_argument("--module", default="backend.setup.Orchestrator")
+    parser.add_argument("--top", type=int, default=15, help="Modules to list, by cumulative import time")
+    args = parser.parse_args()
+
+    profile = import_profile(args.module)
+    top = sorted(profile, key=lambda entry: entry["cumulative_ms"], reverse=True)[: args.top]
+    report = {
+        "module": args.module,
+        "total_ms": max(entry["cumulative_ms"] for entry in profile),
+        "modules": len(profile),
+        "slowest": top,
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", "import json; from backend.setup.Startup import readiness; print(json.dumps(readiness()))"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode == 0:
+        report["orchestrator"] = json.loads(result.stdout.splitlines()[-1])
+    else:
+        report["orchestrator"] = {"error": result.stderr.strip().splitlines()[-1:]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
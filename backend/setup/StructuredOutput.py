@@ -0,0 +1,382 @@
+import contextlib
+import difflib
+import functools
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from jiter import from_json
+from pydantic import BaseModel, ValidationError
+
+from backend.setup.Tracing import current_span
+
+## Structured outputs
+# Agent turns are JSON for a pydantic schema. In "json" mode the server is only asked for
+# some JSON object (instructor's Mode.JSON). In "json_schema" mode the schema itself is sent
+# as the response_format, which Ollama (0.5 and later) compiles into a grammar, so every
+# token the model samples keeps the reply valid. Older servers ignore it.
+# A reply that still doesn't validate is repaired locally first: code fences and prose
+# around the object, a truncated object and near-miss Literal values such as an unknown
+# `tool`. Only if that fails is the turn regenerated, with the validation error in the
+# prompt. SchemaStats counts each outcome per schema, with the tokens and time lost.
+
+MODES = ("json", "json_schema")
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+QUOTED = re.compile(r"'((?:[^'\\]|\\.)*)'")
+
+
+def check_mode(mode: str) -> str:
+    if mode not in MODES:
+        raise ValueError(f"Unknown structured output mode {mode!r}, expected one of {MODES}")
+    return mode
+
+
+def instructor_mode(mode: str):
+    """instructor's Mode for "json" or "json_schema"."""
+    import instructor
+
+    check_mode(mode)
+    return instructor.Mode.JSON_SCHEMA if mode == "json_schema" else instructor.Mode.JSON
+
+
+@functools.lru_cache(maxsize=None)
+def _schema(schema: Type[BaseModel]) -> Tuple[Dict, str]:
+    """The JSON schema of an output schema, and the instructions describing it. Building them takes milliseconds."""
+    json_schema = schema.model_json_schema()
+    instructions = (
+        "Reply with a JSON object, not the schema itself, that follows this JSON schema:\n\n"
+        + json.dumps(json_schema, indent=2, ensure_ascii=False)
+    )
+    return json_schema, instructions
+
+
+def structured_request(schema: Type[BaseModel], messages: List[Dict], mode: str = "json") -> Dict:
+    """
+    Chat completion arguments asking for a JSON reply following `schema`, as instructor's JSON modes build them.
+
+    Args:
+        schema (Type[BaseModel]): The output schema, described at the end of the system message
+        messages (List[Dict]): The conversation, starting with the system message, not modified
+        mode (str): "json" for a JSON object, "json_schema" to constrain decoding to the schema
+
+    Returns:
+        Dict: "messages" and "response_format"
+    """
+    check_mode(mode)
+    json_schema, instructions = _schema(schema)
+    system = {**messages[0], "content": f"{messages[0]['content']}\n\n{instructions}"}
+    if mode == "json_schema":
+        response_format = {"type": "json_schema", "json_schema": {"name": schema.__name__, "schema": json_schema}}
+    else:
+        response_format = {"type": "json_object"}
+    return {"messages": [system, *messages[1:]], "response_format": response_format}
+
+
+def _normalised(value: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", value.lower())
+
+
+def closest(value: str, choices: List[str]) -> Optional[str]:
+    """The choice `value` was most likely meant to be, ignoring case and punctuation, if any is close."""
+    by_form = {_normalised(choice): choice for choice in choices}
+    if _normalised(value) in by_form:
+        return by_form[_normalised(value)]
+    match = difflib.get_close_matches(_normalised(value), list(by_form), n=1, cutoff=0.6)
+    return by_form[match[0]] if match else None
+
+
+def _json_object(text: str) -> Optional[Dict]:
+    """The JSON object in a reply, with fences, surrounding prose, trailing commas and missing closing brackets tolerated."""
+    fenced = FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+    for candidate in (text, TRAILING_COMMA.sub(r"\1", text)):
+        try:
+            # Unfinished strings are dropped rather than kept cut short, the field is then missing
+            parsed = from_json(candidate.encode(), partial_mode="on")
+        except ValueError:
+            continue
+        if isinstance(parsed, dict):
+            return parsed
+    return None
+
+
+def _replace(data, loc, value) -> bool:
+    """Set the value at a pydantic error location, False if the location isn't in `data`."""
+    for key in loc[:-1]:
+        if isinstance(data, dict) and isinstance(key, str) and key in data:
+            data = data[key]
+        elif isinstance(data, list) and isinstance(key, int) and key < len(data):
+            data = data[key]
+        else:
+            return False
+    key = loc[-1] if loc else None
+    if not (isinstance(data, dict) and key in data or isinstance(data, list) and isinstance(key, int)):
+        return False
+    data[key] = value
+    return True
+
+
+def _fix_literals(data: Dict, error: ValidationError) -> bool:
+    """Replace string values rejected by a Literal with the closest allowed one, returning whether any was."""
+    fixed = False
+    for detail in error.errors():
+        if detail["type"] != "literal_error" or not isinstance(detail.get("input"), str):
+            continue
+        choice = closest(detail["input"], QUOTED.findall(detail.get("ctx", {}).get("expected", "")))
+        if choice is not None and _replace(data, detail["loc"], choice):
+            fixed = True
+    return fixed
+
+
+def repair(text: str, schema: Type[BaseModel]) -> Optional[BaseModel]:
+    """
+    Validate a reply that isn't valid as is, after cheap local fixes.
+
+    Args:
+        text (str): The model's reply
+        schema (Type[BaseModel]): The schema it should follow
+
+    Returns:
+        Optional[BaseModel]: The repaired output, or None if it needs to be regenerated
+    """
+    data = _json_object(text)
+    if data is None:
+        return None
+    for _ in range(2):
+        try:
+            return schema.model_validate(data)
+        except ValidationError as e:
+            if not _fix_literals(data, e):
+                return None
+    return None
+
+
+class ParseResult(NamedTuple):
+    output: Optional[BaseModel]
+    repaired: bool
+    error: Optional[ValidationError]
+
+
+def parse(text: str, schema: Type[BaseModel]) -> ParseResult:
+    """Validate a reply, repairing it if it doesn't validate as is. `error` is the original validation error."""
+    try:
+        return ParseResult(schema.model_validate_json(text), False, None)
+    except ValidationError as e:
+        output = repair(text, schema)
+        return ParseResult(output, output is not None, e)
+
+
+def reask(messages: List[Dict], text: str, error: Exception) -> List[Dict]:
+    """The conversation for regenerating a reply, ending with the invalid reply and why it was rejected."""
+    return messages + [
+        {"role": "assistant", "content": text},
+        {
+            "role": "user",
+            "content": f"Your reply does not follow the JSON schema:\n{error}\n"
+            "Reply again with the corrected JSON object only.",
+        },
+    ]
+
+
+def completion_tokens(response) -> int:
+    """Completion tokens of a chat completion, an instructor output (its raw response) or a usage chunk."""
+    response = getattr(response, "_raw_response", response)
+    usage = getattr(response, "usage", None)
+    return (getattr(usage, "completion_tokens", None) or 0) if usage is not None else 0
+
+
+class SchemaStats:
+    """
+    Outcomes of structured outputs per schema: valid as generated, repaired locally,
+    regenerated, or failed after regenerating, with the completion tokens and seconds
+    of the replies that were thrown away.
+    """
+
+    OUTCOMES = ("valid", "repaired", "regenerated", "failed")
+
+    def __init__(self):
+        self._schemas: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        schema: str,
+        outcome: str,
+        seconds: float,
+        tokens: int = 0,
+        wasted_tokens: int = 0,
+        lost_seconds: float = 0.0,
+    ) -> None:
+        """
+        Count one turn, and add it to the current trace span.
+
+        Args:
+            schema (str): Name of the output schema
+            outcome (str): One of OUTCOMES
+            seconds (float): Time from the first request to the final output
+            tokens (int): Completion tokens of every attempt
+            wasted_tokens (int): Completion tokens of the attempts that were thrown away
+            lost_seconds (float): Time spent on the attempts that were thrown away
+        """
+        with self._lock:
+            counters = self._schemas.setdefault(
+                schema,
+                {"turns": 0, **dict.fromkeys(self.OUTCOMES, 0), "tokens": 0, "wasted_tokens": 0, "seconds": 0.0, "lost_seconds": 0.0},
+            )
+            counters["turns"] += 1
+            counters[outcome] += 1
+            counters["tokens"] += tokens
+            counters["wasted_tokens"] += wasted_tokens
+            counters["seconds"] += seconds
+            counters["lost_seconds"] += lost_seconds
+        current_span().add(**{f"output_{outcome}": 1}, wasted_tokens=wasted_tokens)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Counters per schema, with the share of turns repaired and regenerated."""
+        with self._lock:
+            report = {}
+            for schema, counters in self._schemas.items():
+                turns = counters["turns"]
+                report[schema] = {
+                    **counters,
+                    "seconds": round(counters["seconds"], 3),
+                    "lost_seconds": round(counters["lost_seconds"], 3),
+                    "repair_rate": round(counters["repaired"] / turns, 3),
+                    "retry_rate": round((counters["regenerated"] + counters["failed"]) / turns, 3),
+                }
+            return report
+
+
+class StructuredClient:
+    """
+    Generates structured outputs in `mode`, repairs the ones that don't validate and only
+    regenerates them with `fallback`, an instructor client, when they can't be repaired.
+
+    Built on sync clients, it stands in for an instructor client in atomic_agents'
+    BaseAgent (`chat.completions.create` with a `response_model`). Built on async
+    clients, `asettle` finishes replies that were generated, e.g. streamed, elsewhere.
+    """
+
+    def __init__(
+        self,
+        llm,
+        fallback,
+        mode: str = "json",
+        stats: Optional[SchemaStats] = None,
+        on_request: Optional[Callable] = None,
+        on_response: Optional[Callable] = None,
+    ):
+        """
+        Args:
+            llm (Union[OpenAI, AsyncOpenAI]): Client of the OpenAI-compatible endpoint
+            fallback (Union[Instructor, AsyncInstructor]): instructor client on the same endpoint, in the same mode
+            mode (str): "json" or "json_schema", see `structured_request`
+            stats (Optional[SchemaStats]): Where the outcomes are counted
+            on_request (Optional[Callable]): Called with the request arguments, like instructor's "completion:kwargs" hook
+            on_response (Optional[Callable]): Called with the completion, like instructor's "completion:response" hook
+        """
+        self.llm = llm
+        self.fallback = fallback
+        self.mode = check_mode(mode)
+        self.stats = stats or SchemaStats()
+        self.on_request = on_request or (lambda **kwargs: None)
+        self.on_response = on_response or (lambda response: None)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages: List[Dict], model: str, response_model: Type[BaseModel], **kwargs) -> BaseModel:
+        started = time.perf_counter()
+        request = structured_request(response_model, messages, self.mode)
+        self.on_request(**request)
+        completion = self.llm.chat.completions.create(model=model, **request, **kwargs)
+        self.on_response(completion)
+        text = completion.choices[0].message.content or ""
+        return self.settle(
+            text, completion_tokens(completion), started, messages, model, response_model, **kwargs
+        )
+
+    def settle(
+        self,
+        text: str,
+        tokens: int,
+        started: float,
+        messages: List[Dict],
+        model: str,
+        response_model: Type[BaseModel],
+        **kwargs,
+    ) -> BaseModel:
+        """
+        The output of a reply: validated, repaired or regenerated.
+
+        Args:
+            text (str): The reply
+            tokens (int): Its completion tokens, 0 if unknown
+            started (float): `time.perf_counter()` when it was requested
+            messages (List[Dict]): The conversation it replies to, without the structured output instructions
+            model (str): Model to regenerate it with
+            response_model (Type[BaseModel]): The schema it should follow
+        """
+        parsed = self._parse(text, tokens, started, response_model)
+        if parsed.output is not None:
+            return parsed.output
+        with self._regenerating(tokens, started, response_model) as regenerated:
+            regenerated.output = self.fallback.chat.completions.create(
+                model=model, messages=reask(messages, text, parsed.error), response_model=response_model, **kwargs
+            )
+        return regenerated.output
+
+    async def asettle(
+        self,
+        text: str,
+        tokens: int,
+        started: float,
+        messages: List[Dict],
+        model: str,
+        response_model: Type[BaseModel],
+        **kwargs,
+    ) -> BaseModel:
+        """`settle` with async clients."""
+        parsed = self._parse(text, tokens, started, response_model)
+        if parsed.output is not None:
+            return parsed.output
+        with self._regenerating(tokens, started, response_model) as regenerated:
+            regenerated.output = await self.fallback.chat.completions.create(
+                model=model, messages=reask(messages, text, parsed.error), response_model=response_model, **kwargs
+            )
+        return regenerated.output
+
+    def _parse(self, text: str, tokens: int, started: float, response_model: Type[BaseModel]) -> ParseResult:
+        parsed = parse(text, response_model)
+        if parsed.output is not None:
+            outcome = "repaired" if parsed.repaired else "valid"
+            self.stats.record(response_model.__name__, outcome, time.perf_counter() - started, tokens)
+        return parsed
+
+    @contextlib.contextmanager
+    def _regenerating(self, tokens: int, started: float, response_model: Type[BaseModel]):
+        """Count a regeneration, whose output is set on the yielded namespace, or its failure."""
+        lost = time.perf_counter() - started
+        regenerated = SimpleNamespace(output=None)
+        try:
+            yield regenerated
+        except Exception:
+            elapsed = time.perf_counter() - started
+            self.stats.record(response_model.__name__, "failed", elapsed, tokens, tokens, elapsed)
+            raise
+        self.stats.record(
+            response_model.__name__,
+            "regenerated",
+            time.perf_counter() - started,
+            tokens + completion_tokens(regenerated.output),
+            wasted_tokens=tokens,
+            lost_seconds=lost,
+        )
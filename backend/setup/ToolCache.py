@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+
+## Content-addressed cache for tool results
+# Keys are a hash of the tool name, its normalised parameters and the config values
+# that change the answer (model, embedding model...). A small in-memory LRU sits in
+# front of an SQLite tier so repeated searches skip Perplexica and Chroma entirely.
+
+
+def _normalise(value: Any) -> Any:
+    """Normalise strings (case and whitespace) so trivially different prompts share a key."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: _normalise(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalise(item) for item in value]
+    return value
+
+
+def cache_key(tool_name: str, params: BaseModel, config: Optional[Dict] = None) -> str:
+    """
+    Build the content address of a tool call.
+
+    Args:
+        tool_name (str): Name of the tool, e.g. "WebSearch"
+        params (BaseModel): The tool input schema instance
+        config (Optional[Dict]): Config values that influence the result
+
+    Returns:
+        str: A sha256 hex digest
+    """
+    material = {
+        "tool": tool_name,
+        "params": _normalise(params.model_dump()),
+        "config": config or {},
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class CacheTier:
+    """Interface of a cache tier. Values are pydantic models of the tool output schema."""
+
+    def get(self, key: str, output_schema: Type[BaseModel]) -> Optional[BaseModel]:
+        raise NotImplementedError
+
+    def set(self, key: str, tool_name: str, value: BaseModel, ttl: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def clear(self, tool_name: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+
+class MemoryTier(CacheTier):
+    """In-process LRU holding the output objects themselves, with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[float], str, BaseModel]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, output_schema: Type[BaseModel]) -> Optional[BaseModel]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, _, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, tool_name: str, value: BaseModel, ttl: Optional[float]) -> None:
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, tool_name, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, tool_name: Optional[str] = None) -> None:
+        with self._lock:
+            if tool_name is None:
+                self._entries.clear()
+                return
+            for key in [k for k, entry in self._entries.items() if entry[1] == tool_name]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteTier(CacheTier):
+    """On-disk tier storing JSON-serialised outputs, evicted by expiry then least recent use."""
+
+    def __init__(self, path: str = "./.cache/tool_cache.sqlite3", max_bytes: int = 256 * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str, output_schema: Type[BaseModel]) -> Optional[BaseModel]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires = row
+            if expires is not None and expires < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return output_schema.model_validate_json(value)
+
+    def set(self, key: str, tool_name: str, value: BaseModel, ttl: Optional[float]) -> None:
+        now = time.time()
+        payload = value.model_dump_json()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, tool, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool_name, payload, len(payload), now + ttl if ttl else None, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used rows until the tier fits again
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cache ORDER BY accessed ASC"
+        ).fetchall():
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, tool_name: Optional[str] = None) -> None:
+        with self._lock:
+            if tool_name is None:
+                self._conn.execute("DELETE FROM cache")
+            else:
+                self._conn.execute("DELETE FROM cache WHERE tool = ?", (tool_name,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ToolCache:
+    """
+    Two-tier cache for tool outputs with hit/miss counters.
+
+    Example:
+        cache = ToolCache()
+        output = cache.get("WebSearch", params, WebSearchOutputSchema, config)
+        if output is None:
+            output = tool.run(params)
+            cache.set("WebSearch", params, output, config)
+    """
+
+    def __init__(
+        self,
+        memory: Optional[CacheTier] = None,
+        disk: Optional[CacheTier] = None,
+        ttl: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            memory (Optional[CacheTier]): First tier, defaults to a `MemoryTier`
+            disk (Optional[CacheTier]): Optional second tier, e.g. a `SQLiteTier`
+            ttl (Optional[Dict[str, float]]): Time to live in seconds per tool name, no expiry if missing
+        """
+        self.memory = memory or MemoryTier()
+        self.disk = disk
+        self.ttl = {"WebSearch": 24 * 3600.0, "KnowledgeBase": 3600.0, "FileCatalog": 60.0}
+        self.ttl.update(ttl or {})
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def get(
+        self,
+        tool_name: str,
+        params: BaseModel,
+        output_schema: Type[BaseModel],
+        config: Optional[Dict] = None,
+    ) -> Optional[BaseModel]:
+        """Look a tool call up in each tier, promoting disk hits into memory."""
+        key = cache_key(tool_name, params, config)
+        value = self.memory.get(key, output_schema)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key, output_schema)
+            if value is not None:
+                self._count("disk_hits")
+                self.memory.set(key, tool_name, value, self.ttl.get(tool_name))
+                return value
+        self._count("misses")
+        return None
+
+    def set(
+        self,
+        tool_name: str,
+        params: BaseModel,
+        value: BaseModel,
+        config: Optional[Dict] = None,
+    ) -> None:
+        """Store a tool output in every tier."""
+        key = cache_key(tool_name, params, config)
+        ttl = self.ttl.get(tool_name)
+        self.memory.set(key, tool_name, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, tool_name, value, ttl)
+
+    def invalidate(self, tool_name: Optional[str] = None) -> None:
+        """Drop the cached outputs of one tool, or of every tool."""
+        self.memory.clear(tool_name)
+        if self.disk is not None:
+            self.disk.clear(tool_name)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and the overall hit rate."""
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
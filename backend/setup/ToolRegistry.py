@@ -0,0 +1,107 @@
+import atexit
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+## Process-wide registry of tools
+# Tools register a factory once, at import time, and every Orchestrator (and thread)
+# shares the single instance built from it, so Chroma clients and HTTP pools are
+# created once instead of on every tool call.
+
+
+@dataclass
+class ToolSpec:
+    """How to build and call a tool."""
+
+    name: str
+    factory: Callable[[], object]
+    input_schema: Type[BaseModel]
+    output_schema: Type[BaseModel]
+    uses_history: bool = False  # Pass the agent's chat history to run/arun as `history`
+
+
+class ToolRegistry:
+    """
+    Builds each registered tool lazily, once, and shares it.
+
+    Tools may define `warmup()` (called by `warmup`) and `close()` (called by
+    `shutdown`, which also runs at interpreter exit).
+    """
+
+    _default: Optional["ToolRegistry"] = None
+
+    def __init__(self):
+        self._specs: Dict[str, ToolSpec] = {}
+        self._tools: Dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def default(cls) -> "ToolRegistry":
+        """The registry shared by every Orchestrator in the process."""
+        if cls._default is None:
+            cls._default = cls()
+            atexit.register(cls._default.shutdown)
+        return cls._default
+
+    def register(self, spec: ToolSpec) -> None:
+        """Register a tool, replacing (and closing) a previous tool of the same name."""
+        with self._lock:
+            previous = self._tools.pop(spec.name, None)
+            self._specs[spec.name] = spec
+        if previous is not None:
+            self._close(previous)
+
+    def spec(self, name: str) -> ToolSpec:
+        try:
+            return self._specs[name]
+        except KeyError:
+            raise ValueError(f"Unknown tool: {name}") from None
+
+    def get(self, name: str):
+        """Get the shared instance of a tool, building it on first use."""
+        tool = self._tools.get(name)
+        if tool is not None:
+            return tool
+        spec = self.spec(name)
+        with self._lock:
+            tool = self._tools.get(name)
+            if tool is None:
+                tool = spec.factory()
+                self._tools[name] = tool
+            return tool
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def warmup(self, names: Optional[List[str]] = None) -> None:
+        """Build tools ahead of the first request and let them load models or open connections."""
+        for name in names or self.names():
+            tool = self.get(name)
+            if hasattr(tool, "warmup"):
+                tool.warmup()
+
+    def shutdown(self) -> None:
+        """Close every built tool. They are rebuilt if used again."""
+        with self._lock:
+            tools = list(self._tools.values())
+            self._tools.clear()
+        for tool in tools:
+            self._close(tool)
+
+    @staticmethod
+    def _close(tool) -> None:
+        if hasattr(tool, "close"):
+            try:
+                tool.close()
+            except Exception as e:
+                logger.warning("Error closing tool %s: %s", tool, e)
+
+
+def register_tool(spec: ToolSpec) -> None:
+    """Register a tool with the default registry. Agents call this at import time."""
+    ToolRegistry.default().register(spec)
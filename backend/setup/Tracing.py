@@ -0,0 +1,281 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+## Lightweight tracing of the hot paths
+# Spans are opened around agent turns, tool calls, Chroma queries and HTTP requests.
+# Tracing is off unless configured, and then `span` records and exports nothing,
+# so instrumented code can stay instrumented in production.
+
+
+@dataclass
+class Span:
+    """A timed operation. Attributes hold tokens, payload bytes, cache status, etc."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    session_id: Optional[str]
+    start: float  # Unix time in seconds
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    duration: float = 0.0
+    status: str = "ok"
+    error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, **counters) -> None:
+        """Add to numeric attributes, e.g. tokens over several LLM attempts."""
+        for key, value in counters.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> Dict:
+        """JSON record using the OpenTelemetry span field names."""
+        start_ns = int(self.start * 1e9)
+        return {
+            "name": self.name,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "startTimeUnixNano": start_ns,
+            "endTimeUnixNano": start_ns + int(self.duration * 1e9),
+            "status": {"code": self.status, "message": self.error},
+            "attributes": {"session.id": self.session_id, **self.attributes},
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is off, so callers never need to check."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def add(self, **counters) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class JsonlExporter:
+    """Appends one JSON line per finished span to a local file."""
+
+    def __init__(self, path: str = "./.cache/traces.jsonl"):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", buffering=1)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+# Attributes that are totalled in session summaries, by suffix
+SUMMED_ATTRIBUTES = ("_bytes", "_tokens", "attempts")
+
+
+class SessionSummary:
+    """Aggregates the spans of one session into per-operation totals and flame graph stacks."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def add(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def _stack(self, span: Span, by_id: Dict[str, Span]) -> str:
+        names = [span.name]
+        parent = by_id.get(span.parent_id)
+        while parent is not None:
+            names.append(parent.name)
+            parent = by_id.get(parent.parent_id)
+        return ";".join(reversed(names))
+
+    def report(self) -> Dict[str, Dict]:
+        """
+        Returns:
+            Dict[str, Dict]: Per span name, the count, total and max milliseconds, and summed byte, token and attempt counts
+        """
+        report: Dict[str, Dict] = {}
+        for span in self.spans:
+            entry = report.setdefault(span.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            entry["count"] += 1
+            entry["total_ms"] += span.duration * 1000
+            entry["max_ms"] = max(entry["max_ms"], span.duration * 1000)
+            entry["errors"] += span.status != "ok"
+            for key, value in span.attributes.items():
+                if key.endswith(SUMMED_ATTRIBUTES) and isinstance(value, (int, float)):
+                    entry[key] = entry.get(key, 0) + value
+        for entry in report.values():
+            entry["total_ms"] = round(entry["total_ms"], 2)
+            entry["max_ms"] = round(entry["max_ms"], 2)
+        return dict(sorted(report.items(), key=lambda item: -item[1]["total_ms"]))
+
+    def folded(self) -> str:
+        """
+        Self time per call stack, in microseconds, in the folded format read by flamegraph.pl and speedscope.
+        """
+        by_id = {span.span_id: span for span in self.spans}
+        child_time: Dict[str, float] = {}
+        for span in self.spans:
+            if span.parent_id in by_id:
+                child_time[span.parent_id] = child_time.get(span.parent_id, 0.0) + span.duration
+        stacks: Dict[str, float] = {}
+        for span in self.spans:
+            self_time = max(0.0, span.duration - child_time.get(span.span_id, 0.0))
+            stack = self._stack(span, by_id)
+            stacks[stack] = stacks.get(stack, 0.0) + self_time
+        return "\n".join(f"{stack} {round(seconds * 1e6)}" for stack, seconds in stacks.items())
+
+
+class Tracer:
+    """
+    Creates spans and hands finished ones to the exporters and session summaries.
+
+    With no exporter and summaries off, `span` yields a no-op span and records nothing.
+    """
+
+    def __init__(self, exporters: Optional[List] = None, summaries: bool = False, max_sessions: int = 64):
+        """
+        Args:
+            exporters (Optional[List]): Objects with `export(span)` and `close()`, e.g. JsonlExporter
+            summaries (bool): Keep spans in memory per session for `summary`
+            max_sessions (int): Number of most recent sessions whose summaries are kept
+        """
+        self.exporters = exporters or []
+        self.summaries_enabled = summaries
+        self.max_sessions = max_sessions
+        self._summaries: "OrderedDict[str, SessionSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters) or self.summaries_enabled
+
+    @contextmanager
+    def span(self, name: str, session_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+        """
+        Time the enclosed block as a child of the current span.
+
+        Args:
+            name (str): Operation name, e.g. "tool.execute"
+            session_id (Optional[str]): Session of a root span, inherited by children otherwise
+            **attributes: Initial span attributes
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            session_id=session_id or (parent.session_id if parent else None),
+            start=time.time(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Async generators can be finalised in another context than they started in
+                pass
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning("Span export failed: %s", e)
+        if self.summaries_enabled and span.session_id:
+            with self._lock:
+                summary = self._summaries.get(span.session_id)
+                if summary is None:
+                    summary = self._summaries[span.session_id] = SessionSummary()
+                    while len(self._summaries) > self.max_sessions:
+                        self._summaries.popitem(last=False)
+                summary.add(span)
+
+    def summary(self, session_id: str) -> Optional[SessionSummary]:
+        with self._lock:
+            return self._summaries.get(session_id)
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            exporter.close()
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure_tracing(path: Optional[str] = None, summaries: bool = True, exporters: Optional[List] = None) -> Tracer:
+    """
+    Turn tracing on for the process, replacing the current tracer.
+
+    Args:
+        path (Optional[str]): Write spans to this JSONL file
+        summaries (bool): Keep per-session summaries in memory (see `Orchestrator.trace_report`)
+        exporters (Optional[List]): Extra exporters, e.g. a bridge to an OpenTelemetry collector
+
+    Returns:
+        Tracer: The new process-wide tracer
+    """
+    global _tracer
+    exporters = list(exporters or [])
+    if path:
+        exporters.append(JsonlExporter(path))
+    previous, _tracer = _tracer, Tracer(exporters=exporters, summaries=summaries)
+    previous.close()
+    return _tracer
+
+
+def span(name: str, session_id: Optional[str] = None, **attributes):
+    """`Tracer.span` on the process-wide tracer."""
+    return _tracer.span(name, session_id=session_id, **attributes)
+
+
+def current_span():
+    """The innermost open span, or a no-op span if there is none or tracing is off."""
+    return (_current_span.get() if _tracer.enabled else None) or NOOP_SPAN
+
+
+if os.environ.get("MOA_TRACE_FILE"):
+    configure_tracing(path=os.environ["MOA_TRACE_FILE"])
@@ -0,0 +1,135 @@
+"""
+Benchmark of the FileCatalog against walking and reading the tree on every query.
+
+Usage:
+    python -m benchmarks.bench_catalog --files 5000 --queries 50
+
+Generates a seeded tree of Python modules, catalogs it, then times unchanged and
+one-file resyncs and symbol, glob and grep queries. The baseline answers the same
+queries with os.walk, fnmatch and a regex over every file, which is what an agent
+without the catalog would do.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from backend.Agents.FileCatalog import FileCatalog, FileCatalogInputSchema
+from benchmarks.run import latency_stats
+
+
+def write_tree(root: str, files: int, seed: int = 0) -> List[str]:
+    """Write `files` modules in nested packages, each defining a class and a few functions."""
+    rng = random.Random(seed)
+    names = []
+    for i in range(files):
+        package = os.path.join(root, f"pkg_{i % 20}", f"sub_{i % 7}")
+        os.makedirs(package, exist_ok=True)
+        functions = [f"handle_{i}_{j}" for j in range(rng.randint(3, 8))]
+        lines = [f'"""Module {i}."""', "import os", "", f"LIMIT_{i} = {rng.randint(1, 100)}", ""]
+        lines += [f"class Service{i}:", "    def run(self):", f"        return {functions[0]}()", ""]
+        for name in functions:
+            body = " + ".join(str(rng.randint(0, 999)) for _ in range(rng.randint(5, 30)))
+            lines += [f"def {name}(value=None):", f"    return {body}", ""]
+        with open(os.path.join(package, f"module_{i}.py"), "w") as f:
+            f.write("\n".join(lines))
+        names.extend(functions)
+    return names
+
+
+def walk_symbol(root: str, name: str) -> List[str]:
+    pattern = re.compile(rf"^\s*(?:class|def)\s+{re.escape(name)}\b", re.MULTILINE)
+    found = []
+    for folder, _, files in os.walk(root):
+        for file_name in files:
+            path = os.path.join(folder, file_name)
+            with open(path, errors="replace") as f:
+                if pattern.search(f.read()):
+                    found.append(path)
+    return found
+
+
+def walk_glob(root: str, pattern: str) -> List[str]:
+    return [
+        os.path.join(folder, file_name)
+        for folder, _, files in os.walk(root)
+        for file_name in fnmatch.filter(files, pattern)
+    ]
+
+
+def walk_grep(root: str, pattern: str) -> List[str]:
+    regex = re.compile(pattern)
+    found = []
+    for folder, _, files in os.walk(root):
+        for file_name in files:
+            with open(os.path.join(folder, file_name), errors="replace") as f:
+                found.extend(line for line in f if regex.search(line))
+    return found
+
+
+def timed(call: Callable[[], object], repeats: int) -> Dict:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=50, help="Repeats of each catalog query")
+    parser.add_argument("--baseline-queries", type=int, default=3, help="Repeats of each walking query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        root = os.path.join(workdir, "tree")
+        names = write_tree(root, args.files)
+        rng = random.Random(1)
+        catalog = FileCatalog(root=root, path=os.path.join(workdir, "catalog.sqlite3"), watch_interval=None)
+
+        initial = catalog.sync()
+        unchanged = catalog.sync()
+        touched = os.path.join(root, "pkg_0", "sub_0", "module_0.py")
+        with open(touched, "a") as f:
+            f.write("\ndef added_later():\n    return 1\n")
+        one_file = catalog.sync()
+
+        symbol = lambda: catalog.run(FileCatalogInputSchema(query_type="symbol", pattern=rng.choice(names)))
+        glob = lambda: catalog.run(FileCatalogInputSchema(query_type="glob", pattern="pkg_3/**/module_1*.py"))
+        grep = lambda: catalog.run(
+            FileCatalogInputSchema(query_type="grep", pattern=rf"return {rng.choice(names)}\(")
+        )
+        report = {
+            "config": vars(args),
+            "sync": {
+                "initial_s": round(initial.seconds, 3),
+                "files_per_s": round(initial.added / initial.seconds, 1),
+                "unchanged_resync_s": round(unchanged.seconds, 4),
+                "one_file_resync_s": round(one_file.seconds, 4),
+            },
+            "catalog": {
+                "symbol": timed(symbol, args.queries),
+                "glob": timed(glob, args.queries),
+                "grep": timed(grep, args.queries),
+            },
+            "walk": {
+                "symbol": timed(lambda: walk_symbol(root, rng.choice(names)), args.baseline_queries),
+                "glob": timed(lambda: walk_glob(root, "module_1*.py"), args.baseline_queries),
+                "grep": timed(lambda: walk_grep(root, rf"return {rng.choice(names)}\("), args.baseline_queries),
+            },
+        }
+        catalog.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark of the LLM gateway against a fake Ollama that serves a few requests at once.
+
+Usage:
+    python -m benchmarks.bench_gateway --callers 64 --distinct 8 --embeddings 512
+
+Two workloads run once straight against the server and once through an LLMGateway:
+`--callers` concurrent streamed chat turns of which only `--distinct` prompts are
+different (sessions starting with the same question), and `--embeddings` concurrent
+single-text embedding requests (concurrent KnowledgeBase searches).
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict
+
+from openai import AsyncOpenAI
+
+from backend.setup.Gateway import LLMGateway
+from benchmarks.run import latency_stats
+from benchmarks.stubs import OllamaStubHandler, StubServer
+
+
+async def chat(client: AsyncOpenAI, callers: int, distinct: int) -> Dict:
+    async def turn(i: int) -> float:
+        start = time.perf_counter()
+        stream = await client.chat.completions.create(
+            model="qwen2.5:7b",
+            messages=[{"role": "user", "content": f"Question {i % distinct}"}],
+            stream=True,
+        )
+        async for _ in stream:
+            pass
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(turn(i) for i in range(callers)))
+    return {"seconds": round(time.perf_counter() - start, 3), "turn": latency_stats(latencies)}
+
+
+async def embeddings(client: AsyncOpenAI, requests: int) -> Dict:
+    async def embed(i: int) -> float:
+        start = time.perf_counter()
+        await client.embeddings.create(
+            model="nomic-embed-text:latest", input=f"document {i} about housing policy", encoding_format="float"
+        )
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(embed(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "per_s": round(requests / elapsed, 1), "request": latency_stats(latencies)}
+
+
+async def workloads(client: AsyncOpenAI, args) -> Dict:
+    return {
+        "chat": await chat(client, args.callers, args.distinct),
+        "embeddings": await embeddings(client, args.embeddings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--callers", type=int, default=64, help="Concurrent chat turns")
+    parser.add_argument("--distinct", type=int, default=8, help="Different prompts among them")
+    parser.add_argument("--embeddings", type=int, default=512, help="Concurrent embedding requests")
+    parser.add_argument("--ollama-parallel", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.0005)
+    args = parser.parse_args()
+
+    report: Dict[str, Dict] = {"config": vars(args)}
+    with StubServer(
+        handler=OllamaStubHandler,
+        latency=args.llm_latency,
+        token_latency=args.token_latency,
+        capacity=args.ollama_parallel,
+    ) as llm:
+        direct = AsyncOpenAI(base_url=f"{llm.url}/v1", api_key="ollama")
+        report["direct"] = asyncio.run(workloads(direct, args))
+
+        gateway = LLMGateway(f"{llm.url}/v1", default_limit=args.ollama_parallel)
+        report["gateway"] = asyncio.run(workloads(gateway.async_client(), args))
+        report["gateway"]["stats"] = gateway.snapshot()
+        gateway.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
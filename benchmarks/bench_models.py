@@ -0,0 +1,120 @@
+"""
+Benchmark of model-affinity scheduling against a fake Ollama that can hold only a few models.
+
+Usage:
+    python -m benchmarks.bench_models --sessions 8 --turns 5 --repairs 32 --max-loaded 2
+
+`--sessions` concurrent sessions each run `--turns` turns of one embedding lookup
+(nomic-embed-text) and one chat request (qwen2.5:7b), while a fine-tune job with
+`--repair-workers` workers sends `--repairs` regenerations (llama3.1:8b) as background
+work. The stub server starts with the sessions' models loaded, keeps `--max-loaded`
+models in memory and spends `--load-latency` seconds on every load, taking requests in
+arrival order like Ollama. The workload runs straight against the server, through an
+LLMGateway that only caps each model, and through one that schedules by model.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from openai import AsyncOpenAI
+
+from backend.setup.Gateway import LLMGateway
+from benchmarks.run import latency_stats
+from benchmarks.stubs import OllamaStubHandler, StubResidency, StubServer
+
+CHAT_MODEL = "qwen2.5:7b"
+EMBEDDING_MODEL = "nomic-embed-text:latest"
+REPAIR_MODEL = "llama3.1:8b"
+
+
+async def workload(foreground: AsyncOpenAI, background: AsyncOpenAI, args) -> Dict:
+    async def session(i: int) -> List[float]:
+        latencies = []
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            await foreground.embeddings.create(
+                model=EMBEDDING_MODEL, input=f"session {i} turn {turn} question", encoding_format="float"
+            )
+            await foreground.chat.completions.create(
+                model=CHAT_MODEL, messages=[{"role": "user", "content": f"Session {i} question {turn} [steps=0]"}]
+            )
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(args.think_time)
+        return latencies
+
+    async def repairs(cases: asyncio.Queue) -> None:
+        while not cases.empty():
+            i = cases.get_nowait()
+            await background.chat.completions.create(
+                model=REPAIR_MODEL, messages=[{"role": "user", "content": f"Repair case {i} [steps=0]"}]
+            )
+
+    cases: asyncio.Queue = asyncio.Queue()
+    for i in range(args.repairs):
+        cases.put_nowait(i)
+    start = time.perf_counter()
+    job = asyncio.gather(*(repairs(cases) for _ in range(args.repair_workers)))
+    sessions = await asyncio.gather(*(session(i) for i in range(args.sessions)))
+    foreground_seconds = time.perf_counter() - start
+    await job
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "foreground_seconds": round(foreground_seconds, 3),
+        "turn": latency_stats([latency for latencies in sessions for latency in latencies]),
+    }
+
+
+def run(url: str, args, max_loaded_models=None) -> Dict:
+    gateway = None
+    if max_loaded_models is None:
+        foreground = background = AsyncOpenAI(base_url=f"{url}/v1", api_key="ollama")
+    else:
+        gateway = LLMGateway(
+            f"{url}/v1",
+            default_limit=args.ollama_parallel,
+            max_loaded_models=max_loaded_models,
+            residency={"max_wait": args.max_wait, "idle_grace": args.idle_grace},
+        )
+        foreground, background = gateway.async_client(), gateway.async_client(background=True)
+    report = asyncio.run(workload(foreground, background, args))
+    if gateway is not None:
+        residency = gateway.snapshot()["residency"]
+        report["residency"] = {
+            name: round(value, 3) if isinstance(value, float) else value for name, value in residency.items()
+        }
+        gateway.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--repairs", type=int, default=32, help="Background regenerations of the fine-tune job")
+    parser.add_argument("--repair-workers", type=int, default=4)
+    parser.add_argument("--max-loaded", type=int, default=2, help="Models the server holds at once")
+    parser.add_argument("--load-latency", type=float, default=0.5, help="Seconds to load a model")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--think-time", type=float, default=0.05, help="Seconds between a session's turns")
+    parser.add_argument("--ollama-parallel", type=int, default=4)
+    parser.add_argument("--max-wait", type=float, default=2.0)
+    parser.add_argument("--idle-grace", type=float, default=0.5)
+    args = parser.parse_args()
+
+    report: Dict[str, Dict] = {"config": vars(args)}
+    modes = {"direct": None, "gateway": 0, "affinity": args.max_loaded}
+    for mode, max_loaded_models in modes.items():
+        residency = StubResidency(args.max_loaded, args.load_latency, loaded=[EMBEDDING_MODEL, CHAT_MODEL][-args.max_loaded :])
+        with StubServer(
+            handler=OllamaStubHandler, latency=args.llm_latency, capacity=args.ollama_parallel, residency=residency
+        ) as llm:
+            report[mode] = run(llm.url, args, max_loaded_models)
+            report[mode]["server"] = residency.stats()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
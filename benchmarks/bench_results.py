@@ -0,0 +1,84 @@
+"""
+Memory footprint of KnowledgeBase search hits: SearchResult schemas per hit against ResultSet.
+
+Usage:
+    python -m benchmarks.bench_results --queries 200 --hits 50
+
+Builds `--queries` Chroma-shaped query results of `--hits` hits each, then measures with
+tracemalloc what turning them into search hits allocates on top of the raw results: one
+pydantic SearchResult with a merged metadata dict per hit (the previous representation,
+still what the tool returns) or one ResultSet per query. Also reports the objects tracked
+by the garbage collector and the time of a full collection with the hits alive.
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from backend.Agents.KnowledgeBase import KnowledgeBase
+from backend.Agents.ResultSet import ResultSet
+
+
+def chroma_results(queries: int, hits: int, content_chars: int) -> List[Dict]:
+    """Raw single-query Chroma results, as `collection.query` returns them."""
+    return [
+        {
+            "ids": [[f"doc_{q}_{i}.md_{i}" for i in range(hits)]],
+            "documents": [[f"chunk {q}.{i} " + "x" * content_chars for i in range(hits)]],
+            "metadatas": [[{"source": f"doc_{q}_{i}.md", "chunk": i, "file_type": ".md"} for i in range(hits)]],
+            "distances": [[i / hits for i in range(hits)]],
+        }
+        for q in range(queries)
+    ]
+
+
+def measure(build: Callable[[Dict], object], raw: List[Dict], results: int) -> Dict:
+    gc.collect()
+    tracked = len(gc.get_objects())
+    tracemalloc.start()
+    start = time.perf_counter()
+    built = [build(result) for result in raw]
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tracked = len(gc.get_objects()) - tracked
+    start = time.perf_counter()
+    gc.collect()
+    gc_seconds = time.perf_counter() - start
+    del built
+    return {
+        "bytes_per_result": round(current / results, 1),
+        "peak_bytes_per_result": round(peak / results, 1),
+        "gc_objects_per_result": round(tracked / results, 2),
+        "build_ms": round(seconds * 1000, 2),
+        "full_gc_ms": round(gc_seconds * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=200, help="Query results kept alive at once")
+    parser.add_argument("--hits", type=int, default=50, help="Hits per query")
+    parser.add_argument("--content-chars", type=int, default=1000)
+    args = parser.parse_args()
+
+    raw = chroma_results(args.queries, args.hits, args.content_chars)
+    results = args.queries * args.hits
+    schemas = measure(
+        lambda result: KnowledgeBase._search_results(ResultSet.from_query(result, "semantic")), raw, results
+    )
+    result_sets = measure(lambda result: ResultSet.from_query(result, "semantic"), raw, results)
+    report = {
+        "config": vars(args),
+        "search_results": schemas,
+        "result_set": result_sets,
+        "bytes_saved_per_result": round(schemas["bytes_per_result"] - result_sets["bytes_per_result"], 1),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Load test of the multi-session server: many light users next to a few heavy ones.
+
+Usage:
+    python -m benchmarks.bench_sessions --users 50 --heavy 5
+    python -m benchmarks.bench_sessions --users 50 --heavy 5 --no-admission   # every call straight to the LLM
+
+Light users run short queries, heavy users run long multi-step queries back to back
+for as long as the light users are busy. The fake LLM serves `--ollama-parallel`
+requests at once, like a local Ollama instance.
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from backend.Agents.KnowledgeBase import KnowledgeBase
+from backend.setup.Gateway import LLMGateway
+from backend.setup.Server import create_app
+from backend.setup.Sessions import SessionManager
+from benchmarks.corpus import HashedEmbeddingFunction, write_corpus
+from benchmarks.run import latency_stats, stub_registry
+from benchmarks.stubs import OllamaStubHandler, StubServer
+
+
+async def run_query(client: httpx.AsyncClient, session_id: str, query: str) -> Dict:
+    start = time.perf_counter()
+    events = {}
+    async with client.stream(
+        "GET", "/api/stream", params={"query": query, "session_id": session_id}
+    ) as response:
+        if response.status_code != 200:
+            return {"seconds": time.perf_counter() - start, "error": response.status_code}
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                name = line[len("event: ") :]
+                events[name] = events.get(name, 0) + 1
+    return {"seconds": time.perf_counter() - start, "error": "error" in events or None}
+
+
+async def user(client: httpx.AsyncClient, queries: int, steps: int, results: List[Dict], until=None):
+    """One user with its own session, running `queries` queries, or until `until` is set."""
+    session_id = (await client.post("/api/sessions")).json()["session_id"]
+    i = 0
+    while (until is None and i < queries) or (until is not None and not until.is_set()):
+        results.append(await run_query(client, session_id, f"[steps={steps}] Question {i}"))
+        i += 1
+
+
+async def load_test(manager: SessionManager, args) -> Dict:
+    app = create_app(manager)
+    light, heavy = [], []
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+    ) as client:
+        light_done = asyncio.Event()
+        heavy_users = [
+            asyncio.create_task(user(client, 0, args.heavy_steps, heavy, until=light_done))
+            for _ in range(args.heavy)
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(user(client, args.queries, args.light_steps, light) for _ in range(args.users))
+        )
+        elapsed = time.perf_counter() - start
+        light_done.set()
+        await asyncio.gather(*heavy_users)
+        stats = (await client.get("/api/stats")).json()
+    await manager.aclose()
+
+    return {
+        "light_queries_per_s": round(len(light) / elapsed, 2),
+        "light": latency_stats([result["seconds"] for result in light]),
+        "heavy": latency_stats([result["seconds"] for result in heavy]),
+        "errors": sum(bool(result["error"]) for result in light + heavy),
+        "scheduler": stats["scheduler"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50, help="Light users")
+    parser.add_argument("--heavy", type=int, default=5, help="Heavy users")
+    parser.add_argument("--queries", type=int, default=3, help="Queries per light user")
+    parser.add_argument("--light-steps", type=int, default=1)
+    parser.add_argument("--heavy-steps", type=int, default=6)
+    parser.add_argument("--ollama-parallel", type=int, default=4)
+    parser.add_argument("--no-admission", action="store_true", help="Don't bound or schedule LLM calls")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.0005)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, StubServer(
+        latency=args.search_latency
+    ) as search, StubServer(
+        handler=OllamaStubHandler,
+        latency=args.llm_latency,
+        token_latency=args.token_latency,
+        capacity=args.ollama_parallel,
+    ) as llm:
+        kb = KnowledgeBase(
+            path=f"{workdir}/chroma_db",
+            collection_name="benchmark",
+            embedding_function=HashedEmbeddingFunction(),
+        )
+        write_corpus(f"{workdir}/corpus", documents=100)
+        kb.sync_folder(f"{workdir}/corpus")
+        tools = stub_registry(search.url, kb)
+        max_concurrent = 10_000 if args.no_admission else args.ollama_parallel
+        gateway = LLMGateway(f"{llm.url}/v1", default_limit=0 if args.no_admission else args.ollama_parallel)
+        manager = SessionManager(
+            base_url=f"{llm.url}/v1",
+            max_concurrent_llm=max_concurrent,
+            max_waiting=10_000,
+            tools=tools,
+            cache=False,
+            gateway=gateway,
+        )
+        report = {"config": vars(args), **asyncio.run(load_test(manager, args))}
+        tools.shutdown()
+        gateway.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
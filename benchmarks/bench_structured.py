@@ -0,0 +1,110 @@
+"""
+Benchmark of structured outputs against a fake LLM that breaks its JSON: JSON mode against schema-constrained decoding.
+
+Usage:
+    python -m benchmarks.bench_structured --queries 50 --malformed 0.3
+
+The stub Ollama breaks `--malformed` of the replies it isn't constrained to a schema for:
+it wraps them in a code fence, cuts the closing brace, misspells a tool name, or leaves
+out a required field. Every query runs once streamed (`astream`), once planned
+(`astream_plan`) and once through the sync agent (`arun`), in "json" mode and in
+"json_schema" mode. The report has the latency of each, the outcomes of every turn per
+output schema (valid, repaired locally, regenerated, failed) with the completion tokens
+and seconds thrown away, and `invalid_rate`: the share of turns that were not valid as
+generated, which were all regenerated before local repair.
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from typing import Dict, List
+
+from backend.Agents.KnowledgeBase import KnowledgeBase
+from backend.Agents.PerplexicaClient import close_async_clients
+from backend.setup.Orchestrator import Orchestrator
+from backend.setup.StructuredOutput import MODES, SchemaStats
+from backend.setup.ToolRegistry import ToolRegistry
+from benchmarks.corpus import HashedEmbeddingFunction
+from benchmarks.run import latency_stats, stub_registry
+from benchmarks.stubs import OllamaStubHandler, StubServer
+
+PATHS = ("stream", "plan", "agent")
+
+
+async def query(orchestrator: Orchestrator, path: str, text: str) -> None:
+    if path == "agent":
+        await orchestrator.arun(text)
+        return
+    events = orchestrator.astream_plan(text) if path == "plan" else orchestrator.astream(text)
+    async for _ in events:
+        pass
+
+
+async def workload(tools: ToolRegistry, llm_url: str, mode: str, args) -> Dict:
+    stats = SchemaStats()
+    report: Dict[str, Dict] = {}
+    for path in PATHS:
+        latencies: List[float] = []
+        errors = 0
+        for i in range(args.queries):
+            orchestrator = Orchestrator(
+                parallel=True,
+                cache=False,
+                tools=tools,
+                base_url=f"{llm_url}/v1",
+                structured_output=mode,
+                schema_stats=stats,
+            )
+            start = time.perf_counter()
+            try:
+                await query(orchestrator, path, f"Benchmark question {i} of the {path} path")
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        report[path] = {"latency": latency_stats(latencies), "errors": errors}
+    await close_async_clients()
+
+    schemas = stats.stats()
+    for counters in schemas.values():
+        counters["invalid_rate"] = round(1 - counters["valid"] / counters["turns"], 3)
+    report["schemas"] = schemas
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=50, help="Queries per path and mode")
+    parser.add_argument("--malformed", type=float, default=0.3, help="Share of unconstrained replies with broken JSON")
+    parser.add_argument("--steps", type=int, default=2, help="Tool steps the fake LLM takes per query")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.001)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    report: Dict[str, Dict] = {"config": vars(args)}
+    with tempfile.TemporaryDirectory() as workdir, StubServer(
+        latency=args.search_latency
+    ) as search, StubServer(
+        handler=OllamaStubHandler,
+        latency=args.llm_latency,
+        steps=args.steps,
+        token_latency=args.token_latency,
+        malformed=args.malformed,
+    ) as llm:
+        kb = KnowledgeBase(
+            path=f"{workdir}/chroma_db",
+            collection_name="benchmark",
+            embedding_function=HashedEmbeddingFunction(),
+        )
+        tools = stub_registry(search.url, kb)
+        for mode in MODES:
+            report[mode] = asyncio.run(workload(tools, llm.url, mode, args))
+        tools.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark of KnowledgeBase URL ingestion against a simulated web.
+
+Usage:
+    python -m benchmarks.bench_urls --hosts 10 --pages 20 --latency 0.05
+
+Serves `--hosts` x `--pages` seeded article pages (with navigation and footer
+boilerplate) through an in-process httpx transport that waits `--latency` per
+request and records how many requests each host had in flight. A share of the pages
+repeat another page's article word for word or with one word changed. URLs are
+ingested once one at a time and once with the default concurrent pool, each into a
+fresh KnowledgeBase.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+from backend.Agents.KnowledgeBase import KnowledgeBase
+from backend.Agents.WebIngestion import WebIngestor
+from benchmarks.corpus import FILLER, TOPICS, HashedEmbeddingFunction
+
+NAVIGATION = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(12))
+
+
+class SimulatedWeb(httpx.AsyncBaseTransport):
+    """Serves generated pages after a fixed latency, tracking concurrent requests per host."""
+
+    def __init__(self, pages: Dict[str, str], latency: float):
+        self.pages = pages
+        self.latency = latency
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.max_in_flight: Dict[str, int] = defaultdict(int)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.in_flight[host] += 1
+        self.max_in_flight[host] = max(self.max_in_flight[host], self.in_flight[host])
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight[host] -= 1
+        body = self.pages.get(str(request.url))
+        if body is None:
+            return httpx.Response(404)
+        return httpx.Response(200, headers={"content-type": "text/html; charset=utf-8"}, text=body)
+
+
+def article(rng: random.Random, words: int = 400) -> str:
+    topic = rng.choice(sorted(TOPICS))
+    paragraphs = []
+    for _ in range(words // 80):
+        sentence = [rng.choice(TOPICS[topic] + FILLER) for _ in range(80)]
+        paragraphs.append(" ".join(sentence).capitalize() + ".")
+    return topic, paragraphs
+
+
+def build_web(hosts: int, pages: int, duplicate_share: float, seed: int = 0) -> Dict[str, str]:
+    rng = random.Random(seed)
+    web = {}
+    articles: List = []
+    for host in range(hosts):
+        for page in range(pages):
+            roll = rng.random()
+            if articles and roll < duplicate_share / 2:
+                topic, paragraphs = rng.choice(articles)  # Same article, syndicated
+            elif articles and roll < duplicate_share:
+                topic, paragraphs = rng.choice(articles)  # Same article, one word edited
+                paragraphs = [paragraphs[0].replace(" ", " edited ", 1)] + paragraphs[1:]
+            else:
+                topic, paragraphs = article(rng)
+                articles.append((topic, paragraphs))
+            body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+            web[f"http://site{host}.example/{topic}/{page}"] = (
+                f"<html><head><title>{topic} {page}</title><style>p {{}}</style></head><body>"
+                f"<header><nav><ul>{NAVIGATION}</ul></nav></header>"
+                f"<main><article><h1>{topic.title()} report {page}</h1>{body}</article></main>"
+                f"<aside>Related: <a href='/x'>more</a></aside><footer>© site{host}</footer></body></html>"
+            )
+    return web
+
+
+def run(web: Dict[str, str], latency: float, max_concurrency: int, per_host: int) -> Dict:
+    transport = SimulatedWeb(web, latency)
+    with tempfile.TemporaryDirectory() as workdir:
+        kb = KnowledgeBase(
+            path=f"{workdir}/chroma_db", collection_name="benchmark", embedding_function=HashedEmbeddingFunction()
+        )
+        kb.web = WebIngestor(
+            kb, index=kb.web.index, max_concurrency=max_concurrency, per_host=per_host, transport=transport
+        )
+        start = time.perf_counter()
+        report = kb.add_urls(list(web))
+        elapsed = time.perf_counter() - start
+        chunks = kb.collection.count()
+        again = kb.add_urls(list(web))
+        kb.close()
+    return {
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(len(web) / elapsed, 1),
+        "ingested": report.ingested,
+        "duplicates": report.duplicates,
+        "near_duplicates": report.near_duplicates,
+        "errors": len(report.errors),
+        "chunks": chunks,
+        "max_per_host": max(transport.max_in_flight.values()),
+        "repeat_unchanged": again.unchanged,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20, help="Pages per host")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--duplicate-share", type=float, default=0.2)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=2)
+    args = parser.parse_args()
+
+    web = build_web(args.hosts, args.pages, args.duplicate_share)
+    report = {
+        "config": vars(args),
+        "sequential": run(web, args.latency, max_concurrency=1, per_host=1),
+        "pooled": run(web, args.latency, max_concurrency=args.max_concurrency, per_host=args.per_host),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Benchmark of the KnowledgeBase vector stores: Chroma against the memory-mapped store.
+
+Usage:
+    python -m benchmarks.bench_vectorstore --chunks 1000000 --dim 384 --readers 4
+
+Writes `--chunks` synthetic chunks (clustered unit embeddings of `--dim` dimensions with
+`source`, `extension` and `modified` metadata) into a Chroma collection and into float16
+and int8 MmapVectorStores, each from a separate process. Every store is then opened by
+`--readers` fresh processes at once (read-only for the mmap stores), which report the time
+to open it and answer a first query, query latency without and with a filter on
+`extension` and `modified` (one reader at a time), and their memory once all of them are
+loaded: RSS, PSS (which splits pages shared by several processes between them) and
+anonymous memory. Recall@10 is measured against exact search. `--skip-chroma` leaves out Chroma, whose build takes a
+long time at a million chunks.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from backend.Agents.MmapStore import MmapVectorStore, normalise
+from backend.Agents.VectorStore import chroma_client
+from benchmarks.run import latency_stats
+
+EXTENSIONS = [".py", ".md", ".ts", ".rst", ".txt"]
+CHUNKS_PER_FILE = 8
+YEAR = 365 * 24 * 3600
+EPOCH = 1.7e9
+BLOCK = 20000
+K = 10
+
+
+def embeddings(start: int, stop: int, dim: int, topics: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors of chunks [start, stop): a topic centre plus noise, the same on every call."""
+    centres = np.random.default_rng(seed).normal(size=(topics, dim)).astype(np.float32)
+    blocks = []
+    for block_start in range(start - start % BLOCK, stop, BLOCK):
+        rng = np.random.default_rng((seed, block_start))
+        block = centres[rng.integers(0, topics, BLOCK)] + rng.normal(scale=0.8, size=(BLOCK, dim)).astype(np.float32)
+        blocks.append(block[max(start - block_start, 0) : stop - block_start])
+    return normalise(np.concatenate(blocks)).astype(np.float32)
+
+
+def metadata(start: int, stop: int) -> Tuple[List[str], List[str], List[Dict]]:
+    ids, documents, metadatas = [], [], []
+    for i in range(start, stop):
+        file = i // CHUNKS_PER_FILE
+        extension = EXTENSIONS[file % len(EXTENSIONS)]
+        source = f"/corpus/dir{file % 97}/file{file}{extension}"
+        ids.append(f"{source}::{i % CHUNKS_PER_FILE}")
+        documents.append(f"Chunk {i % CHUNKS_PER_FILE} of file {file}")
+        metadatas.append(
+            {"source": source, "extension": extension, "modified": EPOCH + (file * 7919) % YEAR, "chunk": i % CHUNKS_PER_FILE}
+        )
+    return ids, documents, metadatas
+
+
+def filter_mask(start: int, stop: int, cutoff: float) -> np.ndarray:
+    files = np.arange(start, stop) // CHUNKS_PER_FILE
+    return (files % len(EXTENSIONS) == 0) & (EPOCH + (files * 7919) % YEAR >= cutoff)
+
+
+def batches(chunks: int, size: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, chunks, size):
+        yield start, min(start + size, chunks)
+
+
+def open_store(kind: str, workdir: str, writable: bool = False):
+    if kind == "chroma":
+        client = chroma_client(os.path.join(workdir, "chroma"))
+        if writable:
+            return client.get_or_create_collection("benchmark", metadata={"hnsw:space": "cosine"})
+        return client.get_collection("benchmark")
+    return MmapVectorStore(
+        os.path.join(workdir, kind), name="benchmark", dtype=kind, readonly=not writable, auto_index=False
+    )
+
+
+def build(kind: str, workdir: str, args, results) -> None:
+    """Write every chunk into one store. Runs in its own process."""
+    store = open_store(kind, workdir, writable=True)
+    start = time.perf_counter()
+    for batch_start, batch_stop in batches(args.chunks, 5000):  # Under Chroma's maximum batch size
+        ids, documents, metadatas = metadata(batch_start, batch_stop)
+        vectors = embeddings(batch_start, batch_stop, args.dim, args.topics)
+        store.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=vectors)
+    if kind != "chroma":
+        store.rebuild_index()
+    results.put((kind, time.perf_counter() - start))
+
+
+def memory() -> Dict[str, float]:
+    """RSS, PSS and anonymous memory of this process in MB (PSS and anonymous need Linux)."""
+    report = {"rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return report
+    for field, name in (("Rss", "rss_mb"), ("Pss", "pss_mb"), ("Anonymous", "anon_mb")):
+        report[name] = round(int(fields[field].split()[0]) / 1024, 1)
+    return report
+
+
+def read(kind: str, workdir: str, queries: np.ndarray, where: Dict, turn, loaded, go, results) -> None:
+    """Open a store, query it and report memory once every reader is loaded. Runs in its own process."""
+    start = time.perf_counter()
+    store = open_store(kind, workdir)
+    store.query(query_embeddings=queries[:1], n_results=K)
+    load_seconds = time.perf_counter() - start
+    report = {"load_s": round(load_seconds, 3)}
+    turn.acquire()  # Readers query one after the other, so latencies are not shared CPU time
+    for name, condition in (("query", None), ("filtered_query", where)):
+        latencies, hits = [], []
+        for query in queries:
+            query_start = time.perf_counter()
+            result = store.query(query_embeddings=query[None, :], n_results=K, where=condition)
+            latencies.append(time.perf_counter() - query_start)
+            hits.append(result["ids"][0])
+        report[name] = latency_stats(latencies)
+        report[f"{name}_ids"] = hits
+    turn.release()
+    loaded.release()
+    go.wait()
+    report.update(memory())
+    results.put(report)
+
+
+def ground_truth(args, queries: np.ndarray, cutoff: float) -> Tuple[List[set], List[set]]:
+    """Exact top K ids of each query, without and with the filter."""
+    best: List[List[Tuple[float, int]]] = [[] for _ in queries]
+    best_filtered: List[List[Tuple[float, int]]] = [[] for _ in queries]
+    for start, stop in batches(args.chunks, 100000):
+        scores = embeddings(start, stop, args.dim, args.topics) @ queries.T
+        mask = filter_mask(start, stop, cutoff)
+        for q in range(len(queries)):
+            for target, column in ((best, scores[:, q]), (best_filtered, np.where(mask, scores[:, q], -np.inf))):
+                top = np.argpartition(-column, K)[:K]
+                target[q] = sorted(target[q] + [(column[i], start + i) for i in top if column[i] > -np.inf], reverse=True)[:K]
+    to_ids = lambda rows: {metadata(row, row + 1)[0][0] for _, row in rows}
+    return [to_ids(rows) for rows in best], [to_ids(rows) for rows in best_filtered]
+
+
+def recall(hits: List[List[str]], truth: List[set]) -> float:
+    return round(float(np.mean([len(set(ids) & exact) / max(len(exact), 1) for ids, exact in zip(hits, truth)])), 3)
+
+
+def disk_mb(path: str) -> float:
+    return round(sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 2**20, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=1000000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=1000, help="Clusters in the synthetic embeddings")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--readers", type=int, default=4, help="Processes opening each store at once")
+    parser.add_argument("--skip-chroma", action="store_true")
+    parser.add_argument("--workdir", default=None, help="Keep the stores here instead of a temporary directory")
+    args = parser.parse_args()
+
+    kinds = ["float16", "int8"] if args.skip_chroma else ["chroma", "float16", "int8"]
+    rng = np.random.default_rng(1)
+    queries = normalise(
+        embeddings(0, args.queries, args.dim, args.topics, seed=0) + rng.normal(scale=0.02, size=(args.queries, args.dim))
+    ).astype(np.float32)
+    queries = normalise(queries + rng.normal(scale=0.05, size=queries.shape)).astype(np.float32)
+    cutoff = EPOCH + YEAR / 2
+    where = {"$and": [{"extension": {"$in": [".py"]}}, {"modified": {"$gte": cutoff}}]}
+    truth, truth_filtered = ground_truth(args, queries, cutoff)
+
+    context = multiprocessing.get_context("spawn")
+    report: Dict[str, Dict] = {"config": vars(args)}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        for kind in kinds:
+            results = context.Queue()
+            process = context.Process(target=build, args=(kind, workdir, args, results))
+            process.start()
+            _, build_seconds = results.get()
+            process.join()
+
+            turn, loaded, go = context.Lock(), context.Semaphore(0), context.Event()
+            readers = [
+                context.Process(target=read, args=(kind, workdir, queries, where, turn, loaded, go, results))
+                for _ in range(args.readers)
+            ]
+            for reader in readers:
+                reader.start()
+            for _ in readers:
+                loaded.acquire()
+            go.set()
+            reports = [results.get() for _ in readers]
+            for reader in readers:
+                reader.join()
+            first = reports[0]
+            report[kind] = {
+                "build_s": round(build_seconds, 1),
+                "disk_mb": disk_mb(os.path.join(workdir, kind)),
+                "load_s": max(r["load_s"] for r in reports),
+                "query": first["query"],
+                "filtered_query": first["filtered_query"],
+                "recall_at_10": recall(first["query_ids"], truth),
+                "filtered_recall_at_10": recall(first["filtered_query_ids"], truth_filtered),
+                "rss_mb_per_reader": max(r.get("rss_mb", 0) for r in reports),
+                "pss_mb_total": round(sum(r.get("pss_mb", 0) for r in reports), 1),
+                "anon_mb_total": round(sum(r.get("anon_mb", 0) for r in reports), 1),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare one-shot `requests.post` calls against the pooled Perplexica clients.
+
+Usage:
+    python -m benchmarks.bench_websearch --requests 500 --concurrency 8 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import requests
+
+from backend.Agents.PerplexicaClient import (
+    close_async_clients,
+    get_async_client,
+    get_session,
+    post_json_async,
+)
+from benchmarks.stubs import StubServer
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarise(name: str, latencies: List[float], elapsed: float) -> Dict:
+    return {
+        "client": name,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+    }
+
+
+def bench_sync(name: str, post: Callable, n: int, concurrency: int) -> Dict:
+    def timed(i):
+        start = time.perf_counter()
+        post({"query": f"q{i}"}).raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, range(n)))
+    return summarise(name, latencies, time.perf_counter() - start)
+
+
+async def bench_async(url: str, n: int, concurrency: int) -> Dict:
+    client = get_async_client(pool_size=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await post_json_async(client, url, {"query": f"q{i}"})
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(i) for i in range(n)))
+    elapsed = time.perf_counter() - start
+    await close_async_clients()
+    return summarise("pooled httpx.AsyncClient", list(latencies), elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub latency in seconds")
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as stub:
+        url = f"{stub.url}/api/search"
+        session = get_session(pool_size=args.concurrency)
+        results = [
+            bench_sync(
+                "requests.post (no session)",
+                lambda payload: requests.post(url, json=payload, timeout=10),
+                args.requests,
+                args.concurrency,
+            ),
+            bench_sync(
+                "pooled requests.Session",
+                lambda payload: session.post(url, json=payload, timeout=10),
+                args.requests,
+                args.concurrency,
+            ),
+            asyncio.run(bench_async(url, args.requests, args.concurrency)),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
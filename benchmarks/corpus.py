@@ -0,0 +1,80 @@
+import os
+import random
+from typing import List
+
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from benchmarks.stubs import hashed_embedding
+
+
+## Seeded synthetic corpus for KnowledgeBase benchmarks
+
+TOPICS = {
+    "housing": ["rent", "zoning", "tenants", "mortgage", "affordability", "density", "landlord"],
+    "transport": ["bus", "cycling", "congestion", "rail", "parking", "commute", "tram"],
+    "energy": ["solar", "grid", "heat", "pump", "subsidy", "emissions", "insulation"],
+    "health": ["clinic", "waiting", "nurses", "prevention", "hospital", "vaccination", "care"],
+    "education": ["school", "teachers", "curriculum", "funding", "attendance", "university", "skills"],
+}
+FILLER = ["the", "council", "policy", "report", "city", "budget", "plan", "review", "local", "data"]
+
+
+def write_corpus(folder: str, documents: int = 500, words: int = 400, seed: int = 0) -> List[str]:
+    """
+    Write a deterministic corpus of topical markdown documents.
+
+    Returns:
+        List[str]: Paths of the written files
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    topics = sorted(TOPICS)
+    for i in range(documents):
+        topic = topics[i % len(topics)]
+        vocabulary = TOPICS[topic] * 3 + FILLER
+        body = " ".join(rng.choice(vocabulary) for _ in range(words))
+        path = os.path.join(folder, topic, f"doc_{i:05d}.md")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(f"# {topic.title()} report {i}\n\n{body}\n")
+        paths.append(path)
+    return paths
+
+
+def queries(count: int = 50, seed: int = 1) -> List[dict]:
+    """Deterministic KnowledgeBase queries, as keyword/question inputs."""
+    rng = random.Random(seed)
+    topics = sorted(TOPICS)
+    result = []
+    for i in range(count):
+        topic = topics[i % len(topics)]
+        terms = rng.sample(TOPICS[topic], 2)
+        result.append(
+            {
+                "keywords": [topic] + terms,
+                "questions": [f"What does the {topic} policy say about {terms[0]}?"],
+            }
+        )
+    return result
+
+
+class HashedEmbeddingFunction(EmbeddingFunction):
+    """Deterministic local embeddings, so benchmarks don't depend on a downloaded model."""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return [hashed_embedding(text) for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "hashed-bag-of-words"
+
+    def get_config(self) -> dict:
+        return {}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "HashedEmbeddingFunction":
+        return HashedEmbeddingFunction()
@@ -0,0 +1,269 @@
+"""
+End-to-end benchmark of the Orchestrator, KnowledgeBase ingestion and queries, against local stand-ins.
+
+Usage:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare bench.json   # flag regressions against a previous run
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from backend.Agents.KnowledgeBase import (
+    KnowledgeBase,
+    KnowledgeBaseInputSchema,
+    KnowledgeBaseOutputSchema,
+)
+from backend.Agents.PerplexicaClient import close_async_clients
+from backend.Agents.PerplexityLocal import (
+    WebSearchConfig,
+    WebSearchInputSchema,
+    WebSearchOutputSchema,
+    WebSearchTool,
+)
+from backend.setup.Orchestrator import Orchestrator
+from backend.setup.ToolRegistry import ToolRegistry, ToolSpec
+from benchmarks.bench_websearch import percentile
+from benchmarks.corpus import HashedEmbeddingFunction, queries, write_corpus
+from benchmarks.stubs import OllamaStubHandler, StubServer
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    if not samples:
+        return {}
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+    }
+
+
+def stub_registry(search_url: str, kb: KnowledgeBase) -> ToolRegistry:
+    """A tool registry with WebSearch pointed at the Perplexica stub and the given KnowledgeBase."""
+    tools = ToolRegistry()
+    tools.register(
+        ToolSpec(
+            name="WebSearch",
+            factory=lambda: WebSearchTool(config=WebSearchConfig(host=f"{search_url}/api/search")),
+            input_schema=WebSearchInputSchema,
+            output_schema=WebSearchOutputSchema,
+            uses_history=True,
+        )
+    )
+    tools.register(
+        ToolSpec(
+            name="KnowledgeBase",
+            factory=lambda: kb,
+            input_schema=KnowledgeBaseInputSchema,
+            output_schema=KnowledgeBaseOutputSchema,
+        )
+    )
+    return tools
+
+
+def bench_ingestion(kb: KnowledgeBase, folder: str, documents: int) -> Dict:
+    write_corpus(folder, documents=documents)
+    start = time.perf_counter()
+    report = kb.sync_folder(folder)
+    elapsed = time.perf_counter() - start
+    chunks = kb.collection.count()
+    start = time.perf_counter()
+    kb.sync_folder(folder)
+    resync = time.perf_counter() - start
+    return {
+        "documents": documents,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "documents_per_s": round(documents / elapsed, 1),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "unchanged_resync_s": round(resync, 4),
+        "errors": len(report.errors),
+    }
+
+
+def bench_queries(kb: KnowledgeBase, count: int) -> Dict:
+    samples = []
+    for query in queries(count):
+        start = time.perf_counter()
+        kb.run(KnowledgeBaseInputSchema(**query))
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+
+async def _timed_run(orchestrator: Orchestrator, query: str, plan: bool = False) -> Dict:
+    """Run one query, turning the event stream into LLM-turn and tool-step durations."""
+    start = time.perf_counter()
+    first_token = None
+    marks = []  # (time, kind) where kind is "step_start" or "step_end"
+    open_calls = set()
+    reasoned = True  # whether the LLM produced output since the last step ended
+    events = orchestrator.astream_plan(query) if plan else orchestrator.astream(query)
+    async for event in events:
+        now = time.perf_counter() - start
+        if event.type == "reasoning":
+            first_token = now if first_token is None else first_token
+            reasoned = True
+        elif event.type == "tool_started":
+            if not open_calls:
+                if reasoned:
+                    marks.append((now, "step_start"))
+                else:
+                    marks.pop()  # A plan's dependent call, still the same tool step
+            open_calls.add(event.call_id)
+        elif event.type == "tool_finished" and event.call_id in open_calls:
+            open_calls.discard(event.call_id)
+            if not open_calls:
+                marks.append((now, "step_end"))
+                reasoned = False
+    total = time.perf_counter() - start
+
+    llm_turns, tool_steps = [], []
+    previous = 0.0
+    for at, kind in marks:
+        (llm_turns if kind == "step_start" else tool_steps).append(at - previous)
+        previous = at
+    llm_turns.append(total - previous)
+    return {"total": total, "first_token": first_token, "llm": llm_turns, "tools": tool_steps}
+
+
+async def _timed_runs(tools: ToolRegistry, llm_url: str, runs: int, mode: str) -> List[Dict]:
+    results = []
+    for i in range(runs):
+        orchestrator = Orchestrator(
+            parallel=mode in ("parallel", "speculative"),
+            speculative=mode == "speculative",
+            cache=False,
+            tools=tools,
+            base_url=f"{llm_url}/v1",
+        )
+        results.append(
+            await _timed_run(orchestrator, f"Benchmark question {i}", plan=mode == "plan")
+        )
+    await close_async_clients()
+    return results
+
+
+def bench_orchestrator(tools: ToolRegistry, llm_url: str, runs: int, mode: str) -> Dict:
+    """Benchmark one Orchestrator mode: "sequential", "parallel", "speculative" (parallel, tools started while streaming) or "plan" (plan-then-execute)."""
+    results = asyncio.run(_timed_runs(tools, llm_url, runs, mode))
+
+    iterations = []
+    for index in range(max(len(result["llm"]) for result in results)):
+        llm = [result["llm"][index] for result in results if index < len(result["llm"])]
+        step = [result["tools"][index] for result in results if index < len(result["tools"])]
+        iterations.append(
+            {
+                "iteration": index,
+                "llm_p50_ms": round(percentile(llm, 0.5) * 1000, 2),
+                "tools_p50_ms": round(percentile(step, 0.5) * 1000, 2) if step else 0.0,
+            }
+        )
+    return {
+        "end_to_end": latency_stats([result["total"] for result in results]),
+        "time_to_first_token": latency_stats(
+            [result["first_token"] for result in results if result["first_token"] is not None]
+        ),
+        "iterations": iterations,
+    }
+
+
+def flatten(report: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "iteration" in item:
+                    flat.update(flatten(item, f"{name}[{item['iteration']}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(report: Dict, baseline: Dict, threshold: float = 0.10) -> List[str]:
+    """List latency metrics (``*_ms``, ``*_s``, seconds) that got slower than the baseline by more than `threshold`."""
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    for name, value in current.items():
+        old = previous.get(name)
+        slower_is_worse = name.endswith(("_ms", "_s", "seconds"))
+        if old and slower_is_worse and value > old * (1 + threshold):
+            regressions.append(f"{name}: {old} -> {value} (+{(value / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=10, help="Orchestrator queries per mode")
+    parser.add_argument("--steps", type=int, default=2, help="Tool steps the fake LLM takes per query")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.001)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, StubServer(
+        latency=args.search_latency
+    ) as search, StubServer(
+        handler=OllamaStubHandler,
+        latency=args.llm_latency,
+        steps=args.steps,
+        token_latency=args.token_latency,
+    ) as llm:
+        kb = KnowledgeBase(
+            path=f"{workdir}/chroma_db",
+            collection_name="benchmark",
+            embedding_function=HashedEmbeddingFunction(),
+        )
+        tools = stub_registry(search.url, kb)
+
+        report = {
+            "revision": git_revision(),
+            "config": vars(args),
+            "ingestion": bench_ingestion(kb, f"{workdir}/corpus", args.documents),
+            "knowledge_base_query": bench_queries(kb, args.queries),
+            "orchestrator": {
+                mode: bench_orchestrator(tools, llm.url, args.runs, mode)
+                for mode in ("sequential", "parallel", "speculative", "plan")
+            },
+        }
+        tools.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+import contextlib
+import json
+import re
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+## Local stand-ins for the Perplexica /api/search and Ollama /v1 endpoints
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients can reuse connections
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, avoid Nagle stalls on kept-alive sockets
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PerplexicaStubHandler(_KeepAliveHandler):
+    """Answers Perplexica searches after a fixed latency, in one piece or streamed."""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.latency)
+
+        query = payload.get("query", "")
+        answer = f"Stub answer to: {query}"
+        sources = [
+            {
+                "pageContent": f"Stub page {i} about {query}",
+                "metadata": {"title": f"Source {i}", "url": f"http://stub.local/{i}"},
+            }
+            for i in range(3)
+        ]
+
+        if payload.get("stream"):
+            events = [{"type": "init", "data": "Stream connected"}]
+            events.append({"type": "sources", "data": sources})
+            events.extend({"type": "response", "data": word + " "} for word in answer.split())
+            events.append({"type": "done"})
+            body = "".join(json.dumps(event) + "\n" for event in events).encode()
+        else:
+            body = json.dumps({"message": answer, "sources": sources}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _is_tool_result(message: str) -> bool:
+    return "Tool " in message or "Error executing tool" in message
+
+
+def _is_reask(message: str) -> bool:
+    return "does not follow the JSON schema" in message
+
+
+def _drop_last_field(content: str) -> str:
+    output = json.loads(content)
+    output.pop(list(output)[-1])
+    return json.dumps(output)
+
+
+# The ways a model breaks its JSON: the first three can be repaired locally, the last can't
+MALFORMATIONS = (
+    lambda content: f"```json\n{content}\n```",
+    lambda content: content[:-1],
+    lambda content: content.replace('"WebSearch"', '"web_search"').replace('"KnowledgeBase"', '"knowledge_base"'),
+    _drop_last_field,
+)
+
+
+class OllamaStubHandler(_KeepAliveHandler):
+    """
+    Deterministic OpenAI-compatible stand-in for Ollama's /v1 API.
+
+    Chat completions follow a fixed script: the agent requests a WebSearch and a
+    KnowledgeBase lookup until `server.steps` tool results are in the conversation,
+    then answers (`[steps=N]` in the query overrides it). Both step output schemas of the Orchestrator are supported, as
+    well as streaming, with the fields in the order of the requested schema. Planning requests get a plan with `server.steps` searches
+    chained by dependencies next to one KnowledgeBase lookup, and answer requests a
+    fixed answer. Embeddings are hashed bag-of-words vectors. With a `capacity`,
+    requests beyond it queue like they do in Ollama (OLLAMA_NUM_PARALLEL). With a
+    `residency`, models are loaded and evicted like Ollama does, and the native
+    /api/generate, /api/embed and /api/ps endpoints load, unload and list them.
+    A `malformed` share of the replies breaks the JSON, unless the request constrains
+    decoding with a json_schema response_format or asks to correct an earlier reply.
+    """
+
+    STEPS = re.compile(r"\[steps=(\d+)\]")
+
+    def do_GET(self):
+        residency = self.server.residency
+        if self.path == "/api/ps" and residency is not None:
+            self._json({"models": [{"name": model, "model": model} for model in residency.models()]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        residency = self.server.residency
+        if self.path.startswith("/api/"):
+            if residency is None:
+                self.send_error(404)
+            elif payload.get("keep_alive") == 0:
+                residency.unload(payload["model"])
+                self._json({"model": payload["model"], "done": True})
+            else:
+                with residency.use(payload["model"]):
+                    pass
+                self._json({"model": payload["model"], "done": True})
+            return
+        model_in_use = residency.use(payload.get("model", "")) if residency else contextlib.nullcontext()
+        with model_in_use, self.server.capacity or contextlib.nullcontext():
+            time.sleep(self.server.latency)
+            if self.path.endswith("/embeddings"):
+                self._json(self._embeddings(payload))
+            elif payload.get("stream"):
+                self._stream(payload)
+            else:
+                self._json(self._completion(payload))
+
+    def _content(self, payload) -> str:
+        messages = payload.get("messages", [])
+        system = json.dumps(messages[0]) if messages else ""
+        # Tool results since the latest query, which may follow earlier queries of the session
+        user_messages = [
+            json.dumps(message) for message in messages if message["role"] == "user" and not _is_reask(message["content"])
+        ]
+        query_index = max(
+            (i for i, text in enumerate(user_messages) if not _is_tool_result(text)), default=0
+        )
+        tool_results = len(user_messages) - query_index - 1
+        match = self.STEPS.search(user_messages[query_index]) if user_messages else None
+        steps = int(match.group(1)) if match else self.server.steps
+        done = tool_results >= steps
+        reasoning = (
+            "Based on the tool results, here is the final answer."
+            if done
+            else f"Step {tool_results + 1}: I will search the web and the local knowledge base."
+        )
+        calls = [
+            {"tool": "WebSearch", "tool_parameters": {"prompt": f"step {tool_results} query"}},
+            {
+                "tool": "KnowledgeBase",
+                "tool_parameters": {"keywords": ["housing", "policy"], "questions": ["What is the housing policy?"]},
+            },
+        ]
+        if "depends_on" in system:
+            nodes = [
+                {
+                    "id": f"search_{i}",
+                    "tool": "WebSearch",
+                    "tool_parameters": {"prompt": f"step {i} query" + (f" after {{{{search_{i - 1}}}}}" if i else "")},
+                    "depends_on": [f"search_{i - 1}"] if i else [],
+                }
+                for i in range(max(1, steps))
+            ]
+            nodes.append({"id": "kb", **calls[1], "depends_on": []})
+            return json.dumps({"reasoning": "I will search the web and the local knowledge base.", "nodes": nodes})
+        if "PlanAnswerSchema" in system:
+            return json.dumps({"answer": "Based on the tool results, here is the final answer."})
+        if "tool_calls" in system:
+            output = {"reasoning": reasoning, "tool_calls": [] if done else calls, "done": done}
+        else:
+            output = {"reasoning": reasoning, **calls[0], "done": done}
+        # Generate the fields in the order of the requested schema, like a model does
+        output = dict(sorted(output.items(), key=lambda item: system.find(f'\\"{item[0]}\\"')))
+        return json.dumps(output)
+
+    def _reply(self, payload) -> str:
+        content = self._content(payload)
+        messages = payload.get("messages", [])
+        constrained = (payload.get("response_format") or {}).get("type") == "json_schema"
+        if constrained or (messages and _is_reask(messages[-1]["content"])):
+            return content
+        digest = zlib.crc32(json.dumps(messages).encode())
+        if digest % 1000 >= self.server.malformed * 1000:
+            return content
+        return MALFORMATIONS[digest // 1000 % len(MALFORMATIONS)](content)
+
+    def _completion(self, payload):
+        content = self._reply(payload)
+        return {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": payload.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(json.dumps(payload)) // 4, "completion_tokens": len(content) // 4, "total_tokens": 0},
+        }
+
+    def _embeddings(self, payload):
+        texts = payload.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        return {
+            "object": "list",
+            "model": payload.get("model", ""),
+            "data": [{"object": "embedding", "index": i, "embedding": hashed_embedding(text)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def _stream(self, payload):
+        content = self._reply(payload)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        for start in range(0, len(content), 8):
+            chunk = {
+                "id": "stub",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": payload.get("model", ""),
+                "choices": [{"index": 0, "delta": {"content": content[start : start + 8]}, "finish_reason": None}],
+            }
+            write(f"data: {json.dumps(chunk)}\n\n".encode())
+            time.sleep(self.server.token_latency)
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": "stub",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": payload.get("model", ""),
+                "choices": [],
+                "usage": {"prompt_tokens": len(json.dumps(payload)) // 4, "completion_tokens": len(content) // 4, "total_tokens": 0},
+            }
+            write(f"data: {json.dumps(chunk)}\n\n".encode())
+        write(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _json(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubResidency:
+    """
+    Models loaded in a stub Ollama, at most `max_loaded` at once.
+
+    Like Ollama's scheduler, requests are taken in arrival order: a request whose model
+    isn't loaded waits until a loaded model has nothing in flight, evicts it and spends
+    `load_latency` seconds loading, and every request behind it waits too.
+    """
+
+    def __init__(self, max_loaded: int = 1, load_latency: float = 0.5, loaded=()):
+        self.max_loaded = max_loaded
+        self.load_latency = load_latency
+        # model -> requests in flight, least recently used first
+        self.loaded: "OrderedDict[str, int]" = OrderedDict((model, 0) for model in loaded)
+        self.pending: deque = deque()
+        self.condition = threading.Condition()
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def models(self):
+        with self.condition:
+            return list(self.loaded)
+
+    @contextlib.contextmanager
+    def use(self, model: str):
+        with self.condition:
+            ticket = object()
+            self.pending.append(ticket)
+            while self.pending[0] is not ticket:
+                self.condition.wait()
+            while model not in self.loaded:
+                idle = [name for name, in_flight in self.loaded.items() if in_flight == 0]
+                if len(self.loaded) >= self.max_loaded and not idle:
+                    self.condition.wait()
+                    continue
+                if len(self.loaded) >= self.max_loaded:
+                    del self.loaded[idle[0]]
+                    self.evictions += 1
+                self.condition.release()
+                try:
+                    time.sleep(self.load_latency)
+                finally:
+                    self.condition.acquire()
+                self.loaded[model] = 0
+                self.loads += 1
+                self.load_seconds += self.load_latency
+            self.loaded[model] += 1
+            self.loaded.move_to_end(model)
+            self.pending.popleft()
+            self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.loaded[model] -= 1
+                self.condition.notify_all()
+
+    def unload(self, model: str) -> None:
+        with self.condition:
+            if self.loaded.get(model) == 0:
+                del self.loaded[model]
+                self.condition.notify_all()
+
+    def stats(self):
+        return {"loads": self.loads, "evictions": self.evictions, "load_seconds": round(self.load_seconds, 3)}
+
+
+def hashed_embedding(text: str, dimensions: int = 64) -> list:
+    """Deterministic bag-of-words embedding: each lowercase word hashes to one dimension."""
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        vector[zlib.crc32(word.encode()) % dimensions] += 1.0
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+class StubServer:
+    """Runs a stub HTTP handler on a background thread, usable as a context manager."""
+
+    def __init__(
+        self,
+        handler=PerplexicaStubHandler,
+        latency: float = 0.0,
+        port: int = 0,
+        steps: int = 2,
+        token_latency: float = 0.0,
+        capacity: Optional[int] = None,
+        residency: Optional[StubResidency] = None,
+        malformed: float = 0.0,
+    ):
+        """
+        Args:
+            handler: PerplexicaStubHandler or OllamaStubHandler
+            latency (float): Seconds before each response starts
+            port (int): Port to bind on 127.0.0.1, 0 for any free port
+            steps (int): Tool steps the Ollama stub takes before answering
+            token_latency (float): Seconds between streamed chunks of the Ollama stub
+            capacity (Optional[int]): Requests the Ollama stub serves at once, unbounded if None
+            residency (Optional[StubResidency]): Models the Ollama stub keeps loaded, any number at no cost if None
+            malformed (float): Share of the Ollama stub's unconstrained replies with broken JSON
+        """
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.steps = steps
+        self.server.token_latency = token_latency
+        self.server.capacity = threading.BoundedSemaphore(capacity) if capacity else None
+        self.server.residency = residency
+        self.server.malformed = malformed
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StubServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
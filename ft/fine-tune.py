@@ -1,65 +1,320 @@
-## open halucinations folder 
+## open halucinations folder
+# Nightly repair job: regenerate the answers of stored hallucination cases, re-score
+# them with deepeval and keep the repaired ones as a sharded JSONL training set.
+#
+#   python ft/fine-tune.py --concurrency 8 --output ft/dataset
+#
+# Rerunning the job resumes: cases already in the dataset (or already rejected) are skipped.
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
 import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # run as a script from anywhere
+from backend.setup.Gateway import DEFAULT_BASE_URL, LLMGateway, get_gateway
+
+logger = logging.getLogger("fine-tune")
+
+
+def case_key(query: str, answer: str, context: List[str]) -> str:
+  """Identifies a case across the store, legacy folders and reruns (whitespace and case insensitive)."""
+  normalised = "\x1f".join(" ".join(text.split()).lower() for text in [query, answer, *context])
+  return hashlib.sha256(normalised.encode()).hexdigest()[:20]
+
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+  """Records of a JSONL file, skipping a last line cut short by a crash."""
+  if not os.path.exists(path):
+    return
+  with open(path, encoding="utf-8") as f:
+    for line in f:
+      try:
+        yield json.loads(line)
+      except json.JSONDecodeError:
+        continue
+
+
+def discover_cases(store_path: str, legacy_dir: str) -> Iterator[Dict]:
+  """
+  Every stored hallucination case, deduplicated.
+
+  Reads the append-only store written by HallucinationDetection and the older
+  per-case folders (query.txt, text.txt, rag.txt) under `legacy_dir`.
+  """
+  seen: Set[str] = set()
+
+  def unique(query: str, answer: str, context: List[str], score=None) -> Optional[Dict]:
+    key = case_key(query, answer, context)
+    if key in seen:
+      return None
+    seen.add(key)
+    return {"key": key, "query": query, "answer": answer, "context": context, "score": score}
+
+  for record in read_jsonl(store_path):
+    case = unique(record["query"], record["answer"], record.get("retrieval_context") or [], record.get("score"))
+    if case:
+      yield case
+
+  if not os.path.isdir(legacy_dir):
+    return
+  folders = [legacy_dir] + [entry.path for entry in os.scandir(legacy_dir) if entry.is_dir()]
+  for folder in folders:
+    try:
+      texts = {}
+      for name in ("query", "text", "rag"):
+        with open(os.path.join(folder, f"{name}.txt"), encoding="utf-8") as f:
+          texts[name] = f.read()
+    except FileNotFoundError:
+      continue
+    case = unique(texts["query"], texts["text"], [texts["rag"]])
+    if case:
+      yield case
+
+
+class ShardedWriter:
+  """
+  Appends records to shard-00000.jsonl, shard-00001.jsonl, ... of at most `shard_size` lines.
+
+  A rerun continues the last shard. Lines are flushed as they are written, so
+  a crash loses at most the record being written.
+  """
+
+  def __init__(self, folder: str, shard_size: int = 5000):
+    os.makedirs(folder, exist_ok=True)
+    self.folder = folder
+    self.shard_size = shard_size
+    shards = sorted(name for name in os.listdir(folder) if name.startswith("shard-") and name.endswith(".jsonl"))
+    self.index = int(shards[-1][6:11]) if shards else 0
+    self.lines = sum(1 for _ in read_jsonl(self._path())) if shards else 0
+    self._file = open(self._path(), "a", encoding="utf-8", buffering=1)
+
+  def _path(self) -> str:
+    return os.path.join(self.folder, f"shard-{self.index:05d}.jsonl")
+
+  def keys(self) -> Set[str]:
+    """Keys of every record already in the dataset."""
+    return {
+      record["key"]
+      for name in os.listdir(self.folder)
+      if name.startswith("shard-")
+      for record in read_jsonl(os.path.join(self.folder, name))
+    }
+
+  def write(self, record: Dict) -> None:
+    if self.lines >= self.shard_size:
+      self._file.close()
+      self.index += 1
+      self.lines = 0
+      self._file = open(self._path(), "a", encoding="utf-8", buffering=1)
+    self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    self.lines += 1
+
+  def close(self) -> None:
+    self._file.close()
+
+
+def default_metrics(threshold: float) -> List:
+  from deepeval.metrics import AnswerRelevancyMetric, FaithfulnessMetric
 
-import deepeval
-import ollama 
+  return [FaithfulnessMetric(threshold=threshold), AnswerRelevancyMetric(threshold=threshold)]
 
-from deepeval.metrics import (
-    ContextualPrecisionMetric,
-    ContextualRecallMetric,
-    ContextualRelevancyMetric
-)
 
 class FineTuner:
-  def __init__(self):
-    self.llm = ollama.AsyncClient()
-    self.metrics = [ContextualRelevancyMetric(), ContextualRecallMetric(), ContextualPrecisionMetric()]
-    
-  async def process_hallucinations(self, folder_path):
+  """
+  Repairs stored hallucinations concurrently and writes the fixed ones as training data.
+
+  `concurrency` regenerations and `score_concurrency` re-scorings run at once.
+  A case is kept if every metric passes `threshold` on the new answer.
+  """
+
+  def __init__(
+    self,
+    model: str = "llama3.1:8b",
+    concurrency: int = 8,
+    score_concurrency: int = 4,
+    threshold: float = 0.5,
+    output: str = "ft/dataset",
+    shard_size: int = 5000,
+    metrics_factory: Optional[Callable[[float], List]] = None,
+    base_url: str = DEFAULT_BASE_URL,
+    gateway: Optional[LLMGateway] = None,
+    judge_model: Optional[str] = None,
+  ):
+    """
+    Args:
+      model (str): Ollama model that regenerates the answers
+      concurrency (int): Cases repaired at once, the gateway caps the requests that reach Ollama per model
+      score_concurrency (int): Cases being re-scored at once (each metric calls its judge model)
+      threshold (float): Minimum score of every metric for a repaired answer to be kept
+      output (str): Dataset folder, holding the shards and the processed.jsonl resume log
+      shard_size (int): Records per shard
+      metrics_factory (Optional[Callable]): Builds fresh deepeval metrics from the threshold, faithfulness and answer relevancy by default
+      base_url (str): OpenAI-compatible endpoint of the Ollama server
+      gateway (Optional[LLMGateway]): Caps and coalesces the regeneration requests, the process-wide one for base_url by default
+      judge_model (Optional[str]): Ollama model to reserve a background gateway slot of while a case is re-scored, so re-scoring waits for it like the regenerations. It is not passed to the metrics, configure deepeval to judge with the same model
+    """
+    self.gateway = gateway or get_gateway(base_url)
+    # Background requests: with OLLAMA_MAX_LOADED_MODELS set they wait until `model` is
+    # loaded rather than swapping out the models serving users
+    self.llm = self.gateway.async_client(background=True)
+    self.judge_model = judge_model
+    self.model = model
+    self.concurrency = concurrency
+    self.score_limit = asyncio.Semaphore(score_concurrency)
+    self.threshold = threshold
+    self.output = output
+    self.shard_size = shard_size
+    self.metrics_factory = metrics_factory or default_metrics
+    self.stats = {"cases": 0, "skipped": 0, "kept": 0, "rejected": 0, "failed": 0}
+
+  async def repair(self, case: Dict) -> str:
     ## formally this only handles halucinations for the Knowledge Agent, could be expanded to also improve train of thought generation
     # (more efficient thought generation, better inputs more aligned with the user's preferences retrieved from Long-Term Memory)
-    query = open(os.path.join(folder_path, "query.txt")).read()
-    text = open(os.path.join(folder_path, "text.txt")).read()
-    rag = open(os.path.join(folder_path, "rag.txt")).read()
-    
-    
+    rag = "\n\n".join(case["context"])
     system_message = f"""
-    You are a prompt engineer for high end RAG models, your query has been hallucinated. 
-    
-    The user's query was: {query}
-    The model's response was: {text}
+    You are a prompt engineer for high end RAG models, your query has been hallucinated.
+
+    The user's query was: {case["query"]}
+    The model's response was: {case["answer"]}
     The retrieval context was: {rag}
-    
-    Several metrics are also at your disposal: 
-    {self.metrics}
-    
-    You must generate a new response that is more accurate and relevant to the user's query 
+
+    You must generate a new response that is more accurate and relevant to the user's query, using only the retrieval context
     """
-  
+
     ## give it a second try:
-    response = await self.llm.chat(
-    model="llama3.1:8b",
-    messages=[
-      {"role": "system", "content": system_message},
-      {"role": "user", "content": query},
-      {"role": "assistant", "content": text}
-    ]
-  )
-  
-  from deepeval.test_case import LLMTestCase
-  test_case = LLMTestCase(
-    input=query,
-    actual_output=text,
-    expected_output="You can stay up to 60 days after completing your degree.",
-    retrieval_context=[
-        """If you are in the U.S. on an F-1 visa, you are allowed to stay for 60 days after completing
-        your degree, unless you have applied for and been approved to participate in OPT."""
-    ]
-  )
-  n = 0
-  while os.path.exists("hallucinations"):
-    n += 1
-    process_hallucinations(os.path.join("hallucinations", f"hallucinations_{n}"))
+    response = await self.llm.chat.completions.create(
+      model=self.model,
+      messages=[
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": case["query"]},
+      ],
+    )
+    return response.choices[0].message.content
+
+  async def score(self, case: Dict, answer: str) -> Dict[str, float]:
+    """Re-score a repaired answer with every metric, concurrently."""
+    from deepeval.test_case import LLMTestCase
+
+    test_case = LLMTestCase(input=case["query"], actual_output=answer, retrieval_context=case["context"])
+    metrics = self.metrics_factory(self.threshold)  # metrics keep their result on the instance, one set per case
+    judge = self.gateway.ahold(self.judge_model, background=True) if self.judge_model else contextlib.nullcontext()
+    async with self.score_limit, judge:
+      await asyncio.gather(*(metric.a_measure(test_case, _show_indicator=False) for metric in metrics))
+    return {type(metric).__name__: metric.score for metric in metrics}
 
+  async def process(self, case: Dict) -> Dict:
+    """Repair and re-score one case, returning its resume log entry."""
+    answer = await self.repair(case)
+    scores = await self.score(case, answer)
+    kept = all(score is not None and score >= self.threshold for score in scores.values())
+    record = {
+      "key": case["key"],
+      "messages": [
+        {"role": "system", "content": "Answer using only the retrieval context.\n\n" + "\n\n".join(case["context"])},
+        {"role": "user", "content": case["query"]},
+        {"role": "assistant", "content": answer},
+      ],
+      "scores": scores,
+      "original_score": case.get("score"),
+    }
+    return {"key": case["key"], "kept": kept, "scores": scores, "record": record}
+
+  async def run(self, store_path: str = "hallucinations/cases.jsonl", legacy_dir: str = "hallucinations", limit: Optional[int] = None) -> Dict:
+    """
+    Process every case not already handled by a previous run.
+
+    `concurrency` workers pull cases from a bounded queue, so memory stays flat
+    over thousands of cases. Results are written as they complete.
+
+    Returns:
+      Dict: Counts of cases seen, skipped (done before), kept, rejected and failed
+    """
+    writer = ShardedWriter(self.output, self.shard_size)
+    log_path = os.path.join(self.output, "processed.jsonl")
+    done = writer.keys() | {entry["key"] for entry in read_jsonl(log_path)}
+    log = open(log_path, "a", encoding="utf-8", buffering=1)
+    cases: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+    start = time.perf_counter()
+
+    async def worker():
+      while True:
+        case = await cases.get()
+        if case is None:
+          return
+        try:
+          result = await self.process(case)
+        except Exception as e:
+          logger.warning("Case %s failed: %s", case["key"], e)
+          self.stats["failed"] += 1  # not logged, so the next run retries it
+          continue
+        if result["kept"]:
+          writer.write(result["record"])
+          self.stats["kept"] += 1
+        else:
+          self.stats["rejected"] += 1
+        log.write(json.dumps({"key": result["key"], "kept": result["kept"], "scores": result["scores"]}) + "\n")
+        finished = self.stats["kept"] + self.stats["rejected"] + self.stats["failed"]
+        if finished % 100 == 0:
+          logger.info("%d cases processed (%.1f/s)", finished, finished / (time.perf_counter() - start))
+
+    workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+    try:
+      for case in discover_cases(store_path, legacy_dir):
+        if limit is not None and self.stats["cases"] >= limit:
+          break
+        self.stats["cases"] += 1
+        if case["key"] in done:
+          self.stats["skipped"] += 1
+          continue
+        await cases.put(case)
+      for _ in workers:
+        await cases.put(None)
+      await asyncio.gather(*workers)
+    finally:
+      for task in workers:
+        task.cancel()
+      writer.close()
+      log.close()
+    return self.stats
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Repair stored hallucinations into a fine-tuning dataset")
+  parser.add_argument("--store", default="hallucinations/cases.jsonl", help="JSONL written by HallucinationDetection")
+  parser.add_argument("--legacy-dir", default="hallucinations", help="Folder of older query.txt/text.txt/rag.txt cases")
+  parser.add_argument("--output", default="ft/dataset")
+  parser.add_argument("--model", default="llama3.1:8b")
+  parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="OpenAI-compatible endpoint of the Ollama server")
+  parser.add_argument("--concurrency", type=int, default=8)
+  parser.add_argument("--score-concurrency", type=int, default=4)
+  parser.add_argument("--threshold", type=float, default=0.5)
+  parser.add_argument("--judge-model", help="Ollama model deepeval is configured to judge with, re-scoring reserves a background slot of it so it waits until it is loaded")
+  parser.add_argument("--shard-size", type=int, default=5000)
+  parser.add_argument("--limit", type=int, help="Stop after this many cases")
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+  tuner = FineTuner(
+    model=args.model,
+    concurrency=args.concurrency,
+    score_concurrency=args.score_concurrency,
+    threshold=args.threshold,
+    output=args.output,
+    shard_size=args.shard_size,
+    base_url=args.base_url,
+    judge_model=args.judge_model,
+  )
+  stats = asyncio.run(tuner.run(args.store, args.legacy_dir, limit=args.limit))
+  logger.info("Done: %s", stats)
+  logger.info("LLM gateway: %s", tuner.gateway.snapshot())
 
 
+if __name__ == "__main__":
+  main()